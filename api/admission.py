@@ -0,0 +1,222 @@
+import json
+import logging
+import math
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+import azure.functions as func
+
+import diagnostics
+import log_pipeline
+from db import PGPOOL_MAX_SIZE
+
+# Admission control in front of DB-heavy routes, applied after auth:
+#  1) token buckets per (route, user) and per route across all users
+#  2) a cap on requests doing DB work at once in this worker
+# Rejections are 429 + Retry-After straight away, so a client polling in a tight
+# loop can't take the pool connections that booking writes need.
+# All state is per worker process; "global" limits are per worker, not per app.
+
+# Requests doing DB work at once in this worker. Reads may only use part of it so
+# writes always find a free slot (and a pool connection).
+ADMISSION_MAX_IN_FLIGHT = int(os.environ.get("ADMISSION_MAX_IN_FLIGHT", PGPOOL_MAX_SIZE))
+ADMISSION_WRITE_RESERVE = int(os.environ.get("ADMISSION_WRITE_RESERVE", 2))
+# How long a request may wait for an in-flight slot before it is shed
+ADMISSION_QUEUE_SECONDS = float(os.environ.get("ADMISSION_QUEUE_SECONDS", 0.1))
+
+# rate = tokens per second, burst = bucket size. Override any field per route with
+# ADMISSION_LIMITS, e.g. {"availability": {"user_rate": 10, "max_in_flight": 4}}.
+ROUTE_LIMITS = {
+    "availability": {"kind": "read", "user_rate": 5, "user_burst": 20, "global_rate": 200, "global_burst": 400},
+    "bookings.list": {"kind": "read", "user_rate": 2, "user_burst": 10, "global_rate": 100, "global_burst": 200},
+    "mentor.dashboard": {"kind": "read", "user_rate": 2, "user_burst": 10, "global_rate": 100, "global_burst": 200},
+    "bookings.create": {"kind": "write", "user_rate": 1, "user_burst": 5, "global_rate": 100, "global_burst": 200},
+    "bookings.confirm": {"kind": "write", "user_rate": 1, "user_burst": 10, "global_rate": 100, "global_burst": 200},
+    "bookings.cancel": {"kind": "write", "user_rate": 1, "user_burst": 10, "global_rate": 100, "global_burst": 200},
+    # Calendar apps poll every 5-60 minutes; answered from cache almost always
+    "calendar.feed": {"kind": "read", "user_rate": 0.1, "user_burst": 10, "global_rate": 100, "global_burst": 200},
+    # Admin roster imports hold a connection for the whole load: one at a time
+    "roster.import": {"kind": "write", "user_rate": 0.2, "user_burst": 5, "global_rate": 1, "global_burst": 5, "max_in_flight": 1},
+}
+
+try:
+    for _route, _overrides in json.loads(os.environ.get("ADMISSION_LIMITS") or "{}").items():
+        ROUTE_LIMITS.setdefault(_route, {"kind": "read"}).update(_overrides)
+except (ValueError, AttributeError):
+    logging.exception("ADMISSION_LIMITS is not a JSON object of route -> limits; using defaults")
+
+_MAX_USER_BUCKETS = 10000
+
+
+class TokenBucket:
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def take(self, now: float) -> float:
+        """Take one token. Returns 0 on success, otherwise seconds until one is available."""
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate if self.rate > 0 else 60.0
+
+    def idle(self, now: float) -> bool:
+        # Refilled to full: forgetting it changes nothing
+        return self.tokens + (now - self.updated) * self.rate >= self.burst
+
+
+_buckets_lock = threading.Lock()
+_user_buckets = {}  # (route, user_id) -> TokenBucket
+_global_buckets = {}  # route -> TokenBucket
+
+_in_flight = threading.BoundedSemaphore(max(1, ADMISSION_MAX_IN_FLIGHT))
+_reads_in_flight = threading.BoundedSemaphore(max(1, ADMISSION_MAX_IN_FLIGHT - ADMISSION_WRITE_RESERVE))
+_route_in_flight = {}  # route -> BoundedSemaphore, only for routes with max_in_flight
+
+_counters_lock = threading.Lock()
+_counters = {"admitted": 0, "rate_limited_user": 0, "rate_limited_global": 0, "shed": 0}
+
+
+def _count(name: str) -> None:
+    with _counters_lock:
+        _counters[name] += 1
+
+
+def _too_many(message: str, retry_after: float) -> func.HttpResponse:
+    return func.HttpResponse(
+        json.dumps({"ok": False, "error": message}),
+        status_code=429,
+        mimetype="application/json",
+        headers={"Retry-After": str(max(1, math.ceil(retry_after)))},
+    )
+
+
+def _check_rate(route: str, user_id: str, limits: dict) -> tuple[str, float] | None:
+    now = time.monotonic()
+    with _buckets_lock:
+        bucket = _global_buckets.get(route)
+        if bucket is None:
+            bucket = _global_buckets[route] = TokenBucket(limits["global_rate"], limits["global_burst"])
+        wait = bucket.take(now)
+        if wait:
+            return "rate_limited_global", wait
+
+        key = (route, user_id)
+        bucket = _user_buckets.get(key)
+        if bucket is None:
+            if len(_user_buckets) >= _MAX_USER_BUCKETS:
+                for k in [k for k, b in _user_buckets.items() if b.idle(now)]:
+                    del _user_buckets[k]
+            bucket = _user_buckets[key] = TokenBucket(limits["user_rate"], limits["user_burst"])
+        wait = bucket.take(now)
+        if wait:
+            # Hand back the global token: this request never runs
+            _global_buckets[route].tokens += 1
+            return "rate_limited_user", wait
+    return None
+
+
+def _semaphores(route: str, limits: dict) -> list:
+    # Narrowest first, so a request waiting on its own cap doesn't hold a shared slot
+    sems = []
+    if limits.get("max_in_flight"):
+        sem = _route_in_flight.get(route)
+        if sem is None:
+            with _buckets_lock:
+                sem = _route_in_flight.setdefault(route, threading.BoundedSemaphore(int(limits["max_in_flight"])))
+        sems.append(sem)
+    if limits.get("kind") != "write":
+        sems.append(_reads_in_flight)
+    sems.append(_in_flight)
+    return sems
+
+
+class Shed(Exception):
+    """No in-flight slot freed up within ADMISSION_QUEUE_SECONDS."""
+
+
+@contextmanager
+def hold(route: str):
+    """
+    Hold route's in-flight slots for the block, or raise Shed.
+
+    run() takes them for the whole handler. Routes admitted with
+    hold_slots=False take them here instead, around just the DB work, so
+    requests answered from cache or from another request's query never
+    queue for one. Let Shed propagate: run() turns it into the 429.
+    """
+    limits = ROUTE_LIMITS.get(route)
+    if limits is None:
+        yield
+        return
+
+    acquired = []
+    try:
+        deadline = time.monotonic() + ADMISSION_QUEUE_SECONDS
+        for sem in _semaphores(route, limits):
+            if not sem.acquire(timeout=max(0.0, deadline - time.monotonic())):
+                _count("shed")
+                raise Shed(route)
+            acquired.append(sem)
+        yield
+    finally:
+        for sem in reversed(acquired):
+            sem.release()
+
+
+def run(user: dict, route: str, handler, hold_slots: bool = True) -> func.HttpResponse:
+    """
+    Run handler() if this request is admitted, otherwise return 429.
+
+    Call after require_user() so limits are per authenticated user. Routes
+    without an entry in ROUTE_LIMITS run unchecked. With hold_slots=False
+    only the rate limits apply up front and the handler takes its
+    in-flight slots with hold(). Either way the handler's DB/HTTP/Python
+    time is counted under route (diagnostics.py), and its log lines carry
+    the route, user and a request id (log_pipeline.py).
+    """
+    with log_pipeline.request(route, user.get("user_id")):
+        return _run(user, route, handler, hold_slots)
+
+
+def _run(user: dict, route: str, handler, hold_slots: bool) -> func.HttpResponse:
+    limits = ROUTE_LIMITS.get(route)
+    if limits is None:
+        return diagnostics.track(route, handler)
+
+    limited = _check_rate(route, user["user_id"], limits)
+    if limited:
+        reason, wait = limited
+        _count(reason)
+        logging.info("ADMISSION_REJECTED route=%s reason=%s user_id=%s", route, reason, user["user_id"])
+        return _too_many("Too many requests", wait)
+
+    try:
+        if not hold_slots:
+            _count("admitted")
+            return diagnostics.track(route, handler)
+        with hold(route):
+            _count("admitted")
+            return diagnostics.track(route, handler)
+    except Shed:
+        logging.info("ADMISSION_REJECTED route=%s reason=shed user_id=%s", route, user["user_id"])
+        return _too_many("Server busy, retry shortly", 1)
+
+
+def stats() -> dict:
+    with _counters_lock:
+        counters = dict(_counters)
+    with _buckets_lock:
+        users = len(_user_buckets)
+    return {
+        "max_in_flight": ADMISSION_MAX_IN_FLIGHT,
+        "write_reserve": ADMISSION_WRITE_RESERVE,
+        "tracked_users": users,
+        **counters,
+    }
@@ -1,11 +1,47 @@
 import os
 import json
+import hashlib
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+import jwt
 import requests
 import azure.functions as func
 
+import http_client
+from circuit_breaker import CircuitBreaker, CircuitOpenError
+
 SUPABASE_URL = os.environ.get("SUPABASE_URL", "")
 SUPABASE_PUBLISHABLE_KEY = os.environ.get("SUPABASE_ANON_KEY", "")
 
+# Supabase asymmetric signing keys. Tokens signed with one of these are verified
+# locally; anything else (legacy HS256 projects, unknown kid) falls back to
+# asking Supabase via /auth/v1/user.
+AUTH_JWKS_TTL_SECONDS = int(os.environ.get("AUTH_JWKS_TTL_SECONDS", 600))
+_JWKS_MIN_REFETCH_SECONDS = 30
+_ASYMMETRIC_ALGS = ("RS256", "ES256")
+
+# Users confirmed by /auth/v1/user, keyed by token hash. Only served while the
+# Supabase breaker is open (or the call fails), never past the token's own exp.
+AUTH_STALE_SERVE_SECONDS = int(os.environ.get("AUTH_STALE_SERVE_SECONDS", 900))
+_REMOTE_USERS_MAX = 5000
+
+supabase_breaker = CircuitBreaker(
+    "supabase",
+    slow_call_seconds=float(os.environ.get("SUPABASE_SLOW_CALL_SECONDS", 2)),
+)
+
+_keys = {}
+_keys_fetched_at = None
+_keys_attempted_at = None
+_keys_last_error = None
+_keys_lock = threading.Lock()
+
+_remote_users = OrderedDict()  # sha256(token) -> (expires_at monotonic, user dict)
+_remote_users_lock = threading.Lock()
+
 class AuthError(Exception):
     def __init__(self, message, status_code=401):
         self.message = message
@@ -13,15 +49,112 @@ class AuthError(Exception):
         super().__init__(message)
 
 
-def require_user(req: func.HttpRequest) -> dict:
-    token = req.headers.get("x-supabase-token", "")
-    if not token:
-        raise AuthError("Missing X-Supabase-Token header", 401)
+class _UpstreamError(Exception):
+    pass
+
+
+def _refresh_keys() -> None:
+    global _keys, _keys_fetched_at, _keys_attempted_at, _keys_last_error
+    _keys_attempted_at = time.monotonic()
+    try:
+        r = supabase_breaker.call(http_client.get, f"{SUPABASE_URL}/auth/v1/.well-known/jwks.json", timeout=10)
+        r.raise_for_status()
+        keyset = jwt.PyJWKSet.from_dict(r.json())
+        _keys = {k.key_id: k for k in keyset.keys if k.key_id}
+        _keys_fetched_at = _keys_attempted_at
+        _keys_last_error = None
+    except CircuitOpenError:
+        # Supabase is failing: keep verifying with the keys we have
+        return
+    except Exception as e:
+        # Keep serving with whatever keys we had; remote validation still works
+        _keys_last_error = str(e)
+        logging.warning("AUTH_JWKS_REFRESH_FAILED error=%s", e)
+
+
+def _signing_key(kid: str):
+    with _keys_lock:
+        now = time.monotonic()
+        stale = _keys_fetched_at is None or now - _keys_fetched_at > AUTH_JWKS_TTL_SECONDS
+        unknown = kid not in _keys
+        may_refetch = _keys_attempted_at is None or now - _keys_attempted_at > _JWKS_MIN_REFETCH_SECONDS
+        if (stale or unknown) and may_refetch:
+            _refresh_keys()
+        return _keys.get(kid)
+
+
+def _verify_locally(token: str):
+    """Return verified claims, or None when the token can't be checked locally."""
+    try:
+        header = jwt.get_unverified_header(token)
+    except jwt.InvalidTokenError:
+        return None
+
+    alg = header.get("alg")
+    kid = header.get("kid")
+    if alg not in _ASYMMETRIC_ALGS or not kid:
+        return None
+
+    key = _signing_key(kid)
+    if key is None:
+        return None
+
+    try:
+        return jwt.decode(
+            token,
+            key.key,
+            algorithms=[alg],
+            audience="authenticated",
+            options={"require": ["exp", "sub"]},
+        )
+    except jwt.InvalidTokenError:
+        raise AuthError("Invalid or expired session", 401)
+
+
+def key_cache_state() -> dict:
+    with _keys_lock:
+        age = None if _keys_fetched_at is None else time.monotonic() - _keys_fetched_at
+        return {
+            "keys": len(_keys),
+            "age_seconds": None if age is None else round(age, 1),
+            "fresh": age is not None and age <= AUTH_JWKS_TTL_SECONDS,
+            "last_error": _keys_last_error,
+        }
+
+
+def _token_key(token: str) -> str:
+    return hashlib.sha256(token.encode("utf-8")).hexdigest()
 
-    if not SUPABASE_URL or not SUPABASE_PUBLISHABLE_KEY:
-        raise AuthError("Supabase configuration missing", 500)
 
-    r = requests.get(
+def _remember_user(token: str, user: dict) -> None:
+    ttl = AUTH_STALE_SERVE_SECONDS
+    try:
+        # Signature already checked by Supabase for exactly these bytes
+        exp = jwt.decode(token, options={"verify_signature": False}).get("exp")
+        if exp:
+            ttl = min(ttl, exp - time.time())
+    except jwt.InvalidTokenError:
+        pass
+    if ttl <= 0:
+        return
+    key = _token_key(token)
+    with _remote_users_lock:
+        _remote_users[key] = (time.monotonic() + ttl, user)
+        _remote_users.move_to_end(key)
+        while len(_remote_users) > _REMOTE_USERS_MAX:
+            _remote_users.popitem(last=False)
+
+
+def _remembered_user(token: str) -> dict | None:
+    with _remote_users_lock:
+        entry = _remote_users.get(_token_key(token))
+    if entry is None or entry[0] < time.monotonic():
+        return None
+    return entry[1]
+
+
+def _fetch_user(token: str) -> requests.Response:
+    r = http_client.get(
         f"{SUPABASE_URL}/auth/v1/user",
         headers={
             "Authorization": f"Bearer {token}",
@@ -29,13 +162,46 @@ def require_user(req: func.HttpRequest) -> dict:
         },
         timeout=10,
     )
+    if r.status_code >= 500 or r.status_code == 429:
+        # Supabase trouble, not a verdict on the token
+        raise _UpstreamError(f"Supabase auth returned {r.status_code}")
+    return r
+
+
+def require_user(req: func.HttpRequest) -> dict:
+    token = req.headers.get("x-supabase-token", "")
+    if not token:
+        raise AuthError("Missing X-Supabase-Token header", 401)
+
+    if not SUPABASE_URL or not SUPABASE_PUBLISHABLE_KEY:
+        raise AuthError("Supabase configuration missing", 500)
+
+    claims = _verify_locally(token)
+    if claims is not None:
+        return {
+            "user_id": claims.get("sub"),
+            "email": claims.get("email"),
+            "supabase_role": claims.get("role"),
+        }
+
+    try:
+        r = supabase_breaker.call(_fetch_user, token)
+    except (CircuitOpenError, _UpstreamError, requests.RequestException) as e:
+        cached = _remembered_user(token)
+        if cached is not None:
+            logging.info("AUTH_SERVED_FROM_CACHE reason=%s", type(e).__name__)
+            return cached
+        logging.warning("AUTH_UNAVAILABLE error=%s", e)
+        raise AuthError("Authentication service unavailable", 503)
 
     if r.status_code != 200:
         raise AuthError("Invalid or expired session", 401)
 
     user = r.json()
-    return {
+    result = {
         "user_id": user.get("id"),
         "email": user.get("email"),
         "supabase_role": user.get("role"),
     }
+    _remember_user(token, result)
+    return result
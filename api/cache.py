@@ -0,0 +1,131 @@
+import threading
+import time
+from collections import OrderedDict
+
+# Per-worker caches with tag-based eviction. Entries are tagged with the ids they
+# depend on ("mentor:<id>", "user:<id>", ...); change_feed.py evicts tags when
+# Postgres reports a committed change, on this or any other instance.
+
+_caches = []
+_registry_lock = threading.Lock()
+
+# Bumped on every eviction of a tag. A value computed from a query that started
+# before an eviction must not be stored, or it would reinstate stale data.
+_tag_versions = {}
+_epoch = 0  # bumped by clear_all(), covers tags that were never evicted individually
+
+# Long TTLs are only safe while change notifications are arriving. When the
+# listener is down every cache behaves as a miss.
+_invalidation_live = False
+
+
+class TTLCache:
+    def __init__(self, name: str, ttl_seconds: float, max_entries: int = 1000):
+        self.name = name
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # key -> (expires_at, value, tags)
+        self._by_tag = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        with _registry_lock:
+            _caches.append(self)
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or not _invalidation_live or entry[0] < time.monotonic():
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def snapshot(self, tags) -> tuple:
+        # Call before running the query whose result will be passed to set()
+        with _registry_lock:
+            return (_epoch,) + tuple(_tag_versions.get(t, 0) for t in tags)
+
+    def set(self, key, value, tags=(), snapshot=None) -> None:
+        tags = tuple(tags)
+        with _registry_lock:
+            if snapshot is not None and snapshot != (_epoch,) + tuple(_tag_versions.get(t, 0) for t in tags):
+                return
+        with self._lock:
+            self._drop(key)
+            self._entries[key] = (time.monotonic() + self.ttl_seconds, value, tags)
+            for t in tags:
+                self._by_tag.setdefault(t, set()).add(key)
+            while len(self._entries) > self.max_entries:
+                self._drop(next(iter(self._entries)))
+
+    def _drop(self, key) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        for t in entry[2]:
+            keys = self._by_tag.get(t)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._by_tag[t]
+
+    def invalidate_tag(self, tag: str) -> None:
+        with self._lock:
+            for key in list(self._by_tag.get(tag, ())):
+                self._drop(key)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._by_tag.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+
+def booking_tags(*, mentor_id=None, student_id=None, slot_id=None) -> list[str]:
+    tags = []
+    if mentor_id:
+        tags += [f"mentor:{mentor_id}", f"user:{mentor_id}"]
+    if student_id:
+        tags.append(f"user:{student_id}")
+    if slot_id:
+        tags.append(f"slot:{slot_id}")
+    return tags
+
+
+def invalidate_tags(tags) -> None:
+    with _registry_lock:
+        caches = list(_caches)
+        for t in tags:
+            _tag_versions[t] = _tag_versions.get(t, 0) + 1
+    for c in caches:
+        for t in tags:
+            c.invalidate_tag(t)
+
+
+def clear_all() -> None:
+    global _epoch
+    with _registry_lock:
+        caches = list(_caches)
+        _epoch += 1
+        _tag_versions.clear()
+    for c in caches:
+        c.clear()
+
+
+def set_invalidation_live(live: bool) -> None:
+    # Anything cached around a listener gap may have missed its eviction
+    global _invalidation_live
+    if live != _invalidation_live:
+        clear_all()
+    _invalidation_live = live
+
+
+def stats() -> dict:
+    with _registry_lock:
+        caches = list(_caches)
+    return {"invalidation_live": _invalidation_live, **{c.name: c.stats() for c in caches}}
@@ -0,0 +1,112 @@
+import json
+import logging
+import threading
+import time
+
+from cache import booking_tags, invalidate_tags, set_invalidation_live
+from db import get_conn, mark_write
+
+# Channel the triggers in db/migrations/005_create_change_notifications.sql publish on
+CHANNEL = "booking_changes"
+_RECONNECT_MAX_SECONDS = 30
+
+_subscribers = []
+_thread = None
+_start_lock = threading.Lock()
+_state = {
+    "connected": False,
+    "listening_since": None,
+    "events": 0,
+    "reconnects": 0,
+    "last_event_at": None,
+    "last_error": None,
+}
+
+
+def subscribe(callback) -> None:
+    # callback(event: dict) runs on the listener thread; keep it quick
+    _subscribers.append(callback)
+
+
+def tags_for(event: dict) -> list[str]:
+    if event.get("table") in ("app_users", "mentors", "students"):
+        user_id = event.get("user_id")
+        tags = [f"user:{user_id}"]
+        if event.get("table") == "mentors":
+            tags.append(f"mentor:{user_id}")
+        return tags
+    return booking_tags(
+        mentor_id=event.get("mentor_id"),
+        student_id=event.get("student_id"),
+        slot_id=event.get("slot_id"),
+    )
+
+
+def _dispatch(event: dict) -> None:
+    invalidate_tags(tags_for(event))
+    # Read-your-writes across instances: the users involved read from the primary for a while
+    mark_write(event.get("mentor_id"), event.get("student_id"), event.get("user_id"))
+    for callback in list(_subscribers):
+        try:
+            callback(event)
+        except Exception:
+            logging.exception("CHANGE_FEED_SUBSCRIBER_FAILED table=%s", event.get("table"))
+
+
+def _listen_forever() -> None:
+    backoff = 1
+    while True:
+        conn = None
+        try:
+            conn = get_conn()
+            conn.autocommit = True
+            conn.execute(f"LISTEN {CHANNEL};")
+            _state["listening_since"] = time.time()
+            _state["connected"] = True
+            set_invalidation_live(True)
+            logging.info("CHANGE_FEED_LISTENING channel=%s", CHANNEL)
+            backoff = 1
+
+            while True:
+                # Wake up periodically so a dead connection is noticed even when idle
+                for notify in conn.notifies(timeout=60):
+                    try:
+                        event = json.loads(notify.payload)
+                    except ValueError:
+                        logging.warning("CHANGE_FEED_BAD_PAYLOAD payload=%s", notify.payload)
+                        continue
+                    _state["events"] += 1
+                    _state["last_event_at"] = time.time()
+                    _dispatch(event)
+                conn.execute("SELECT 1;")
+
+        except Exception as e:
+            _state["last_error"] = str(e)
+            logging.exception("CHANGE_FEED_DISCONNECTED")
+        finally:
+            _state["connected"] = False
+            _state["listening_since"] = None
+            # Events may be lost while disconnected: drop everything cached
+            set_invalidation_live(False)
+            if conn is not None:
+                try:
+                    conn.close()
+                except Exception:
+                    pass
+
+        _state["reconnects"] += 1
+        time.sleep(backoff)
+        backoff = min(backoff * 2, _RECONNECT_MAX_SECONDS)
+
+
+def start() -> None:
+    """Start this worker's listener thread (idempotent)."""
+    global _thread
+    with _start_lock:
+        if _thread is None:
+            _thread = threading.Thread(target=_listen_forever, name="change-feed", daemon=True)
+            _thread.start()
+
+
+def state() -> dict:
+    return dict(_state)
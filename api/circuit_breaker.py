@@ -0,0 +1,152 @@
+import logging
+import os
+import threading
+import time
+from collections import deque
+
+# Defaults for every breaker; callers may override per dependency.
+CIRCUIT_WINDOW_SECONDS = float(os.environ.get("CIRCUIT_WINDOW_SECONDS", 30))
+CIRCUIT_MIN_CALLS = int(os.environ.get("CIRCUIT_MIN_CALLS", 10))
+CIRCUIT_FAILURE_RATIO = float(os.environ.get("CIRCUIT_FAILURE_RATIO", 0.5))
+CIRCUIT_SLOW_RATIO = float(os.environ.get("CIRCUIT_SLOW_RATIO", 0.5))
+CIRCUIT_OPEN_SECONDS = float(os.environ.get("CIRCUIT_OPEN_SECONDS", 30))
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+_breakers = []
+_registry_lock = threading.Lock()
+
+
+class CircuitOpenError(Exception):
+    def __init__(self, name: str):
+        self.name = name
+        super().__init__(f"{name} circuit is open")
+
+
+class CircuitBreaker:
+    """
+    Per-worker breaker over a rolling window of recent calls.
+
+    Opens when, with at least min_calls in the last window_seconds, the share of
+    failed calls reaches failure_ratio or the share of calls slower than
+    slow_call_seconds reaches slow_ratio. While open, calls fail fast with
+    CircuitOpenError. After open_seconds one probe call is let through
+    (half-open): success closes the breaker, failure opens it again.
+
+    is_failure(exc) decides which exceptions from call() count as failures;
+    the rest (e.g. the dependency rejecting a bad request) mean it answered
+    and count as successes. By default every exception is a failure.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        *,
+        slow_call_seconds: float,
+        window_seconds: float = CIRCUIT_WINDOW_SECONDS,
+        min_calls: int = CIRCUIT_MIN_CALLS,
+        failure_ratio: float = CIRCUIT_FAILURE_RATIO,
+        slow_ratio: float = CIRCUIT_SLOW_RATIO,
+        open_seconds: float = CIRCUIT_OPEN_SECONDS,
+        is_failure=None,
+    ):
+        self.name = name
+        self.slow_call_seconds = slow_call_seconds
+        self.window_seconds = window_seconds
+        self.min_calls = min_calls
+        self.failure_ratio = failure_ratio
+        self.slow_ratio = slow_ratio
+        self.open_seconds = open_seconds
+        self.is_failure = is_failure or (lambda exc: True)
+
+        self._lock = threading.Lock()
+        self._calls = deque()  # (monotonic time, failed, slow)
+        self._state = CLOSED
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self.rejected = 0
+        with _registry_lock:
+            _breakers.append(self)
+
+    def _transition(self, new_state: str, reason: str) -> None:
+        logging.warning("CIRCUIT_STATE name=%s from=%s to=%s reason=%s", self.name, self._state, new_state, reason)
+        self._state = new_state
+        if new_state == OPEN:
+            self._opened_at = time.monotonic()
+        if new_state == CLOSED:
+            self._calls.clear()
+        self._probe_in_flight = False
+
+    def _prune(self, now: float) -> None:
+        while self._calls and self._calls[0][0] < now - self.window_seconds:
+            self._calls.popleft()
+
+    def allow(self) -> bool:
+        """Whether a call may go ahead now. Every allowed call must be followed by record()."""
+        with self._lock:
+            if self._state == OPEN and time.monotonic() - self._opened_at >= self.open_seconds:
+                self._transition(HALF_OPEN, "open_timeout")
+            if self._state == HALF_OPEN and not self._probe_in_flight:
+                self._probe_in_flight = True
+                return True
+            if self._state == CLOSED:
+                return True
+            self.rejected += 1
+            return False
+
+    def record(self, ok: bool, elapsed: float) -> None:
+        now = time.monotonic()
+        slow = elapsed >= self.slow_call_seconds
+        with self._lock:
+            if self._state == HALF_OPEN:
+                if ok and not slow:
+                    self._transition(CLOSED, "probe_succeeded")
+                else:
+                    self._transition(OPEN, "probe_failed" if not ok else "probe_slow")
+                return
+            if self._state == OPEN:
+                return
+
+            self._calls.append((now, not ok, slow))
+            self._prune(now)
+            total = len(self._calls)
+            if total < self.min_calls:
+                return
+            failed = sum(1 for _t, f, _s in self._calls if f)
+            slowed = sum(1 for _t, _f, s in self._calls if s)
+            if failed / total >= self.failure_ratio:
+                self._transition(OPEN, f"failures={failed}/{total}")
+            elif slowed / total >= self.slow_ratio:
+                self._transition(OPEN, f"slow={slowed}/{total}")
+
+    def call(self, fn, *args, **kwargs):
+        """Run fn through the breaker. Exceptions from fn are recorded per is_failure and re-raised."""
+        if not self.allow():
+            raise CircuitOpenError(self.name)
+        started = time.monotonic()
+        try:
+            result = fn(*args, **kwargs)
+        except Exception as e:
+            self.record(not self.is_failure(e), time.monotonic() - started)
+            raise
+        self.record(True, time.monotonic() - started)
+        return result
+
+    def state(self) -> dict:
+        with self._lock:
+            self._prune(time.monotonic())
+            return {
+                "state": self._state,
+                "calls": len(self._calls),
+                "failed": sum(1 for _t, f, _s in self._calls if f),
+                "slow": sum(1 for _t, _f, s in self._calls if s),
+                "rejected": self.rejected,
+            }
+
+
+def states() -> dict:
+    with _registry_lock:
+        breakers = list(_breakers)
+    return {b.name: b.state() for b in breakers}
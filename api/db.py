@@ -1,13 +1,141 @@
 import os
+import threading
+import time
+from contextlib import contextmanager
+
 import psycopg
+from psycopg_pool import ConnectionPool
+
+from diagnostics import TimedCursor
+
+PGPOOL_MIN_SIZE = int(os.environ.get("PGPOOL_MIN_SIZE", 1))
+PGPOOL_MAX_SIZE = int(os.environ.get("PGPOOL_MAX_SIZE", 10))
+PGPOOL_TIMEOUT_SECONDS = float(os.environ.get("PGPOOL_TIMEOUT_SECONDS", 5))
+
+# Optional read replica. When PGREAD_HOST is unset every read goes to the primary.
+PGREAD_HOST = os.environ.get("PGREAD_HOST", "")
+PGREAD_PORT = os.environ.get("PGREAD_PORT", "")
+PGREAD_POOL_MAX_SIZE = int(os.environ.get("PGREAD_POOL_MAX_SIZE", PGPOOL_MAX_SIZE))
+
+# Read-your-writes: for this long after a user's write, their reads stay on the
+# primary so replica lag can't hide what they just did.
+READ_YOUR_WRITES_SECONDS = float(os.environ.get("READ_YOUR_WRITES_SECONDS", 5))
+
+_pools = {}
+_pool_lock = threading.Lock()
+
+_recent_writers = {}  # user_id -> monotonic time of last write
+_recent_writers_lock = threading.Lock()
+
+
+def _conn_kwargs(replica: bool = False) -> dict:
+    kwargs = {
+        "host": os.environ["PGHOST"],
+        "user": os.environ["PGUSER"],
+        "password": os.environ["PGPASSWORD"],
+        "dbname": os.environ["PGDATABASE"],
+        "port": int(os.environ.get("PGPORT", 5432)),
+        "sslmode": os.environ.get("PGSSLMODE", "require"),
+        "connect_timeout": 5,
+    }
+    if replica:
+        kwargs["host"] = PGREAD_HOST
+        if PGREAD_PORT:
+            kwargs["port"] = int(PGREAD_PORT)
+    return kwargs
+
 
 def get_conn():
-    return psycopg.connect(
-        host=os.environ["PGHOST"],
-        user=os.environ["PGUSER"],
-        password=os.environ["PGPASSWORD"],
-        dbname=os.environ["PGDATABASE"],
-        port=int(os.environ.get("PGPORT", 5432)),
-        sslmode="require",
-        connect_timeout=5,
-    )
+    # Dedicated connection outside the pool (long-lived listeners, one-off jobs).
+    return psycopg.connect(**_conn_kwargs())
+
+
+def _configure_read_only(conn) -> None:
+    conn.read_only = True
+
+
+def get_pool(replica: bool = False) -> ConnectionPool:
+    name = "replica" if replica and PGREAD_HOST else "primary"
+    pool = _pools.get(name)
+    if pool is None:
+        with _pool_lock:
+            pool = _pools.get(name)
+            if pool is None:
+                pool = ConnectionPool(
+                    # TimedCursor charges statement time/rows to the current request
+                    kwargs={**_conn_kwargs(replica=name == "replica"), "cursor_factory": TimedCursor},
+                    min_size=PGPOOL_MIN_SIZE,
+                    max_size=PGREAD_POOL_MAX_SIZE if name == "replica" else PGPOOL_MAX_SIZE,
+                    timeout=PGPOOL_TIMEOUT_SECONDS,
+                    max_idle=300,
+                    max_lifetime=1800,
+                    name=name,
+                    configure=_configure_read_only if name == "replica" else None,
+                    open=False,
+                )
+                pool.open(wait=False)
+                _pools[name] = pool
+    return pool
+
+
+def mark_write(*user_ids) -> None:
+    """Record that these users just changed data (routes call this after commit)."""
+    now = time.monotonic()
+    with _recent_writers_lock:
+        for user_id in user_ids:
+            if user_id:
+                _recent_writers[str(user_id)] = now
+        if len(_recent_writers) > 10000:
+            cutoff = now - READ_YOUR_WRITES_SECONDS
+            for k in [k for k, t in _recent_writers.items() if t < cutoff]:
+                del _recent_writers[k]
+
+
+def wrote_recently(user_id) -> bool:
+    if not user_id:
+        return False
+    with _recent_writers_lock:
+        written_at = _recent_writers.get(str(user_id))
+    return written_at is not None and time.monotonic() - written_at < READ_YOUR_WRITES_SECONDS
+
+
+@contextmanager
+def connection(readonly: bool = False, user_id=None):
+    """
+    Borrow a pooled connection for one transaction.
+
+    The block commits when it exits normally (including early returns) and
+    rolls back if it raises. Don't call conn.commit()/conn.close() inside it.
+
+    readonly=True routes to the read replica when one is configured, unless
+    user_id wrote within READ_YOUR_WRITES_SECONDS.
+    """
+    replica = readonly and bool(PGREAD_HOST) and not wrote_recently(user_id)
+    with get_pool(replica=replica).connection() as conn:
+        yield conn
+
+
+def _stats(pool: ConnectionPool, min_size: int, max_size: int) -> dict:
+    stats = pool.get_stats()
+    return {
+        "open": not pool.closed,
+        "size": stats.get("pool_size", 0),
+        "available": stats.get("pool_available", 0),
+        "min_size": stats.get("pool_min", min_size),
+        "max_size": stats.get("pool_max", max_size),
+        "requests_waiting": stats.get("requests_waiting", 0),
+        "connections_errors": stats.get("connections_errors", 0),
+        "requests_errors": stats.get("requests_errors", 0),
+    }
+
+
+def pool_state() -> dict:
+    # Readiness view. Never checks out a connection; the first call on a fresh
+    # worker only starts the pool filling to min_size in the background.
+    return _stats(get_pool(), PGPOOL_MIN_SIZE, PGPOOL_MAX_SIZE)
+
+
+def replica_pool_state() -> dict | None:
+    if not PGREAD_HOST:
+        return None
+    return _stats(get_pool(replica=True), PGPOOL_MIN_SIZE, PGREAD_POOL_MAX_SIZE)
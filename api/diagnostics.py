@@ -0,0 +1,298 @@
+import contextvars
+import json
+import logging
+import os
+import re
+import threading
+import time
+import uuid
+from collections import deque
+from datetime import date, datetime
+
+import psycopg
+
+# Per-worker DB cost accounting. Pooled connections use TimedCursor (db.py), so every
+# statement's time and row count is added to the request admission.run() is handling
+# and to a per-statement table; http_client.py adds outbound HTTP time. What's left of
+# a request's wall time is Python. Statements and requests over a threshold are kept
+# as samples, with parameter values replaced by their shape.
+
+DIAG_SLOW_QUERY_MS = float(os.environ.get("DIAG_SLOW_QUERY_MS", 200))
+DIAG_SLOW_REQUEST_MS = float(os.environ.get("DIAG_SLOW_REQUEST_MS", 1000))
+DIAG_SAMPLES = int(os.environ.get("DIAG_SAMPLES", 50))
+# Per-worker cost summary in the logs this often (0 disables)
+DIAG_REPORT_SECONDS = float(os.environ.get("DIAG_REPORT_SECONDS", 300))
+
+_MAX_STATEMENTS = 500
+_MAX_SQL_CHARS = 400
+_REQUEST_STATEMENTS = 50
+
+_current = contextvars.ContextVar("diagnostics_request", default=None)
+_lock = threading.Lock()
+_routes = {}  # route -> totals
+_statements = {}  # normalized sql -> totals
+_slow_queries = deque(maxlen=DIAG_SAMPLES)
+_slow_requests = deque(maxlen=DIAG_SAMPLES)
+_last_reported = {}  # route -> totals at the previous log report
+_started_at = time.time()
+_reporter = None
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+class _Request:
+    __slots__ = ("route", "db_seconds", "http_seconds", "queries", "rows", "statements")
+
+    def __init__(self, route: str):
+        self.route = route
+        self.db_seconds = 0.0
+        self.http_seconds = 0.0
+        self.queries = 0
+        self.rows = 0
+        self.statements = []  # (sql, ms), first _REQUEST_STATEMENTS only
+
+
+def _normalize(query) -> str:
+    return _WHITESPACE.sub(" ", str(query)).strip()[:_MAX_SQL_CHARS]
+
+
+def _shape(value) -> str:
+    # Enough to reproduce a plan, nothing a user typed or an id that identifies them
+    if value is None:
+        return "null"
+    if isinstance(value, (bool, int, float)):
+        return type(value).__name__
+    if isinstance(value, (str, bytes)):
+        return f"{type(value).__name__}[{len(value)}]"
+    if isinstance(value, uuid.UUID):
+        return "uuid"
+    if isinstance(value, (datetime, date)):
+        return type(value).__name__
+    if isinstance(value, (list, tuple)):
+        return f"list[{len(value)}]"
+    return type(value).__name__
+
+
+def redact(params):
+    if params is None:
+        return None
+    if isinstance(params, dict):
+        return {k: _shape(v) for k, v in params.items()}
+    return [_shape(v) for v in params]
+
+
+def record_query(query, params, elapsed: float, rows: int, failed: bool = False) -> None:
+    sql = _normalize(query)
+    ms = elapsed * 1000.0
+    rows = max(rows, 0)
+    req = _current.get()
+    if req is not None:
+        req.db_seconds += elapsed
+        req.queries += 1
+        req.rows += rows
+        if len(req.statements) < _REQUEST_STATEMENTS:
+            req.statements.append((sql, ms))
+
+    with _lock:
+        s = _statements.get(sql)
+        if s is None:
+            if len(_statements) >= _MAX_STATEMENTS:
+                # Forget the cheapest statement so new ones can still be counted
+                del _statements[min(_statements, key=lambda k: _statements[k]["total_ms"])]
+            s = _statements[sql] = {"calls": 0, "errors": 0, "total_ms": 0.0, "max_ms": 0.0, "rows": 0, "routes": set()}
+        s["calls"] += 1
+        s["errors"] += int(failed)
+        s["total_ms"] += ms
+        s["max_ms"] = max(s["max_ms"], ms)
+        s["rows"] += rows
+        if req is not None:
+            s["routes"].add(req.route)
+        if ms >= DIAG_SLOW_QUERY_MS:
+            _slow_queries.append(
+                {
+                    "at": time.time(),
+                    "route": req.route if req is not None else None,
+                    "ms": round(ms, 1),
+                    "rows": rows,
+                    "failed": failed,
+                    "sql": sql,
+                    "params": redact(params),
+                }
+            )
+
+
+def current() -> dict | None:
+    """DB time and statements so far in the request being tracked on this thread."""
+    req = _current.get()
+    if req is None:
+        return None
+    return {"db_ms": round(req.db_seconds * 1000.0, 1), "queries": req.queries}
+
+
+def record_http(elapsed: float) -> None:
+    req = _current.get()
+    if req is not None:
+        req.http_seconds += elapsed
+
+
+def track(route: str, handler):
+    """Run handler(), charging its DB, HTTP and Python time to route."""
+    req = _Request(route)
+    token = _current.set(req)
+    started = time.perf_counter()
+    failed = True
+    try:
+        result = handler()
+        failed = False
+        return result
+    finally:
+        elapsed = time.perf_counter() - started
+        _current.reset(token)
+        _finish(req, elapsed, failed)
+
+
+def _finish(req: _Request, elapsed: float, failed: bool) -> None:
+    total_ms = elapsed * 1000.0
+    db_ms = req.db_seconds * 1000.0
+    http_ms = req.http_seconds * 1000.0
+    with _lock:
+        r = _routes.get(req.route)
+        if r is None:
+            r = _routes[req.route] = {
+                "requests": 0,
+                "errors": 0,
+                "total_ms": 0.0,
+                "db_ms": 0.0,
+                "http_ms": 0.0,
+                "queries": 0,
+                "rows": 0,
+                "max_ms": 0.0,
+            }
+        r["requests"] += 1
+        r["errors"] += int(failed)
+        r["total_ms"] += total_ms
+        r["db_ms"] += db_ms
+        r["http_ms"] += http_ms
+        r["queries"] += req.queries
+        r["rows"] += req.rows
+        r["max_ms"] = max(r["max_ms"], total_ms)
+        if total_ms >= DIAG_SLOW_REQUEST_MS:
+            _slow_requests.append(
+                {
+                    "at": time.time(),
+                    "route": req.route,
+                    "total_ms": round(total_ms, 1),
+                    "db_ms": round(db_ms, 1),
+                    "http_ms": round(http_ms, 1),
+                    "queries": req.queries,
+                    "rows": req.rows,
+                    "slowest": [
+                        {"sql": sql, "ms": round(ms, 1)}
+                        for sql, ms in sorted(req.statements, key=lambda s: s[1], reverse=True)[:5]
+                    ],
+                }
+            )
+
+
+class TimedCursor(psycopg.Cursor):
+    """Cursor that reports each execute() to this module. Set as the pools' cursor_factory."""
+
+    def execute(self, query, params=None, **kwargs):
+        started = time.perf_counter()
+        failed = True
+        try:
+            result = super().execute(query, params, **kwargs)
+            failed = False
+            return result
+        finally:
+            record_query(query, params, time.perf_counter() - started, self.rowcount, failed)
+
+
+def _route_view(route: str, r: dict) -> dict:
+    n = max(r["requests"], 1)
+    python_ms = max(r["total_ms"] - r["db_ms"] - r["http_ms"], 0.0)
+    return {
+        "route": route,
+        "requests": r["requests"],
+        "errors": r["errors"],
+        "total_ms": round(r["total_ms"], 1),
+        "db_ms": round(r["db_ms"], 1),
+        "http_ms": round(r["http_ms"], 1),
+        "python_ms": round(python_ms, 1),
+        "avg_ms": round(r["total_ms"] / n, 1),
+        "avg_db_ms": round(r["db_ms"] / n, 1),
+        "queries_per_request": round(r["queries"] / n, 2),
+        "rows_per_request": round(r["rows"] / n, 1),
+        "max_ms": round(r["max_ms"], 1),
+    }
+
+
+def report(top: int = 20) -> dict:
+    """Routes and statements ranked by total DB time since this worker started, plus samples."""
+    with _lock:
+        routes = [_route_view(route, dict(r)) for route, r in _routes.items()]
+        statements = [
+            {
+                "sql": sql,
+                "calls": s["calls"],
+                "errors": s["errors"],
+                "total_ms": round(s["total_ms"], 1),
+                "avg_ms": round(s["total_ms"] / max(s["calls"], 1), 2),
+                "max_ms": round(s["max_ms"], 1),
+                "rows": s["rows"],
+                "routes": sorted(s["routes"]),
+            }
+            for sql, s in _statements.items()
+        ]
+        slow_queries = list(_slow_queries)
+        slow_requests = list(_slow_requests)
+
+    routes.sort(key=lambda r: r["db_ms"], reverse=True)
+    statements.sort(key=lambda s: s["total_ms"], reverse=True)
+    return {
+        "since": _started_at,
+        "slow_query_ms": DIAG_SLOW_QUERY_MS,
+        "slow_request_ms": DIAG_SLOW_REQUEST_MS,
+        "routes": routes,
+        "statements": statements[:top],
+        "slow_queries": slow_queries[-top:],
+        "slow_requests": slow_requests[-top:],
+    }
+
+
+def log_report() -> None:
+    # One line per route with activity since the last report, most DB time first
+    with _lock:
+        current = {route: dict(r) for route, r in _routes.items()}
+    deltas = []
+    for route, r in current.items():
+        prev = _last_reported.get(route, {})
+        delta = {k: v - prev.get(k, 0) for k, v in r.items() if k != "max_ms"}
+        if delta["requests"]:
+            delta["max_ms"] = r["max_ms"]
+            deltas.append(_route_view(route, delta))
+    _last_reported.clear()
+    _last_reported.update(current)
+
+    for view in sorted(deltas, key=lambda v: v["db_ms"], reverse=True):
+        logging.info("DB_COST %s", json.dumps(view))
+
+
+def _report_forever() -> None:
+    while True:
+        time.sleep(DIAG_REPORT_SECONDS)
+        try:
+            log_report()
+        except Exception:
+            logging.exception("DB_COST_REPORT_FAILED")
+
+
+def start_reporter() -> None:
+    """Start this worker's periodic DB_COST log lines (idempotent)."""
+    global _reporter
+    if DIAG_REPORT_SECONDS <= 0:
+        return
+    with _lock:
+        if _reporter is None:
+            _reporter = threading.Thread(target=_report_forever, name="db-cost-report", daemon=True)
+            _reporter.start()
@@ -1,83 +1,69 @@
 import os
 import json
 import logging
-import requests
 import azure.functions as func
-import psycopg
 from datetime import datetime
 
 
-from auth import require_user, AuthError
-from db import get_conn
-from graph_mailer import send_booking_confirmed_email
+from auth import require_user, AuthError, key_cache_state
+import admission
+import cache
+import circuit_breaker
+import diagnostics
+import http_client
+import log_pipeline
+import singleflight
+import slot_events
+import change_feed
+from db import pool_state, replica_pool_state
+from graph_mailer import send_booking_confirmed_email, token_cache_state, drain_outbox as email_outbox_drain_batch
+from profiles import get_app_user
+from mentor_summary import refresh_all as mentor_summary_refresh_all
+from idempotency import purge_expired as idempotency_purge_expired
+from slot_status import find_drift as slot_status_find_drift
+from partitions import maintain as partitions_maintain
+from reminders import send_due_reminders
+from statement_stats import top_statements
 
 
 from routes.availability import handle as availability_handle
+from routes.slot_stream import handle as slot_stream_handle
+from routes.calendar_feed import feed as calendar_feed_handle, issue_token as calendar_token_handle
+from routes.db_diagnostics import handle as db_diagnostics_handle
+from routes.roster_import import handle as roster_import_handle
 from routes.bookings import create as bookings_create
 from routes.booking_confirm import handle as booking_confirm_handle
 from routes.booking_cancel import handle as booking_cancel_handle
 from routes.bookings_list import handle as bookings_list_handle
+from routes.mentor_dashboard import handle as mentor_dashboard_handle
 
 
 
 
 
-SUPABASE_URL = os.environ.get("SUPABASE_URL", "")
-SUPABASE_PUBLISHABLE_KEY = os.environ.get("SUPABASE_ANON_KEY", "")  # publishable/anon key
-
 IS_LOCAL = os.environ.get("AZURE_FUNCTIONS_ENVIRONMENT") == "Development"
 
 
 app = func.FunctionApp()
 
+# Log lines become JSON and are written from a background thread, off the request path
+log_pipeline.install()
+# Per-worker LISTEN connection that evicts cached availability/profiles on committed changes
+change_feed.start()
+# Per-worker DB_COST log lines (route DB/HTTP/Python time since the last report)
+diagnostics.start_reporter()
+
 @app.route(route="hello", auth_level=func.AuthLevel.ANONYMOUS)
 def hello(req: func.HttpRequest) -> func.HttpResponse:
     # Read Supabase session token from custom header (SWA overwrites Authorization)
-    token = req.headers.get("x-supabase-token", "")
-    if not token:
-        return func.HttpResponse(
-            json.dumps({"ok": False, "error": "Missing X-Supabase-Token header"}, indent=2),
-            status_code=401,
-            mimetype="application/json",
-        )
-
-    if not SUPABASE_URL or not SUPABASE_PUBLISHABLE_KEY:
-        return func.HttpResponse(
-            json.dumps({"ok": False, "error": "Missing SUPABASE_URL or SUPABASE_ANON_KEY app setting"}, indent=2),
-            status_code=500,
-            mimetype="application/json",
-        )
-
     try:
-        r = requests.get(
-            f"{SUPABASE_URL}/auth/v1/user",
-            headers={
-                "Authorization": f"Bearer {token}",
-                "apikey": SUPABASE_PUBLISHABLE_KEY,
-            },
-            timeout=10,
-        )
-
-        if r.status_code != 200:
-            return func.HttpResponse(
-                json.dumps(
-                    {"ok": False, "error": "Supabase rejected token", "status": r.status_code, "body": r.text},
-                    indent=2,
-                ),
-                status_code=401,
-                mimetype="application/json",
-            )
-
-        user = r.json()
+        user = require_user(req)
+    except AuthError as e:
         return func.HttpResponse(
-            json.dumps(
-                {"ok": True, "user_id": user.get("id"), "email": user.get("email"), "role": user.get("role")},
-                indent=2,
-            ),
-            status_code=200,
+            json.dumps({"ok": False, "error": e.message}, indent=2),
+            status_code=e.status_code,
             mimetype="application/json",
         )
-
     except Exception as e:
         logging.exception("Token validation failed")
         return func.HttpResponse(
@@ -86,86 +72,75 @@ def hello(req: func.HttpRequest) -> func.HttpResponse:
             mimetype="application/json",
         )
 
+    return func.HttpResponse(
+        json.dumps(
+            {"ok": True, "user_id": user["user_id"], "email": user["email"], "role": user["supabase_role"]},
+            indent=2,
+        ),
+        status_code=200,
+        mimetype="application/json",
+    )
+
 
 
 @app.route(route="db-ping", auth_level=func.AuthLevel.ANONYMOUS)
 def db_ping(req: func.HttpRequest) -> func.HttpResponse:
+    # Readiness probe: reports shared-layer state only, never opens a connection of its own
     try:
-        conn = psycopg.connect(
-            host=os.environ["PGHOST"],
-            user=os.environ["PGUSER"],
-            password=os.environ["PGPASSWORD"],
-            dbname=os.environ["PGDATABASE"],
-            port=int(os.environ.get("PGPORT", 5432)),
-            sslmode="require",
-            connect_timeout=5,
-        )
-        with conn.cursor() as cur:
-            cur.execute("SELECT 1;")
-            cur.fetchone()
-        conn.close()
-
-        return func.HttpResponse(
-            json.dumps({"ok": True, "db": "reachable"}, indent=2),
-            status_code=200,
-            mimetype="application/json",
-        )
-
+        pool = pool_state()
     except Exception as e:
+        logging.exception("Readiness check failed")
         return func.HttpResponse(
             json.dumps({"ok": False, "error": str(e)}, indent=2),
-            status_code=500,
+            status_code=503,
             mimetype="application/json",
         )
 
+    ready = pool["open"] and pool["size"] > 0
+
+    return func.HttpResponse(
+        json.dumps(
+            {
+                "ok": ready,
+                "db_pool": pool,
+                "db_replica_pool": replica_pool_state(),
+                "auth_keys": key_cache_state(),
+                "graph_token": token_cache_state(),
+                "change_feed": change_feed.state(),
+                "caches": cache.stats(),
+                "admission": admission.stats(),
+                "circuits": circuit_breaker.states(),
+                "http": http_client.stats(),
+                "singleflight": singleflight.stats(),
+                "slot_events": slot_events.stats(),
+                "logging": log_pipeline.stats(),
+            },
+            indent=2,
+        ),
+        status_code=200 if ready else 503,
+        mimetype="application/json",
+    )
+
 
 @app.route(route="me", auth_level=func.AuthLevel.ANONYMOUS)
 def me(req: func.HttpRequest) -> func.HttpResponse:
-    token = req.headers.get("x-supabase-token", "")
-    if not token:
-        return func.HttpResponse(
-            json.dumps({"ok": False, "error": "Missing X-Supabase-Token"}, indent=2),
-            status_code=401,
-            mimetype="application/json",
-        )
-
     # Step 1: validate token with Supabase
-    
     try:
-       user_ctx = require_user(req)
-       user_id = user_ctx["user_id"]
-       email = user_ctx["email"]
+        user_ctx = require_user(req)
+        user_id = user_ctx["user_id"]
+        email = user_ctx["email"]
     except AuthError as e:
-         return func.HttpResponse(
+        return func.HttpResponse(
             json.dumps({"ok": False, "error": e.message}, indent=2),
             status_code=e.status_code,
             mimetype="application/json",
-    )
-
+        )
 
     # Step 2: fetch app role from Postgres
     try:
-        conn = psycopg.connect(
-            host=os.environ["PGHOST"],
-            user=os.environ["PGUSER"],
-            password=os.environ["PGPASSWORD"],
-            dbname=os.environ["PGDATABASE"],
-            port=int(os.environ.get("PGPORT", 5432)),
-            sslmode="require",
-        )
-        with conn.cursor() as cur:
-            cur.execute(
-                """
-                SELECT app_role, status
-                FROM app_users
-                WHERE user_id = %s
-                """,
-                (user_id,),
-            )
-            row = cur.fetchone()
-        conn.close()
+        app_user = get_app_user(user_id)
 
-        if not row:
+        if not app_user:
             return func.HttpResponse(
                 json.dumps(
                     {
@@ -179,16 +154,14 @@ def me(req: func.HttpRequest) -> func.HttpResponse:
                 mimetype="application/json",
             )
 
-        app_role, status = row
-
         return func.HttpResponse(
             json.dumps(
                 {
                     "ok": True,
                     "user_id": user_id,
                     "email": email,
-                    "app_role": app_role,
-                    "status": status,
+                    "app_role": app_user["app_role"],
+                    "status": app_user["status"],
                 },
                 indent=2,
             ),
@@ -197,6 +170,7 @@ def me(req: func.HttpRequest) -> func.HttpResponse:
         )
 
     except Exception as e:
+        logging.exception("Profile lookup failed")
         return func.HttpResponse(
             json.dumps({"ok": False, "error": str(e)}, indent=2),
             status_code=500,
@@ -210,6 +184,23 @@ def me(req: func.HttpRequest) -> func.HttpResponse:
 @app.route(route="availability", methods=["GET"], auth_level=func.AuthLevel.ANONYMOUS)
 def get_availability(req: func.HttpRequest) -> func.HttpResponse:
     return availability_handle(req)
+
+
+@app.route(route="slots/stream", methods=["GET"], auth_level=func.AuthLevel.ANONYMOUS)
+def get_slot_stream(req: func.HttpRequest) -> func.HttpResponse:
+    return slot_stream_handle(req)
+
+
+# Calendar feed (.ics) of confirmed sessions
+
+@app.route(route="calendar/token", methods=["POST"], auth_level=func.AuthLevel.ANONYMOUS)
+def post_calendar_token(req: func.HttpRequest) -> func.HttpResponse:
+    return calendar_token_handle(req)
+
+
+@app.route(route="calendar/feed", methods=["GET"], auth_level=func.AuthLevel.ANONYMOUS)
+def get_calendar_feed(req: func.HttpRequest) -> func.HttpResponse:
+    return calendar_feed_handle(req)
   
 #Booking endpoint
 
@@ -229,6 +220,76 @@ def cancel_booking(req: func.HttpRequest) -> func.HttpResponse:
 def list_bookings(req: func.HttpRequest) -> func.HttpResponse:
     return bookings_list_handle(req)
 
+#Mentor dashboard
+
+@app.route(route="mentor/dashboard", methods=["GET"], auth_level=func.AuthLevel.ANONYMOUS)
+def mentor_dashboard(req: func.HttpRequest) -> func.HttpResponse:
+    return mentor_dashboard_handle(req)
+
+#Roster import (admins)
+
+@app.route(route="roster/import", methods=["POST"], auth_level=func.AuthLevel.ANONYMOUS)
+def import_roster(req: func.HttpRequest) -> func.HttpResponse:
+    return roster_import_handle(req)
+
+@app.timer_trigger(schedule="0 5 * * * *", arg_name="timer", run_on_startup=False, use_monitor=False)
+def refresh_mentor_dashboards(timer: func.TimerRequest) -> None:
+    # Hourly: roll week/term windows and correct any drift in the incremental counters
+    refreshed = mentor_summary_refresh_all()
+    logging.info("MENTOR_SUMMARY_REFRESHED mentors=%s", refreshed)
+
+@app.timer_trigger(schedule="0 20 * * * *", arg_name="timer", run_on_startup=False, use_monitor=False)
+def idempotency_purge(timer: func.TimerRequest) -> None:
+    purged = idempotency_purge_expired()
+    logging.info("IDEMPOTENCY_KEYS_PURGED count=%s", purged)
+
+@app.timer_trigger(schedule="0 35 * * * *", arg_name="timer", run_on_startup=False, use_monitor=False)
+def slot_status_drift_check(timer: func.TimerRequest) -> None:
+    # Hourly: availability trusts slot status, so any mismatch with bookings is a bug
+    drift = slot_status_find_drift()
+    if drift:
+        logging.error("SLOT_STATUS_DRIFT count=%s slots=%s", len(drift), json.dumps(drift[:10]))
+    else:
+        logging.info("SLOT_STATUS_DRIFT count=0")
+
+@app.timer_trigger(schedule="0 50 3 * * *", arg_name="timer", run_on_startup=False, use_monitor=False)
+def booking_partitions_maintenance(timer: func.TimerRequest) -> None:
+    # Nightly (UTC): detaching a partition briefly locks bookings/slots, so run it when quiet
+    created, archived = partitions_maintain()
+    logging.info("BOOKING_PARTITIONS_MAINTAINED created=%s archived=%s", created, archived)
+
+@app.timer_trigger(schedule="0 */2 * * * *", arg_name="timer", run_on_startup=False, use_monitor=False)
+def email_outbox_drain(timer: func.TimerRequest) -> None:
+    # Emails deferred while Graph was failing
+    counts = email_outbox_drain_batch()
+    if counts["sent"] or counts["failed"] or counts["purged"]:
+        logging.info("EMAIL_OUTBOX_DRAINED sent=%s failed=%s purged=%s", counts["sent"], counts["failed"], counts["purged"])
+
+@app.timer_trigger(schedule="0 */10 * * * *", arg_name="timer", run_on_startup=False, use_monitor=False)
+def send_session_reminders(timer: func.TimerRequest) -> None:
+    counts = send_due_reminders()
+    if any(counts.values()):
+        logging.info(
+            "REMINDERS_SENT sent=%s deferred=%s failed=%s skipped=%s",
+            counts["sent"], counts["deferred"], counts["failed"], counts["skipped"],
+        )
+
+@app.timer_trigger(schedule="0 45 * * * *", arg_name="timer", run_on_startup=False, use_monitor=False)
+def db_statement_report(timer: func.TimerRequest) -> None:
+    # Hourly: database-wide top statements, next to the per-worker DB_COST lines
+    stats = top_statements(10)
+    if not stats["available"]:
+        logging.info("DB_STATEMENT_COST unavailable error=%s", stats["error"])
+        return
+    for s in stats["statements"]:
+        logging.info("DB_STATEMENT_COST %s", json.dumps(s))
+
+
+@app.route(route="diagnostics/db", methods=["GET"], auth_level=func.AuthLevel.ANONYMOUS)
+def get_db_diagnostics(req: func.HttpRequest) -> func.HttpResponse:
+    # Admins only; see routes/db_diagnostics.py
+    return db_diagnostics_handle(req)
+
 
 @app.route(route="email-test", methods=["POST"], auth_level=func.AuthLevel.ANONYMOUS)
 def email_test(req: func.HttpRequest) -> func.HttpResponse:
@@ -250,15 +311,17 @@ def email_test(req: func.HttpRequest) -> func.HttpResponse:
         )
 
     try:
-        send_booking_confirmed_email(
+        # A test email is only useful now: report Graph's answer instead of queueing it
+        status = send_booking_confirmed_email(
             from_user=os.environ["M365_FROM_USER"],
             to_emails=[to_email],
             subject="DiveInSTEAM Graph Email Test",
             body_text="This is a test email sent via Microsoft Graph.",
+            defer=False,
         )
         return func.HttpResponse(
-            '{"ok": true}',
-            status_code=200,
+            json.dumps({"ok": status == "sent", "status": status}),
+            status_code=200 if status == "sent" else 502,
             mimetype="application/json",
         )
     except Exception as e:
@@ -1,15 +1,112 @@
+import logging
 import os
+import threading
+import time
+import uuid
+
 import requests
 
+import http_client
+from circuit_breaker import CircuitBreaker, CircuitOpenError
+from db import connection
+
+# Overridable so local runs (loadtest/mock_servers.py) can stand in for Microsoft endpoints
+M365_LOGIN_URL = os.environ.get("M365_LOGIN_URL", "https://login.microsoftonline.com")
+M365_GRAPH_URL = os.environ.get("M365_GRAPH_URL", "https://graph.microsoft.com")
+
+# App-only tokens live ~1h; reuse one per worker and renew a few minutes early
+TOKEN_REFRESH_MARGIN_SECONDS = 300
+
+# Graph trouble trips the breaker; while it is open emails go to email_outbox
+# (db/migrations/008_create_email_outbox.sql) and the drain timer sends them later.
+EMAIL_OUTBOX_BATCH_SIZE = int(os.environ.get("EMAIL_OUTBOX_BATCH_SIZE", 20))
+EMAIL_OUTBOX_MAX_ATTEMPTS = int(os.environ.get("EMAIL_OUTBOX_MAX_ATTEMPTS", 12))
+_OUTBOX_LEASE_SECONDS = 300
+# Rows that reached EMAIL_OUTBOX_MAX_ATTEMPTS stay this long for inspection, then go
+EMAIL_OUTBOX_DEAD_RETENTION_DAYS = int(os.environ.get("EMAIL_OUTBOX_DEAD_RETENTION_DAYS", 30))
+
+# Claim a batch with a lease so concurrent drains (other instances) skip it.
+# Range scan on idx_email_outbox_pending, which only holds unsent emails.
+OUTBOX_CLAIM_SQL = """
+    UPDATE email_outbox
+    SET next_attempt_at = now() + make_interval(secs => %s)
+    WHERE email_id IN (
+        SELECT email_id
+        FROM email_outbox
+        WHERE sent_at IS NULL
+          AND next_attempt_at <= now()
+          AND attempts < %s
+        ORDER BY next_attempt_at
+        LIMIT %s
+        FOR UPDATE SKIP LOCKED
+    )
+    RETURNING email_id, from_user, to_emails, subject, body_text, attempts;
+"""
+
+OUTBOX_PURGE_SQL = """
+    DELETE FROM email_outbox
+    WHERE sent_at < now() - interval '7 days'
+       OR (sent_at IS NULL
+           AND attempts >= %s
+           AND created_at < now() - make_interval(days => %s));
+"""
+
+
+def _graph_unavailable(exc: Exception) -> bool:
+    """
+    Whether exc means Graph is down or throttling: timeouts, connection errors, 5xx and 429.
+
+    Only these trip the breaker and are worth retrying later. A 4xx (bad recipient,
+    mailbox not allowed, bad credentials) or a missing M365_* setting fails the same
+    way on every attempt.
+    """
+    if isinstance(exc, (requests.ConnectionError, requests.Timeout)):
+        return True
+    if isinstance(exc, requests.HTTPError) and exc.response is not None:
+        return exc.response.status_code >= 500 or exc.response.status_code == 429
+    return False
+
+
+graph_breaker = CircuitBreaker(
+    "graph",
+    slow_call_seconds=float(os.environ.get("GRAPH_SLOW_CALL_SECONDS", 5)),
+    is_failure=_graph_unavailable,
+)
+
+_token = None
+_token_expires_at = 0.0
+_token_lock = threading.Lock()
+
 
 def _get_graph_token() -> str:
+    global _token, _token_expires_at
+    with _token_lock:
+        if _token and time.monotonic() < _token_expires_at:
+            return _token
+        token, expires_in = _request_graph_token()
+        _token = token
+        _token_expires_at = time.monotonic() + max(0, expires_in - TOKEN_REFRESH_MARGIN_SECONDS)
+        return _token
+
+
+def token_cache_state() -> dict:
+    with _token_lock:
+        remaining = _token_expires_at - time.monotonic()
+        return {
+            "cached": bool(_token) and remaining > 0,
+            "expires_in_seconds": max(0, int(remaining)) if _token else None,
+        }
+
+
+def _request_graph_token() -> tuple[str, int]:
     tenant_id = os.environ["M365_TENANT_ID"]
     client_id = os.environ["M365_CLIENT_ID"]
     client_secret = os.environ["M365_CLIENT_SECRET"]
 
-    token_url = f"https://login.microsoftonline.com/{tenant_id}/oauth2/v2.0/token"
+    token_url = f"{M365_LOGIN_URL}/{tenant_id}/oauth2/v2.0/token"
 
-    r = requests.post(
+    # Safe to retry: a client_credentials grant has no side effects
+    r = http_client.post(
         token_url,
         data={
             "client_id": client_id,
@@ -18,23 +115,19 @@ def _get_graph_token() -> str:
             "scope": "https://graph.microsoft.com/.default",
         },
         timeout=15,
+        idempotent=True,
     )
     if r.status_code != 200:
-       raise Exception(f"Token request failed: {r.status_code} {r.text}")
-    return r.json()["access_token"]
+        raise requests.HTTPError(f"Token request failed: {r.status_code} {r.text}", response=r)
+    body = r.json()
+    return body["access_token"], int(body.get("expires_in", 3599))
 
 
 
-def send_booking_confirmed_email(
-    *,
-    from_user: str,  # e.g. "info@diveinsteam.org"
-    to_emails: list[str],
-    subject: str,
-    body_text: str,
-) -> None:
+def _send_mail(from_user: str, to_emails: list[str], subject: str, body_text: str) -> None:
     token = _get_graph_token()
 
-    url = f"https://graph.microsoft.com/v1.0/users/{from_user}/sendMail"
+    url = f"{M365_GRAPH_URL}/v1.0/users/{from_user}/sendMail"
     payload = {
         "message": {
             "subject": subject,
@@ -47,7 +140,7 @@ def send_booking_confirmed_email(
         "saveToSentItems": True,
     }
 
-    r = requests.post(
+    r = http_client.post(
         url,
         headers={
             "Authorization": f"Bearer {token}",
@@ -57,3 +150,115 @@ def send_booking_confirmed_email(
         timeout=15,
     )
     r.raise_for_status()
+
+
+def _defer(from_user: str, to_emails: list[str], subject: str, body_text: str, error: str) -> None:
+    with connection() as conn, conn.cursor() as cur:
+        cur.execute(
+            """
+            INSERT INTO email_outbox (email_id, from_user, to_emails, subject, body_text, last_error)
+            VALUES (%s, %s, %s, %s, %s, %s);
+            """,
+            (uuid.uuid4(), from_user, to_emails, subject, body_text, error),
+        )
+
+
+def send_booking_confirmed_email(
+    *,
+    from_user: str,  # e.g. "info@diveinsteam.org"
+    to_emails: list[str],
+    subject: str,
+    body_text: str,
+    defer: bool = True,
+) -> str:
+    """
+    Send through Graph, or queue in email_outbox when Graph is unavailable.
+
+    Returns "sent" or "deferred", or "failed" when Graph rejected the email (4xx)
+    or M365_* settings are missing, which a later retry would not fix. Only
+    raises if the email could neither be sent nor queued. With defer=False
+    nothing is queued and any failed send returns "failed".
+    """
+    try:
+        graph_breaker.call(_send_mail, from_user, to_emails, subject, body_text)
+        return "sent"
+    except CircuitOpenError as e:
+        error = str(e)
+    except Exception as e:
+        error = str(e)
+        if not _graph_unavailable(e):
+            logging.error("EMAIL_SEND_FAILED subject=%s error=%s", subject, e)
+            return "failed"
+        if defer:
+            logging.warning("EMAIL_SEND_FAILED_DEFERRING subject=%s error=%s", subject, e)
+        else:
+            logging.warning("EMAIL_SEND_FAILED subject=%s error=%s", subject, e)
+
+    if not defer:
+        return "failed"
+    _defer(from_user, to_emails, subject, body_text, error)
+    logging.info("EMAIL_DEFERRED subject=%s", subject)
+    return "deferred"
+
+
+def drain_outbox() -> dict:
+    """
+    Send due outbox emails (timer). Stops at the first send the Graph breaker refuses.
+
+    Emails Graph rejects outright are given up at once. Sent rows are purged after
+    7 days, given-up rows after EMAIL_OUTBOX_DEAD_RETENTION_DAYS.
+    """
+    counts = {"sent": 0, "failed": 0, "purged": 0}
+
+    with connection() as conn, conn.cursor() as cur:
+        cur.execute(OUTBOX_CLAIM_SQL, (_OUTBOX_LEASE_SECONDS, EMAIL_OUTBOX_MAX_ATTEMPTS, EMAIL_OUTBOX_BATCH_SIZE))
+        batch = cur.fetchall()
+
+    for i, (email_id, from_user, to_emails, subject, body_text, attempts) in enumerate(batch):
+        try:
+            graph_breaker.call(_send_mail, from_user, list(to_emails), subject, body_text)
+            error, permanent = None, False
+        except CircuitOpenError:
+            # Hand the rest of the batch back for the next run
+            with connection() as conn, conn.cursor() as cur:
+                cur.execute(
+                    "UPDATE email_outbox SET next_attempt_at = now() WHERE email_id = ANY(%s);",
+                    ([row[0] for row in batch[i:]],),
+                )
+            break
+        except Exception as e:
+            error = str(e)
+            permanent = not _graph_unavailable(e)
+
+        with connection() as conn, conn.cursor() as cur:
+            if error is None:
+                cur.execute("UPDATE email_outbox SET sent_at = now() WHERE email_id = %s;", (email_id,))
+                counts["sent"] += 1
+            elif permanent:
+                # Rejected by Graph or misconfigured: retrying would fail the same way
+                cur.execute(
+                    "UPDATE email_outbox SET attempts = %s, last_error = %s WHERE email_id = %s;",
+                    (EMAIL_OUTBOX_MAX_ATTEMPTS, error, email_id),
+                )
+                counts["failed"] += 1
+                logging.error("EMAIL_OUTBOX_GAVE_UP email_id=%s error=%s", email_id, error)
+            else:
+                # Exponential backoff: 1, 2, 4 ... minutes, capped at an hour
+                cur.execute(
+                    """
+                    UPDATE email_outbox
+                    SET attempts = attempts + 1,
+                        last_error = %s,
+                        next_attempt_at = now() + make_interval(mins => least(60, power(2, attempts)::int))
+                    WHERE email_id = %s;
+                    """,
+                    (error, email_id),
+                )
+                counts["failed"] += 1
+                if attempts + 1 >= EMAIL_OUTBOX_MAX_ATTEMPTS:
+                    logging.error("EMAIL_OUTBOX_GAVE_UP email_id=%s error=%s", email_id, error)
+
+    with connection() as conn, conn.cursor() as cur:
+        cur.execute(OUTBOX_PURGE_SQL, (EMAIL_OUTBOX_MAX_ATTEMPTS, EMAIL_OUTBOX_DEAD_RETENTION_DAYS))
+        counts["purged"] = cur.rowcount
+    return counts
@@ -0,0 +1,165 @@
+import logging
+import os
+import random
+import threading
+import time
+from collections import deque
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from diagnostics import record_http
+
+# One keep-alive connection pool per outbound host (Supabase, login.microsoftonline.com,
+# graph.microsoft.com), shared by every request on this worker. Saves a TCP+TLS
+# handshake per call and keeps per-host latency / reuse numbers for db-ping.
+
+HTTP_CONNECT_TIMEOUT_SECONDS = float(os.environ.get("HTTP_CONNECT_TIMEOUT_SECONDS", 3))
+HTTP_POOL_MAX_SIZE = int(os.environ.get("HTTP_POOL_MAX_SIZE", 20))
+HTTP_RETRIES = int(os.environ.get("HTTP_RETRIES", 2))
+HTTP_RETRY_BACKOFF_SECONDS = float(os.environ.get("HTTP_RETRY_BACKOFF_SECONDS", 0.2))
+
+_RETRY_STATUSES = (502, 503, 504)
+_IDEMPOTENT_METHODS = ("GET", "HEAD", "OPTIONS", "PUT", "DELETE")
+_LATENCY_SAMPLES = 256
+
+_sessions = {}  # host -> requests.Session
+_metrics = {}  # host -> dict
+_lock = threading.Lock()
+
+
+def _host(url: str) -> str:
+    parts = urlsplit(url)
+    return f"{parts.scheme}://{parts.netloc}"
+
+
+def _session(host: str) -> requests.Session:
+    session = _sessions.get(host)
+    if session is None:
+        with _lock:
+            session = _sessions.get(host)
+            if session is None:
+                session = requests.Session()
+                # Retries are done in request() so they can be jittered and counted
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=HTTP_POOL_MAX_SIZE, max_retries=0)
+                session.mount(host, adapter)
+                _sessions[host] = session
+                _metrics[host] = {
+                    "requests": 0,
+                    "errors": 0,
+                    "retries": 0,
+                    "latencies_ms": deque(maxlen=_LATENCY_SAMPLES),
+                }
+    return session
+
+
+def _record(host: str, elapsed: float, error: bool = False, retry: bool = False) -> None:
+    record_http(elapsed)
+    with _lock:
+        m = _metrics[host]
+        m["requests"] += 1
+        m["errors"] += int(error)
+        m["retries"] += int(retry)
+        m["latencies_ms"].append(elapsed * 1000.0)
+
+
+def _backoff(attempt: int) -> float:
+    # Full jitter: spreads retries from many workers instead of bunching them
+    return random.uniform(0, HTTP_RETRY_BACKOFF_SECONDS * (2 ** attempt))
+
+
+def request(method: str, url: str, *, timeout: float, idempotent: bool | None = None, **kwargs) -> requests.Response:
+    """
+    Send a request over the shared per-host pool.
+
+    timeout is the read timeout; connecting is bounded separately by
+    HTTP_CONNECT_TIMEOUT_SECONDS. Idempotent calls (GET etc., or
+    idempotent=True) are retried on connection errors and 502/503/504;
+    others only when the connection could not be made at all. A read
+    timeout is never retried: the server was reached and was slow, and
+    waiting for it again would multiply the caller's wait. Retries also
+    stop once timeout seconds have passed since the first attempt. The
+    last response or exception is returned/raised as requests would.
+    """
+    method = method.upper()
+    if idempotent is None:
+        idempotent = method in _IDEMPOTENT_METHODS
+    host = _host(url)
+    session = _session(host)
+
+    deadline = time.monotonic() + timeout
+    attempt = 0
+    while True:
+        started = time.monotonic()
+        try:
+            r = session.request(method, url, timeout=(HTTP_CONNECT_TIMEOUT_SECONDS, timeout), **kwargs)
+        except requests.RequestException as e:
+            elapsed = time.monotonic() - started
+            safe = isinstance(e, requests.ConnectTimeout) or (
+                idempotent and isinstance(e, requests.ConnectionError)
+            )
+            pause = _backoff(attempt)
+            if attempt < HTTP_RETRIES and safe and time.monotonic() + pause < deadline:
+                _record(host, elapsed, error=True, retry=True)
+                time.sleep(pause)
+                attempt += 1
+                continue
+            _record(host, elapsed, error=True)
+            raise
+
+        elapsed = time.monotonic() - started
+        pause = _backoff(attempt)
+        if (
+            idempotent
+            and r.status_code in _RETRY_STATUSES
+            and attempt < HTTP_RETRIES
+            and time.monotonic() + pause < deadline
+        ):
+            _record(host, elapsed, error=True, retry=True)
+            r.close()
+            time.sleep(pause)
+            attempt += 1
+            continue
+        _record(host, elapsed, error=r.status_code >= 500)
+        return r
+
+
+def get(url: str, **kwargs) -> requests.Response:
+    return request("GET", url, **kwargs)
+
+
+def post(url: str, **kwargs) -> requests.Response:
+    return request("POST", url, **kwargs)
+
+
+def _percentile(values: list, p: float) -> float | None:
+    if not values:
+        return None
+    values = sorted(values)
+    return round(values[min(len(values) - 1, int(len(values) * p / 100))], 1)
+
+
+def stats() -> dict:
+    with _lock:
+        snapshot = {host: (dict(m), list(m["latencies_ms"]), _sessions[host]) for host, m in _metrics.items()}
+
+    result = {}
+    for host, (m, latencies, session) in snapshot.items():
+        connections = None
+        try:
+            # urllib3 counts connections it had to open vs requests it sent
+            pool = session.get_adapter(host).poolmanager.connection_from_url(host)
+            connections = {"opened": pool.num_connections, "requests": pool.num_requests}
+        except Exception:
+            logging.debug("HTTP_POOL_STATS_UNAVAILABLE host=%s", host, exc_info=True)
+        result[host] = {
+            "requests": m["requests"],
+            "errors": m["errors"],
+            "retries": m["retries"],
+            "p50_ms": _percentile(latencies, 50),
+            "p95_ms": _percentile(latencies, 95),
+            "connections": connections,
+            "reused": None if connections is None else connections["requests"] - connections["opened"],
+        }
+    return result
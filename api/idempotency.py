@@ -0,0 +1,146 @@
+import hashlib
+import json
+import logging
+import os
+
+import azure.functions as func
+
+from db import connection
+
+IDEMPOTENCY_TTL_SECONDS = int(os.environ.get("IDEMPOTENCY_TTL_SECONDS", 86400))
+# A claim with no stored response after this long is treated as abandoned
+# (worker crashed mid-request) and can be taken over by a retry.
+IN_FLIGHT_TIMEOUT_SECONDS = int(os.environ.get("IDEMPOTENCY_IN_FLIGHT_TIMEOUT_SECONDS", 60))
+MAX_KEY_LENGTH = 255
+
+# All single-row statements on the (user_id, route, idempotency_key) primary key.
+# Forget expired or abandoned entries for this key so it can be claimed again
+FORGET_SQL = """
+    DELETE FROM idempotency_keys
+    WHERE user_id = %s AND route = %s AND idempotency_key = %s
+      AND (expires_at < now()
+           OR (status_code IS NULL AND created_at < now() - make_interval(secs => %s)));
+"""
+
+CLAIM_SQL = """
+    INSERT INTO idempotency_keys (user_id, route, idempotency_key, request_hash, expires_at)
+    VALUES (%s, %s, %s, %s, now() + make_interval(secs => %s))
+    ON CONFLICT DO NOTHING
+    RETURNING 1;
+"""
+
+EXISTING_SQL = """
+    SELECT request_hash, status_code, response_body, response_mimetype
+    FROM idempotency_keys
+    WHERE user_id = %s AND route = %s AND idempotency_key = %s;
+"""
+
+STORE_SQL = """
+    UPDATE idempotency_keys
+    SET status_code = %s,
+        response_body = %s,
+        response_mimetype = %s
+    WHERE user_id = %s AND route = %s AND idempotency_key = %s;
+"""
+
+RELEASE_SQL = """
+    DELETE FROM idempotency_keys
+    WHERE user_id = %s AND route = %s AND idempotency_key = %s AND status_code IS NULL;
+"""
+
+
+def _json_error(message: str, status_code: int, headers: dict | None = None) -> func.HttpResponse:
+    return func.HttpResponse(
+        json.dumps({"ok": False, "error": message}),
+        status_code=status_code,
+        mimetype="application/json",
+        headers=headers,
+    )
+
+
+def _claim(user_id, route, key, request_hash):
+    """
+    Try to claim the key. Returns None when claimed, otherwise the existing
+    (request_hash, status_code, response_body, response_mimetype) row.
+    """
+    with connection() as conn, conn.cursor() as cur:
+        cur.execute(FORGET_SQL, (user_id, route, key, IN_FLIGHT_TIMEOUT_SECONDS))
+        cur.execute(CLAIM_SQL, (user_id, route, key, request_hash, IDEMPOTENCY_TTL_SECONDS))
+        existing = None
+        if not cur.fetchone():
+            cur.execute(EXISTING_SQL, (user_id, route, key))
+            # Row can vanish between INSERT and SELECT (owner released it); report as in flight
+            existing = cur.fetchone() or (request_hash, None, None, None)
+    return existing
+
+
+def _store(user_id, route, key, resp: func.HttpResponse) -> None:
+    with connection() as conn, conn.cursor() as cur:
+        cur.execute(
+            STORE_SQL,
+            (resp.status_code, resp.get_body().decode("utf-8"), resp.mimetype, user_id, route, key),
+        )
+
+
+def _release(user_id, route, key) -> None:
+    with connection() as conn, conn.cursor() as cur:
+        cur.execute(RELEASE_SQL, (user_id, route, key))
+
+
+def run(req: func.HttpRequest, user: dict, route: str, handler) -> func.HttpResponse:
+    """
+    Execute handler() at most once per Idempotency-Key.
+
+    Without the header the handler just runs. With it, the first request claims
+    the key and its response is stored; retries with the same key and body get
+    the stored response back without touching bookings or Graph. 5xx responses
+    and responses with Retry-After (a temporary conflict, e.g. the slot lock
+    being held) are not stored, so a retry after them executes again.
+    """
+    key = (req.headers.get("idempotency-key") or "").strip()
+    if not key:
+        return handler()
+
+    if len(key) > MAX_KEY_LENGTH:
+        return _json_error(f"Idempotency-Key must be at most {MAX_KEY_LENGTH} characters", 400)
+
+    user_id = user["user_id"]
+    request_hash = hashlib.sha256(req.get_body() or b"").hexdigest()
+
+    existing = _claim(user_id, route, key, request_hash)
+    if existing:
+        stored_hash, status_code, body, mimetype = existing
+        if stored_hash != request_hash:
+            return _json_error("Idempotency-Key was already used with a different request body", 422)
+        if status_code is None:
+            return _json_error(
+                "A request with this Idempotency-Key is still in progress",
+                409,
+                headers={"Retry-After": "1"},
+            )
+        logging.info("IDEMPOTENT_REPLAY route=%s key=%s status=%s", route, key, status_code)
+        return func.HttpResponse(
+            body,
+            status_code=status_code,
+            mimetype=mimetype or "application/json",
+            headers={"Idempotent-Replayed": "true"},
+        )
+
+    try:
+        resp = handler()
+    except Exception:
+        _release(user_id, route, key)
+        raise
+
+    if resp.status_code >= 500 or resp.headers.get("Retry-After"):
+        _release(user_id, route, key)
+    else:
+        _store(user_id, route, key, resp)
+    return resp
+
+
+def purge_expired() -> int:
+    with connection() as conn, conn.cursor() as cur:
+        cur.execute("DELETE FROM idempotency_keys WHERE expires_at < now();")
+        purged = cur.rowcount
+    return purged
@@ -0,0 +1,242 @@
+import contextvars
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import re
+import threading
+import time
+import traceback
+import uuid
+from collections import deque
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+import diagnostics
+
+# Each record goes out as one JSON object with the request's id, route, user and
+# timings, plus the EVENT and key=value pairs handlers already write
+# ("CONFIRM_EMAIL_SEND_DONE booking_id=... email_status=...").
+#
+# Console and file output (StreamHandlers) leaves the request thread through a
+# bounded queue and is written by a background thread. Any other root handler (the
+# Functions host's, which forwards to App Insights) stays on the calling thread: it
+# tags records with the invocation id it finds there, and would lose that
+# correlation on the writer thread. It only hands the record to the host, so it's cheap.
+#
+# Sampling is decided once per request, so a request's INFO lines are all kept or
+# all dropped. A sampled-out request holds its INFO lines (up to LOG_HELD_RECORDS)
+# until it ends: if it logs a WARNING or above they're written first, along with
+# the rest of the request, so a failure always comes with its context. WARNING and
+# above are never sampled or dropped: if the queue is full they're written on the
+# calling thread instead.
+
+LOG_QUEUE_SIZE = int(os.environ.get("LOG_QUEUE_SIZE", 10000))
+# Fraction of requests whose INFO/DEBUG lines are kept, per admission route,
+# e.g. {"availability": 0.05, "calendar.feed": 0.1}. Unlisted routes keep everything.
+LOG_SAMPLE_DEFAULT = float(os.environ.get("LOG_SAMPLE_DEFAULT", 1.0))
+# INFO/DEBUG lines a sampled-out request keeps in case it fails; older ones are dropped
+LOG_HELD_RECORDS = int(os.environ.get("LOG_HELD_RECORDS", 100))
+
+LOG_SAMPLE_RATES = {}
+try:
+    LOG_SAMPLE_RATES = {str(k): float(v) for k, v in json.loads(os.environ.get("LOG_SAMPLE_RATES") or "{}").items()}
+except (ValueError, AttributeError, TypeError):
+    logging.exception("LOG_SAMPLE_RATES is not a JSON object of route -> rate; keeping every request")
+
+_MAX_FIELD_CHARS = 500
+
+_EVENT = re.compile(r"^([A-Z][A-Z0-9_]{2,})\b")
+_PAIR = re.compile(r"\b([a-z][a-z0-9_]*)=(\S+)")
+
+_context = contextvars.ContextVar("log_context", default=None)
+_lock = threading.Lock()
+_queue = None
+_writer = None
+_counters = {"queued": 0, "sampled_out": 0, "dropped": 0, "written_inline": 0}
+
+
+def _count(name: str, n: int = 1) -> None:
+    with _lock:
+        _counters[name] += n
+
+
+def _sample_rate(route: str) -> float:
+    return LOG_SAMPLE_RATES.get(route, LOG_SAMPLE_DEFAULT)
+
+
+@contextmanager
+def request(route: str, user_id=None):
+    """Attach route, user and a request id to every record logged inside the block."""
+    sampled = random.random() < _sample_rate(route)
+    ctx = {
+        "request_id": uuid.uuid4().hex,
+        "route": route,
+        "user_id": str(user_id) if user_id else None,
+        "started": time.perf_counter(),
+        "sampled": sampled,
+        "held": None if sampled else deque(maxlen=max(0, LOG_HELD_RECORDS)),
+    }
+    token = _context.set(ctx)
+    try:
+        yield ctx
+    finally:
+        _context.reset(token)
+        # Ended without a warning: its INFO lines stay sampled out
+        if ctx["held"]:
+            _count("sampled_out", len(ctx["held"]))
+
+
+def _structured(record: logging.LogRecord) -> str:
+    message = record.getMessage()
+    entry = {
+        "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+        "level": record.levelname,
+        "logger": record.name,
+    }
+    event = _EVENT.match(message)
+    if event:
+        entry["event"] = event.group(1)
+        for key, value in _PAIR.findall(message):
+            entry.setdefault(key, value[:_MAX_FIELD_CHARS])
+    entry["message"] = message
+
+    entry.update(getattr(record, "request_fields", None) or {})
+
+    if record.exc_info:
+        entry["exception"] = "".join(traceback.format_exception(*record.exc_info))
+    elif record.exc_text:
+        entry["exception"] = record.exc_text
+    if record.stack_info:
+        entry["stack"] = record.stack_info
+    return json.dumps(entry, default=str)
+
+
+class _QueueHandler(logging.handlers.QueueHandler):
+    def __init__(self, q, queued_handlers, host_handlers):
+        super().__init__(q)
+        self._queued = queued_handlers
+        self._host = host_handlers
+
+    def emit(self, record: logging.LogRecord) -> None:
+        ctx = _context.get()
+        if ctx is None:
+            self._enqueue(record)
+            return
+
+        # Capture request state here: the writer thread can't see it
+        fields = {"request_id": ctx["request_id"], "route": ctx["route"]}
+        if ctx["user_id"]:
+            fields["user_id"] = ctx["user_id"]
+        fields["elapsed_ms"] = round((time.perf_counter() - ctx["started"]) * 1000.0, 1)
+        fields.update(diagnostics.current() or {})
+
+        if not ctx["sampled"]:
+            held = ctx["held"]
+            if record.levelno < logging.WARNING:
+                if held.maxlen == 0 or len(held) == held.maxlen:
+                    _count("sampled_out")
+                if held.maxlen:
+                    # A copy with the message rendered now, as it would have been written
+                    try:
+                        copy = logging.makeLogRecord(record.__dict__)
+                        copy.msg = record.getMessage()
+                        copy.args = None
+                    except Exception:
+                        self.handleError(record)
+                        return
+                    copy.request_fields = fields
+                    held.append(copy)
+                return
+            # Something went wrong: write what led up to it, and keep the rest of the request
+            ctx["sampled"] = True
+            ctx["held"] = None
+            for earlier in held:
+                self._enqueue(earlier)
+
+        record.request_fields = fields
+        self._enqueue(record)
+
+    def _enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            prepared = self.prepare(record)
+        except Exception:
+            self.handleError(record)
+            return
+        # On this thread, where the host can see which invocation logged it
+        _write(self._host, prepared)
+        if not self._queued:
+            return
+        try:
+            self.queue.put_nowait(prepared)
+            _count("queued")
+        except queue.Full:
+            if record.levelno < logging.WARNING:
+                _count("dropped")
+                return
+            _count("written_inline")
+            _write(self._queued, prepared)
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # One JSON line; traceback and args are folded in, so nothing else to format
+        record = logging.makeLogRecord(record.__dict__)
+        record.msg = _structured(record)
+        record.args = None
+        record.exc_info = None
+        record.exc_text = None
+        record.stack_info = None
+        return record
+
+
+def _write(handlers: list, record: logging.LogRecord) -> None:
+    for handler in handlers:
+        if record.levelno >= handler.level:
+            handler.handle(record)
+
+
+def _write_forever(q: queue.Queue, handlers: list) -> None:
+    while True:
+        record = q.get()
+        try:
+            _write(handlers, record)
+        except Exception:
+            # Nowhere left to log this
+            pass
+
+
+def install() -> None:
+    """Take over the root logger's handlers (idempotent): console output is queued, host handlers stay inline."""
+    global _queue, _writer
+    with _lock:
+        if _writer is not None:
+            return
+        root = logging.getLogger()
+        handlers = [h for h in root.handlers if not isinstance(h, _QueueHandler)]
+        if not handlers:
+            handlers = [logging.StreamHandler()]
+        queued = [h for h in handlers if isinstance(h, logging.StreamHandler)]
+        host = [h for h in handlers if not isinstance(h, logging.StreamHandler)]
+
+        _queue = queue.Queue(maxsize=max(1, LOG_QUEUE_SIZE))
+        for handler in handlers:
+            root.removeHandler(handler)
+        root.addHandler(_QueueHandler(_queue, queued, host))
+
+        _writer = threading.Thread(target=_write_forever, args=(_queue, queued), name="log-writer", daemon=True)
+        _writer.start()
+
+
+def stats() -> dict:
+    with _lock:
+        counters = dict(_counters)
+    return {
+        "installed": _writer is not None,
+        "queue_depth": _queue.qsize() if _queue is not None else 0,
+        "queue_size": LOG_QUEUE_SIZE,
+        "sample_rates": LOG_SAMPLE_RATES,
+        "sample_default": LOG_SAMPLE_DEFAULT,
+        "held_records": LOG_HELD_RECORDS,
+        **counters,
+    }
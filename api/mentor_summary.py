@@ -0,0 +1,65 @@
+import os
+
+from db import connection
+
+# Mentors refreshed per transaction by the hourly timer. The refresh locks each
+# summary row, so booking writes for these mentors wait for at most one batch.
+MENTOR_SUMMARY_REFRESH_BATCH = int(os.environ.get("MENTOR_SUMMARY_REFRESH_BATCH", 100))
+
+# One row by mentor_dashboard_summary_pkey. free_slots_this_week follows slot status
+# (trg_slots_sync_summary, db/migrations/014_sync_dashboard_free_slots.sql), which the
+# booking triggers already flip, so it isn't adjusted here.
+TRANSITION_SQL = """
+    UPDATE mentor_dashboard_summary d
+    SET pending_requests = d.pending_requests + %(pending)s,
+        upcoming_confirmed = d.upcoming_confirmed
+            + CASE WHEN %(start)s >= now() THEN %(confirmed)s ELSE 0 END,
+        cancellations_this_term = d.cancellations_this_term + %(cancelled)s,
+        updated_at = now()
+    WHERE d.mentor_id = %(mentor_id)s;
+"""
+
+REFRESH_BATCH_SQL = """
+    SELECT COALESCE(sum(refresh_mentor_dashboard_summary(m)), 0)::int
+    FROM unnest(%s::uuid[]) AS m;
+"""
+
+
+def apply_transition(cur, *, mentor_id, slot_start_time, old_status, new_status) -> None:
+    """
+    Apply one booking status change to mentor_dashboard_summary.
+
+    Runs on the caller's cursor so the counters commit (or roll back) together
+    with the booking write. old_status is None for a newly created booking.
+    If the mentor has no summary row yet nothing is updated; the dashboard
+    endpoint builds the row from source on first read.
+    """
+    pending = int(new_status == "requested") - int(old_status == "requested")
+    confirmed = int(new_status == "confirmed") - int(old_status == "confirmed")
+    cancelled = int(new_status == "cancelled" and old_status != "cancelled")
+
+    cur.execute(
+        TRANSITION_SQL,
+        {
+            "pending": pending,
+            "confirmed": confirmed,
+            "cancelled": cancelled,
+            "mentor_id": mentor_id,
+            "start": slot_start_time,
+        },
+    )
+
+
+def refresh_all() -> int:
+    # Rolls week/term windows and corrects drift for every mentor (hourly timer).
+    with connection() as conn, conn.cursor() as cur:
+        cur.execute("SELECT mentor_id FROM mentors ORDER BY mentor_id;")
+        mentor_ids = [r[0] for r in cur.fetchall()]
+
+    refreshed = 0
+    step = max(1, MENTOR_SUMMARY_REFRESH_BATCH)
+    for i in range(0, len(mentor_ids), step):
+        with connection() as conn, conn.cursor() as cur:
+            cur.execute(REFRESH_BATCH_SQL, (mentor_ids[i:i + step],))
+            refreshed += cur.fetchone()[0]
+    return refreshed
@@ -0,0 +1,27 @@
+import os
+
+from db import connection
+
+# Monthly partitions of bookings and mentor_availability_slots
+# (db/migrations/007_partition_bookings_and_slots.sql), plus DEFAULT partitions
+# for months that don't have one yet (013_add_default_booking_partitions.sql)
+BOOKING_PARTITION_MONTHS_AHEAD = int(os.environ.get("BOOKING_PARTITION_MONTHS_AHEAD", 12))
+BOOKING_ARCHIVE_AFTER_MONTHS = int(os.environ.get("BOOKING_ARCHIVE_AFTER_MONTHS", 6))
+
+
+def maintain() -> tuple[int, int]:
+    """
+    Create future month partitions and archive old ones.
+
+    Returns (created, archived) partition counts. Slots published beyond the
+    last partition sit in the DEFAULT partition until their month is created,
+    when they're moved into it; BOOKING_PARTITION_MONTHS_AHEAD should still
+    cover how far ahead mentors usually publish, so the default stays small.
+    """
+    with connection() as conn, conn.cursor() as cur:
+        cur.execute(
+            "SELECT created, archived FROM maintain_booking_partitions(%s, %s);",
+            (BOOKING_PARTITION_MONTHS_AHEAD, BOOKING_ARCHIVE_AFTER_MONTHS),
+        )
+        created, archived = cur.fetchone()
+    return created, archived
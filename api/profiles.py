@@ -0,0 +1,37 @@
+import os
+
+from cache import TTLCache
+from db import connection
+
+PROFILE_CACHE_TTL_SECONDS = int(os.environ.get("PROFILE_CACHE_TTL_SECONDS", 900))
+
+_cache = TTLCache("app_users", ttl_seconds=PROFILE_CACHE_TTL_SECONDS, max_entries=5000)
+
+APP_USER_SQL = """
+    SELECT app_role, status
+    FROM app_users
+    WHERE user_id = %s
+"""
+
+
+def get_app_user(user_id) -> dict | None:
+    # App-level role/status for an authenticated Supabase user (None if not registered)
+    user_id = str(user_id)
+    cached = _cache.get(user_id)
+    if cached is not None:
+        return cached
+
+    tags = (f"user:{user_id}",)
+    snapshot = _cache.snapshot(tags)
+
+    with connection(readonly=True, user_id=user_id) as conn, conn.cursor() as cur:
+        cur.execute(APP_USER_SQL, (user_id,))
+        row = cur.fetchone()
+
+    if not row:
+        return None
+
+    app_role, status = row
+    app_user = {"user_id": user_id, "app_role": app_role, "status": status}
+    _cache.set(user_id, app_user, tags, snapshot)
+    return app_user
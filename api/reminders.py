@@ -0,0 +1,108 @@
+import logging
+import os
+
+from db import connection
+from graph_mailer import send_booking_confirmed_email
+
+# Remind both participants this long before a confirmed session starts
+REMINDER_LEAD_HOURS = int(os.environ.get("REMINDER_LEAD_HOURS", 24))
+REMINDER_BATCH_SIZE = int(os.environ.get("REMINDER_BATCH_SIZE", 50))
+REMINDER_MAX_BATCHES = int(os.environ.get("REMINDER_MAX_BATCHES", 20))
+
+# One statement per batch: range scan on idx_bookings_reminder_due, claim with
+# SKIP LOCKED so an overlapping run takes different rows, and return what the
+# email needs.
+CLAIM_SQL = """
+    WITH due AS (
+        SELECT
+            b.booking_id,
+            b.slot_start_time,
+            b.mentor_name_snapshot AS mentor_name,
+            b.mentor_email_snapshot AS mentor_email,
+            b.student_name_snapshot AS student_name,
+            b.student_email_snapshot AS student_email
+        FROM bookings b
+        WHERE b.status = 'confirmed'
+          AND b.reminder_sent_at IS NULL
+          AND b.slot_start_time > now()
+          AND b.slot_start_time <= now() + make_interval(hours => %(lead_hours)s)
+        ORDER BY b.slot_start_time
+        LIMIT %(batch_size)s
+        FOR UPDATE OF b SKIP LOCKED
+    )
+    UPDATE bookings b
+    SET reminder_sent_at = now()
+    FROM due
+    WHERE b.booking_id = due.booking_id
+      AND b.slot_start_time = due.slot_start_time
+    RETURNING
+        b.booking_id,
+        b.slot_start_time,
+        b.meeting_url_snapshot,
+        b.note,
+        due.mentor_name,
+        due.mentor_email,
+        due.student_name,
+        due.student_email;
+"""
+
+
+def _unclaim(booking_id, slot_start_time) -> None:
+    with connection() as conn, conn.cursor() as cur:
+        cur.execute(
+            "UPDATE bookings SET reminder_sent_at = NULL WHERE booking_id = %s AND slot_start_time = %s;",
+            (booking_id, slot_start_time),
+        )
+
+
+def send_due_reminders() -> dict:
+    """Email reminders for confirmed sessions starting within REMINDER_LEAD_HOURS (timer)."""
+    counts = {"sent": 0, "deferred": 0, "failed": 0, "skipped": 0}
+    from_user = os.environ["M365_FROM_USER"]
+
+    for _ in range(REMINDER_MAX_BATCHES):
+        # Claim commits before any email goes out, so the rows are released right away
+        with connection() as conn, conn.cursor() as cur:
+            cur.execute(CLAIM_SQL, {"lead_hours": REMINDER_LEAD_HOURS, "batch_size": REMINDER_BATCH_SIZE})
+            batch = cur.fetchall()
+
+        for (
+            booking_id,
+            start_time,
+            teams_url,
+            note,
+            mentor_name,
+            mentor_email,
+            student_name,
+            student_email,
+        ) in batch:
+            to_emails = [e for e in (student_email, mentor_email) if e]
+            if not to_emails:
+                logging.warning("REMINDER_SKIPPED_NO_EMAIL booking_id=%s", booking_id)
+                counts["skipped"] += 1
+                continue
+            try:
+                status = send_booking_confirmed_email(
+                    from_user=from_user,
+                    to_emails=to_emails,
+                    subject="DiveInSTEAM: Session reminder",
+                    body_text=(
+                        f"Hi {student_name or 'Student'} and {mentor_name or 'Mentor'},\n\n"
+                        f"A reminder that your mentoring session is coming up.\n\n"
+                        f"When: {start_time.isoformat()}\n"
+                        f"Teams link: {teams_url}\n"
+                        + (f"\nStudent note: {note}\n" if note else "")
+                        + "\nThanks,\nDiveInSTEAM\n"
+                    ),
+                )
+                counts[status] += 1
+            except Exception:
+                # Neither sent nor queued: let the next run pick it up again
+                logging.exception("REMINDER_SEND_FAILED booking_id=%s", booking_id)
+                _unclaim(booking_id, start_time)
+                counts["failed"] += 1
+
+        if len(batch) < REMINDER_BATCH_SIZE:
+            break
+
+    return counts
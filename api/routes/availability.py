@@ -1,15 +1,87 @@
 import json
 import logging
-from datetime import datetime
+import os
+import uuid
+from datetime import datetime, timezone
 import azure.functions as func
 
 from auth import require_user, AuthError
-from db import get_conn
+from cache import TTLCache
+from singleflight import SingleFlight
+from admission import Shed, hold, run as run_admitted
+from db import connection, wrote_recently
+
+# Evicted on any booking/slot change for the mentor (change_feed.py), so the TTL
+# only bounds memory use and the damage of a missed notification.
+AVAILABILITY_CACHE_TTL_SECONDS = int(os.environ.get("AVAILABILITY_CACHE_TTL_SECONDS", 600))
+
+_cache = TTLCache("availability", ttl_seconds=AVAILABILITY_CACHE_TTL_SECONDS, max_entries=2000)
+
+# Windows are widened to this granularity for the shared query, then trimmed per request
+AVAILABILITY_WINDOW_ROUND_SECONDS = int(os.environ.get("AVAILABILITY_WINDOW_ROUND_SECONDS", 3600))
+
+_body_flight = SingleFlight("availability_body")
+_query_flight = SingleFlight("availability_query")
+
+
+def _round_window(from_dt: datetime, to_dt: datetime) -> tuple[datetime, datetime]:
+    step = AVAILABILITY_WINDOW_ROUND_SECONDS
+    start = from_dt.timestamp()
+    end = to_dt.timestamp()
+    rounded_from = datetime.fromtimestamp(start - start % step, tz=timezone.utc)
+    rounded_to = datetime.fromtimestamp(end + (-end % step), tz=timezone.utc)
+    return rounded_from, rounded_to
+
+
+# Slot status is maintained by trg_bookings_sync_slot_status, so this is a range
+# scan on idx_slots_mentor_start_available. The start_time < to bound is implied by
+# end_time <= to but gives the index scan its upper end (and prunes partitions).
+SLOTS_SQL = """
+    SELECT
+        s.slot_id,
+        s.start_time,
+        s.end_time
+    FROM mentor_availability_slots s
+    WHERE s.mentor_id = %s
+      AND s.status = 'available'
+      AND s.start_time >= %s
+      AND s.start_time < %s
+      AND s.end_time <= %s
+    ORDER BY s.start_time;
+"""
+
+
+def _query(mentor_id: str, from_dt: datetime, to_dt: datetime, readonly: bool) -> list[tuple]:
+    # Only the request running the query takes an in-flight slot; cache hits and
+    # requests sharing its result never queue for one (or get shed)
+    with hold("availability"), connection(readonly=readonly) as conn, conn.cursor() as cur:
+        cur.execute(SLOTS_SQL, (mentor_id, from_dt, to_dt, to_dt))
+        return cur.fetchall()
+
+
+def _build_body(mentor_id: str, from_dt: datetime, to_dt: datetime, snapshot: tuple, readonly: bool) -> str:
+    rounded_from, rounded_to = _round_window(from_dt, to_dt)
+    rows = _query_flight.do(
+        (mentor_id, rounded_from, rounded_to, snapshot, readonly),
+        lambda: _query(mentor_id, rounded_from, rounded_to, readonly),
+    )
+
+    slots = [
+        {
+            "slot_id": str(r[0]),
+            "start_time": r[1].isoformat() if r[1] else None,
+            "end_time": r[2].isoformat() if r[2] else None,
+        }
+        for r in rows
+        if r[1] >= from_dt and r[2] <= to_dt
+    ]
+    return json.dumps({"ok": True, "mentor_id": mentor_id, "count": len(slots), "slots": slots})
+
 
 def handle(req: func.HttpRequest) -> func.HttpResponse:
     # Auth
     try:
-        _user = require_user(req)
+        user = require_user(req)
     except AuthError as e:
         return func.HttpResponse(
             json.dumps({"ok": False, "error": e.message}),
@@ -17,6 +89,11 @@ def handle(req: func.HttpRequest) -> func.HttpResponse:
             mimetype="application/json",
         )
 
+    return run_admitted(user, "availability", lambda: _handle(req, user), hold_slots=False)
+
+
+def parse_window(req: func.HttpRequest) -> tuple[str, datetime, datetime] | func.HttpResponse:
+    """mentor_id, from and to from the query string, or a 400 response."""
     mentor_id = req.params.get("mentor_id")
     from_ts = req.params.get("from")
     to_ts = req.params.get("to")
@@ -28,6 +105,16 @@ def handle(req: func.HttpRequest) -> func.HttpResponse:
             mimetype="application/json",
         )
 
+    try:
+        # Canonical form so cache tags match the ids in change notifications
+        mentor_id = str(uuid.UUID(mentor_id))
+    except ValueError:
+        return func.HttpResponse(
+            json.dumps({"ok": False, "error": "Invalid mentor_id"}),
+            status_code=400,
+            mimetype="application/json",
+        )
+
     try:
         from_dt = datetime.fromisoformat(from_ts.replace("Z", "+00:00"))
         to_dt = datetime.fromisoformat(to_ts.replace("Z", "+00:00"))
@@ -38,6 +125,12 @@ def handle(req: func.HttpRequest) -> func.HttpResponse:
             mimetype="application/json",
         )
 
+    # No offset given: UTC, same as the database session would assume
+    if from_dt.tzinfo is None:
+        from_dt = from_dt.replace(tzinfo=timezone.utc)
+    if to_dt.tzinfo is None:
+        to_dt = to_dt.replace(tzinfo=timezone.utc)
+
     if to_dt <= from_dt:
         return func.HttpResponse(
             json.dumps({"ok": False, "error": "`to` must be after `from`"}),
@@ -45,45 +138,51 @@ def handle(req: func.HttpRequest) -> func.HttpResponse:
             mimetype="application/json",
         )
 
-    try:
-        conn = get_conn()
-        with conn.cursor() as cur:
-            cur.execute(
-                """
-                SELECT
-                    s.slot_id,
-                    s.start_time,
-                    s.end_time
-                FROM mentor_availability_slots s
-                LEFT JOIN bookings b
-                  ON b.slot_id = s.slot_id
-                 AND b.status IN ('requested', 'confirmed')
-                WHERE s.mentor_id = %s
-                  AND s.start_time >= %s
-                  AND s.end_time <= %s
-                  AND b.booking_id IS NULL
-                ORDER BY s.start_time;
-                """,
-                (mentor_id, from_dt, to_dt),
-            )
-            rows = cur.fetchall()
-        conn.close()
-
-        slots = [
-            {
-                "slot_id": str(r[0]),
-                "start_time": r[1].isoformat() if r[1] else None,
-                "end_time": r[2].isoformat() if r[2] else None,
-            }
-            for r in rows
-        ]
+    return mentor_id, from_dt, to_dt
 
+
+def slots_body(mentor_id: str, from_dt: datetime, to_dt: datetime, user_id: str) -> str:
+    """JSON body listing the mentor's available slots in the window, from the cache when possible."""
+    cache_key = (mentor_id, from_dt.isoformat(), to_dt.isoformat())
+    body = _cache.get(cache_key)
+    if body is not None:
+        return body
+
+    tags = (f"mentor:{mentor_id}",)
+    snapshot = _cache.snapshot(tags)
+
+    # Pure read: replica when configured. Stay on the primary right after a write by
+    # this user or to this mentor's bookings, so a lagging replica can't refill the
+    # cache with slots that were just taken.
+    readonly = not wrote_recently(mentor_id) and not wrote_recently(user_id)
+
+    # Identical concurrent requests share one body; near-identical ones (same
+    # hour-rounded window) share one query. snapshot is part of both keys so a
+    # request arriving after an eviction never joins a query that started before it.
+    body = _body_flight.do(
+        cache_key + (snapshot, readonly),
+        lambda: _build_body(mentor_id, from_dt, to_dt, snapshot, readonly),
+    )
+    _cache.set(cache_key, body, tags, snapshot)
+    return body
+
+
+def _handle(req: func.HttpRequest, user: dict) -> func.HttpResponse:
+    window = parse_window(req)
+    if isinstance(window, func.HttpResponse):
+        return window
+    mentor_id, from_dt, to_dt = window
+
+    try:
+        body = slots_body(mentor_id, from_dt, to_dt, user["user_id"])
         return func.HttpResponse(
-            json.dumps({"ok": True, "mentor_id": str(mentor_id), "count": len(slots), "slots": slots}),
+            body,
             status_code=200,
             mimetype="application/json",
         )
 
+    except Shed:
+        raise
     except Exception as e:
         logging.exception("Availability lookup failed")
         return func.HttpResponse(
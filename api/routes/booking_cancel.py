@@ -5,14 +5,41 @@ import os
 import azure.functions as func
 
 from auth import require_user, AuthError
-from db import get_conn
+from cache import booking_tags, invalidate_tags
+from idempotency import run as run_idempotent
+from admission import run as run_admitted
+from db import connection, mark_write
+from mentor_summary import apply_transition
 from graph_mailer import send_booking_confirmed_email
 
+# booking_id alone can't prune partitions: probes idx_bookings_booking_id in each.
+# Names, emails and the Teams link for the email are the booking's snapshots.
+BOOKING_LOCK_SQL = """
+    SELECT
+        booking_id, slot_id, mentor_id, student_id, status, slot_start_time,
+        mentor_name_snapshot, mentor_email_snapshot, meeting_url_snapshot,
+        student_name_snapshot, student_email_snapshot
+    FROM bookings
+    WHERE booking_id = %s
+    FOR UPDATE;
+"""
+
+# slot_start_time from the lock query pins the update to one partition
+CANCEL_SQL = """
+    UPDATE bookings
+    SET status = 'cancelled',
+        cancelled_at = NOW(),
+        cancelled_by = %s
+    WHERE booking_id = %s
+      AND slot_start_time = %s
+    RETURNING booking_id, slot_id, status, cancelled_at;
+"""
+
 
 def handle(req: func.HttpRequest) -> func.HttpResponse:
     # Auth
     try:
-        _user = require_user(req)
+        user = require_user(req)
     except AuthError as e:
         return func.HttpResponse(
             json.dumps({"ok": False, "error": e.message}),
@@ -20,6 +47,10 @@ def handle(req: func.HttpRequest) -> func.HttpResponse:
             mimetype="application/json",
         )
 
+    return run_admitted(user, "bookings.cancel", lambda: run_idempotent(req, user, "bookings.cancel", lambda: _handle(req)))
+
+
+def _handle(req: func.HttpRequest) -> func.HttpResponse:
     # Parse JSON
     try:
         body = req.get_json()
@@ -47,38 +78,34 @@ def handle(req: func.HttpRequest) -> func.HttpResponse:
             mimetype="application/json",
         )
 
-    # We'll populate these for email after DB commit
-    mentor_name = mentor_email = teams_url = None
-    student_name = student_email = None
-    start_time = None
-
     try:
-        conn = get_conn()
-        with conn.cursor() as cur:
+        with connection() as conn, conn.cursor() as cur:
             # Lock booking row and fetch identifiers we need
-            cur.execute(
-                """
-                SELECT booking_id, slot_id, mentor_id, student_id, status
-                FROM bookings
-                WHERE booking_id = %s
-                FOR UPDATE;
-                """,
-                (booking_id,),
-            )
+            cur.execute(BOOKING_LOCK_SQL, (booking_id,))
             row = cur.fetchone()
             if not row:
-                conn.close()
                 return func.HttpResponse(
                     json.dumps({"ok": False, "error": "Booking not found"}),
                     status_code=404,
                     mimetype="application/json",
                 )
 
-            _booking_id, slot_id, mentor_id, student_id, status = row
+            (
+                _booking_id,
+                slot_id,
+                mentor_id,
+                student_id,
+                status,
+                start_time,
+                mentor_name,
+                mentor_email,
+                teams_url,
+                student_name,
+                student_email,
+            ) = row
 
             # If already cancelled, return slot_id too (no resend)
             if status == "cancelled":
-                conn.close()
                 return func.HttpResponse(
                     json.dumps(
                         {"ok": True, "booking_id": str(_booking_id), "slot_id": str(slot_id), "status": "cancelled"}
@@ -88,61 +115,14 @@ def handle(req: func.HttpRequest) -> func.HttpResponse:
                 )
 
             # Cancel the booking
-            cur.execute(
-                """
-                UPDATE bookings
-                SET status = 'cancelled',
-                    cancelled_at = NOW(),
-                    cancelled_by = %s
-                WHERE booking_id = %s
-                RETURNING booking_id, slot_id, status, cancelled_at;
-                """,
-                (cancelled_by, booking_id),
-            )
+            cur.execute(CANCEL_SQL, (cancelled_by, booking_id, start_time))
             updated = cur.fetchone()
 
-            # Fetch mentor details (name/email/Teams)
-            cur.execute(
-                """
-                SELECT m.display_name, au.email, m.teams_meeting_url
-                FROM mentors m
-                JOIN app_users au ON au.user_id = m.mentor_id
-                WHERE m.mentor_id = %s
-                """,
-                (mentor_id,),
-            )
-            m = cur.fetchone()
-            if m:
-                mentor_name, mentor_email, teams_url = m[0], m[1], m[2]
-
-            # Fetch student details (name/email)
-            cur.execute(
-                """
-                SELECT s.display_name, au.email
-                FROM students s
-                JOIN app_users au ON au.user_id = s.student_id
-                WHERE s.student_id = %s
-                """,
-                (student_id,),
-            )
-            s = cur.fetchone()
-            if s:
-                student_name, student_email = s[0], s[1]
-
-            # Fetch slot start time
-            cur.execute(
-                """
-                SELECT start_time
-                FROM mentor_availability_slots
-                WHERE slot_id = %s
-                """,
-                (slot_id,),
-            )
-            st = cur.fetchone()
-            start_time = st[0] if st else None
+            apply_transition(cur, mentor_id=mentor_id, slot_start_time=start_time, old_status=status, new_status=updated[2])
 
-        conn.commit()
-        conn.close()
+        # Committed: evict locally now; other instances hear it via change_feed
+        invalidate_tags(booking_tags(mentor_id=mentor_id, student_id=student_id, slot_id=slot_id))
+        mark_write(mentor_id, student_id)
 
         # Send cancellation email (best-effort)
         email_status = "not_attempted"
@@ -157,7 +137,7 @@ def handle(req: func.HttpRequest) -> func.HttpResponse:
                     student_email,
                 )
 
-                send_booking_confirmed_email(
+                email_status = send_booking_confirmed_email(
                     from_user=os.environ["M365_FROM_USER"],
                     to_emails=[student_email, mentor_email],
                     subject="DiveInSTEAM: Session cancelled",
@@ -172,8 +152,7 @@ def handle(req: func.HttpRequest) -> func.HttpResponse:
                     ),
                 )
 
-                logging.info("CANCEL_EMAIL_SEND_DONE booking_id=%s", str(updated[0]))
-                email_status = "sent"
+                logging.info("CANCEL_EMAIL_SEND_DONE booking_id=%s email_status=%s", str(updated[0]), email_status)
             except Exception as e:
                 email_status = "failed"
                 email_error = str(e)
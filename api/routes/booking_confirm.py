@@ -5,13 +5,38 @@ import os
 
 from graph_mailer import send_booking_confirmed_email
 from auth import require_user, AuthError
-from db import get_conn
+from cache import booking_tags, invalidate_tags
+from idempotency import run as run_idempotent
+from admission import run as run_admitted
+from db import connection, mark_write
+from mentor_summary import apply_transition
+
+# booking_id alone can't prune partitions: probes idx_bookings_booking_id in each
+BOOKING_LOCK_SQL = """
+    SELECT
+        booking_id, slot_id, mentor_id, student_id, status, note, slot_start_time,
+        mentor_name_snapshot, mentor_email_snapshot, student_name_snapshot, student_email_snapshot
+    FROM bookings
+    WHERE booking_id = %s
+    FOR UPDATE;
+"""
+
+# slot_start_time from the lock query pins the update to one partition
+CONFIRM_SQL = """
+    UPDATE bookings
+    SET status = 'confirmed',
+        confirmed_at = NOW(),
+        meeting_url_snapshot = %s
+    WHERE booking_id = %s
+      AND slot_start_time = %s
+    RETURNING booking_id, status, confirmed_at;
+"""
 
 
 def handle(req: func.HttpRequest) -> func.HttpResponse:
     # Auth
     try:
-        _user = require_user(req)
+        user = require_user(req)
     except AuthError as e:
         return func.HttpResponse(
             json.dumps({"ok": False, "error": e.message}),
@@ -19,6 +44,10 @@ def handle(req: func.HttpRequest) -> func.HttpResponse:
             mimetype="application/json",
         )
 
+    return run_admitted(user, "bookings.confirm", lambda: run_idempotent(req, user, "bookings.confirm", lambda: _handle(req)))
+
+
+def _handle(req: func.HttpRequest) -> func.HttpResponse:
     # Parse JSON
     try:
         body = req.get_json()
@@ -38,35 +67,36 @@ def handle(req: func.HttpRequest) -> func.HttpResponse:
         )
 
     try:
-        conn = get_conn()
-        with conn.cursor() as cur:
+        with connection() as conn, conn.cursor() as cur:
             # 1) Load booking (and lock it so two confirms can't race)
-            cur.execute(
-                """
-                SELECT booking_id, mentor_id, student_id, status,note
-                FROM bookings
-                WHERE booking_id = %s
-                FOR UPDATE;
-                """,
-                (booking_id,),
-            )
+            cur.execute(BOOKING_LOCK_SQL, (booking_id,))
             row = cur.fetchone()
             if not row:
-                conn.close()
                 return func.HttpResponse(
                     json.dumps({"ok": False, "error": "Booking not found"}),
                     status_code=404,
                     mimetype="application/json",
                 )
 
-            _booking_id, mentor_id, student_id, status , note= row
+            (
+                _booking_id,
+                slot_id,
+                mentor_id,
+                student_id,
+                status,
+                note,
+                start_time,
+                mentor_name,
+                mentor_email,
+                student_name,
+                student_email,
+            ) = row
 
             if status == "confirmed":
                 logging.info(
                     "CONFIRM_SKIPPED_ALREADY_CONFIRMED booking_id=%s",
                     str(_booking_id),
                 )
-                conn.close()
                 return func.HttpResponse(
                     json.dumps({"ok": True, "booking_id": str(_booking_id), "status": "confirmed"}),
                     status_code=200,
@@ -74,14 +104,14 @@ def handle(req: func.HttpRequest) -> func.HttpResponse:
                 )
 
             if status != "requested":
-                conn.close()
                 return func.HttpResponse(
                     json.dumps({"ok": False, "error": f"Cannot confirm booking in status '{status}'"}),
                     status_code=409,
                     mimetype="application/json",
                 )
 
-            # 2) Fetch mentor Teams link
+            # 2) Mentor's current Teams link: this is the one snapshotted and emailed.
+            # Names and emails come from the booking's snapshot columns.
             cur.execute(
                 """
                 SELECT teams_meeting_url
@@ -94,95 +124,41 @@ def handle(req: func.HttpRequest) -> func.HttpResponse:
             teams_url = m[0] if m else None
 
             if not teams_url:
-                conn.close()
                 return func.HttpResponse(
                     json.dumps({"ok": False, "error": "Mentor Teams link missing"}),
                     status_code=409,
                     mimetype="application/json",
                 )
-            # Mentor name + email + Teams link (teams link already fetched, but we’ll fetch name/email too)
-            cur.execute(
-                """
-                SELECT
-                m.display_name,
-                au.email,
-                m.teams_meeting_url
-                FROM mentors m
-                JOIN app_users au ON au.user_id = m.mentor_id
-                WHERE m.mentor_id = %s
-                """,
-                (mentor_id,),
-            )
-            m = cur.fetchone()
-            if not m or not m[1] or not m[2]:
-                conn.close()
+            if not mentor_email:
                 return func.HttpResponse(
                     json.dumps({"ok": False, "error": "Mentor profile incomplete (name/email/Teams link missing)"}),
                     status_code=409,
                     mimetype="application/json",
                 )
-            mentor_name, mentor_email, teams_url = m[0], m[1], m[2]
-            
-            # student details
-
-            cur.execute(
-                """
-                SELECT
-                s.display_name,
-                au.email
-                FROM students s
-                JOIN app_users au ON au.user_id = s.student_id
-                WHERE s.student_id = %s
-                """,
-                (student_id,),
-            )
-            s = cur.fetchone()
-            if not s or not s[1]:
-                conn.close()
+            if not student_email:
                 return func.HttpResponse(
                     json.dumps({"ok": False, "error": "Student profile incomplete (name/email missing)"}),
                     status_code=409,
                     mimetype="application/json",
                 )
-            student_name, student_email = s[0], s[1]
-
-
 
             # 3) Confirm booking + snapshot meeting link
-            cur.execute(
-                """
-                UPDATE bookings
-                SET status = 'confirmed',
-                    confirmed_at = NOW(),
-                    meeting_url_snapshot = %s
-                WHERE booking_id = %s
-                RETURNING booking_id, status, confirmed_at;
-                """,
-                (teams_url, booking_id),
-            )
+            cur.execute(CONFIRM_SQL, (teams_url, booking_id, start_time))
             updated = cur.fetchone()
-            
-            cur.execute(
-                """
-                SELECT s.start_time
-                FROM bookings b
-                JOIN mentor_availability_slots s ON s.slot_id = b.slot_id
-                WHERE b.booking_id = %s
-                """,
-                (booking_id,),
-            )
-            start_time = cur.fetchone()[0]
 
+            apply_transition(cur, mentor_id=mentor_id, slot_start_time=start_time, old_status=status, new_status=updated[1])
+
+        # Committed: evict locally now; other instances hear it via change_feed
+        invalidate_tags(booking_tags(mentor_id=mentor_id, student_id=student_id, slot_id=slot_id))
+        mark_write(mentor_id, student_id)
 
-        conn.commit()
-        conn.close()
         logging.info(
             "EMAIL_SEND_START booking_id=%s mentor_email=%s student_email=%s",
             str(updated[0]),
             mentor_email,
             student_email,
         )
-        send_booking_confirmed_email(
+        email_status = send_booking_confirmed_email(
             from_user=os.environ["M365_FROM_USER"],
             to_emails=[student_email, mentor_email],
             subject="DiveInSTEAM: Session confirmed",
@@ -195,7 +171,7 @@ def handle(req: func.HttpRequest) -> func.HttpResponse:
                 + "\nThanks,\nDiveInSTEAM\n"
             ),
         )
-        logging.info("EMAIL_SEND_DONE booking_id=%s", str(updated[0]))
+        logging.info("EMAIL_SEND_DONE booking_id=%s email_status=%s", str(updated[0]), email_status)
         return func.HttpResponse(
             json.dumps(
                 {
@@ -203,6 +179,7 @@ def handle(req: func.HttpRequest) -> func.HttpResponse:
                     "booking_id": str(updated[0]),
                     "status": updated[1],
                     "confirmed_at": updated[2].isoformat() if updated[2] else None,
+                    "email_status": email_status,
                 }
             ),
             status_code=200,
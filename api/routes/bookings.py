@@ -3,15 +3,48 @@ import logging
 import azure.functions as func
 import psycopg
 import uuid
+from datetime import datetime
 
 from auth import require_user, AuthError
-from db import get_conn
+from cache import booking_tags, invalidate_tags
+from idempotency import run as run_idempotent
+from admission import run as run_admitted
+from db import connection, mark_write
+from mentor_summary import apply_transition
+
+SLOT_LOCK_SQL = """
+    SELECT s.mentor_id, s.status, s.start_time
+    FROM mentor_availability_slots s
+    WHERE s.slot_id = %s
+    FOR NO KEY UPDATE OF s NOWAIT;
+"""
+
+FREE_SLOT_SQL = """
+    SELECT s.slot_id, s.mentor_id, s.start_time
+    FROM mentor_availability_slots s
+    WHERE s.mentor_id = %s
+      AND s.status = 'available'
+      AND s.start_time >= %s
+      AND s.start_time < %s
+      AND s.end_time <= %s
+    ORDER BY s.start_time
+    LIMIT 1
+    FOR NO KEY UPDATE OF s SKIP LOCKED;
+"""
+
+# uq_bookings_slot_active prevents double-booking; the insert trigger marks
+# the slot 'booked' in this same transaction.
+INSERT_SQL = """
+    INSERT INTO bookings (booking_id, slot_id, slot_start_time, mentor_id, student_id, status, note)
+    VALUES (%s, %s, %s, %s, %s, 'requested', %s)
+    RETURNING booking_id, status;
+"""
 
 
 def create(req: func.HttpRequest) -> func.HttpResponse:
     # Auth
     try:
-        _user = require_user(req)
+        user = require_user(req)
     except AuthError as e:
         return func.HttpResponse(
             json.dumps({"ok": False, "error": e.message}),
@@ -19,6 +52,10 @@ def create(req: func.HttpRequest) -> func.HttpResponse:
             mimetype="application/json",
         )
 
+    return run_admitted(user, "bookings.create", lambda: run_idempotent(req, user, "bookings.create", lambda: _create(req)))
+
+
+def _create(req: func.HttpRequest) -> func.HttpResponse:
     # Parse JSON
     try:
         body = req.get_json()
@@ -33,60 +70,107 @@ def create(req: func.HttpRequest) -> func.HttpResponse:
     student_id = body.get("student_id")
     note = body.get("note")
 
-    if not slot_id or not student_id:
+    # "Any slot" mode: no slot_id, book the earliest free slot for a mentor in a window
+    mentor_id = body.get("mentor_id")
+    from_ts = body.get("from")
+    to_ts = body.get("to")
+
+    if not student_id or not (slot_id or (mentor_id and from_ts and to_ts)):
         return func.HttpResponse(
-            json.dumps({"ok": False, "error": "Required fields: slot_id, student_id"}),
+            json.dumps({"ok": False, "error": "Required fields: student_id and either slot_id or mentor_id, from, to"}),
             status_code=400,
             mimetype="application/json",
         )
 
-    try:
-        conn = get_conn()
-        with conn.cursor() as cur:
-            # 1) Ensure slot exists + get mentor_id
-            cur.execute(
-                """
-                SELECT mentor_id
-                FROM mentor_availability_slots
-                WHERE slot_id = %s
-                """,
-                (slot_id,),
+    if not slot_id:
+        try:
+            from_dt = datetime.fromisoformat(from_ts.replace("Z", "+00:00"))
+            to_dt = datetime.fromisoformat(to_ts.replace("Z", "+00:00"))
+        except (AttributeError, ValueError):
+            return func.HttpResponse(
+                json.dumps({"ok": False, "error": "Invalid datetime format"}),
+                status_code=400,
+                mimetype="application/json",
             )
-            row = cur.fetchone()
-            if not row:
-                conn.close()
-                return func.HttpResponse(
-                    json.dumps({"ok": False, "error": "Slot not found"}),
-                    status_code=404,
-                    mimetype="application/json",
-                )
 
-            mentor_id = row[0]
+        if to_dt <= from_dt:
+            return func.HttpResponse(
+                json.dumps({"ok": False, "error": "`to` must be after `from`"}),
+                status_code=400,
+                mimetype="application/json",
+            )
+
+    try:
+        with connection() as conn, conn.cursor() as cur:
+            if slot_id:
+                # 1) Lock the slot + get mentor_id. NOWAIT: when another request is
+                # booking the same slot right now, answer 409 immediately instead of
+                # queueing behind it and then failing on the unique index.
+                cur.execute(SLOT_LOCK_SQL, (slot_id,))
+                row = cur.fetchone()
+                if not row:
+                    return func.HttpResponse(
+                        json.dumps({"ok": False, "error": "Slot not found"}),
+                        status_code=404,
+                        mimetype="application/json",
+                    )
+
+                mentor_id, slot_status, slot_start_time = row
+                if slot_status == "booked":
+                    return func.HttpResponse(
+                        json.dumps({"ok": False, "error": "Slot already has a booking"}),
+                        status_code=409,
+                        mimetype="application/json",
+                    )
+                if slot_status != "available":
+                    return func.HttpResponse(
+                        json.dumps({"ok": False, "error": "Slot is not available"}),
+                        status_code=409,
+                        mimetype="application/json",
+                    )
+            else:
+                # 1) Claim the earliest free slot in the window. SKIP LOCKED makes
+                # concurrent requests spread over different free slots instead of
+                # all colliding on the first one. A slot booked by a request that
+                # committed meanwhile fails the status recheck and is passed over.
+                cur.execute(FREE_SLOT_SQL, (mentor_id, from_dt, to_dt, to_dt))
+                row = cur.fetchone()
+                if not row:
+                    return func.HttpResponse(
+                        json.dumps({"ok": False, "error": "No free slot in this window"}),
+                        status_code=409,
+                        mimetype="application/json",
+                    )
+
+                slot_id, mentor_id, slot_start_time = row
 
             # 2) Insert booking request
-            # Expectation: bookings.slot_id is UNIQUE to prevent double-booking.
             booking_id = uuid.uuid4()
 
-            cur.execute(
-                """
-                INSERT INTO bookings (booking_id, slot_id, mentor_id, student_id, status, note)
-                VALUES (%s, %s, %s, %s, 'requested', %s)
-                RETURNING booking_id, status;
-
-                """,
-                (booking_id,slot_id, mentor_id, student_id, note),
-            )
+            cur.execute(INSERT_SQL, (booking_id, slot_id, slot_start_time, mentor_id, student_id, note))
             booking_id, status = cur.fetchone()
 
-        conn.commit()
-        conn.close()
+            apply_transition(cur, mentor_id=mentor_id, slot_start_time=slot_start_time, old_status=None, new_status=status)
+
+        # Committed: evict locally now; other instances hear it via change_feed
+        invalidate_tags(booking_tags(mentor_id=mentor_id, student_id=student_id, slot_id=slot_id))
+        mark_write(mentor_id, student_id)
 
         return func.HttpResponse(
-            json.dumps({"ok": True, "booking_id": str(booking_id), "status": status}),
+            json.dumps({"ok": True, "booking_id": str(booking_id), "slot_id": str(slot_id), "status": status}),
             status_code=201,
             mimetype="application/json",
         )
 
+    except psycopg.errors.LockNotAvailable:
+        # another request holds the slot lock (NOWAIT above). Retry-After marks this as
+        # temporary, so idempotency.run() doesn't replay it to a retry with the same key
+        return func.HttpResponse(
+            json.dumps({"ok": False, "error": "Slot is being booked by another request"}),
+            status_code=409,
+            mimetype="application/json",
+            headers={"Retry-After": "1"},
+        )
     except psycopg.errors.UniqueViolation:
         # slot already has a booking (or booking_id collision, depending on constraints)
         return func.HttpResponse(
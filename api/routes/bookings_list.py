@@ -5,7 +5,38 @@ from datetime import datetime, timezone
 import azure.functions as func
 
 from auth import require_user, AuthError
-from db import get_conn
+from admission import run as run_admitted
+from db import connection
+
+# {where} is "b.mentor_id = %s" or "b.student_id = %s", optionally "AND b.status = %s".
+# Newest first by requested_at, so it reads idx_bookings_mentor_recent /
+# idx_bookings_student_recent in order and stops at the limit. Names, emails and
+# the Teams link come from the booking's snapshot columns (migration 012).
+LIST_SQL = """
+    SELECT
+        b.booking_id,
+        b.slot_id,
+        b.mentor_id,
+        b.student_id,
+        b.status,
+        b.note,
+        b.created_at,
+        b.confirmed_at,
+        b.cancelled_at,
+        b.cancelled_by,
+        s.start_time,
+        s.end_time,
+        b.mentor_name_snapshot,
+        b.mentor_email_snapshot,
+        b.meeting_url_snapshot,
+        b.student_name_snapshot,
+        b.student_email_snapshot
+    FROM bookings b
+    JOIN mentor_availability_slots s ON s.slot_id = b.slot_id AND s.start_time = b.slot_start_time
+    WHERE {where}
+    ORDER BY b.requested_at DESC
+    LIMIT %s;
+"""
 
 
 def _parse_limit(req: func.HttpRequest, default: int = 50, max_limit: int = 200) -> int:
@@ -32,6 +63,10 @@ def handle(req: func.HttpRequest) -> func.HttpResponse:
             mimetype="application/json",
         )
 
+    return run_admitted(user, "bookings.list", lambda: _handle(req, user))
+
+
+def _handle(req: func.HttpRequest, user: dict) -> func.HttpResponse:
     role = (req.params.get("role") or "").strip().lower()  # "mentor" or "student"
     status = (req.params.get("status") or "").strip().lower()  # optional: requested/confirmed/cancelled
     limit = _parse_limit(req)
@@ -54,8 +89,7 @@ def handle(req: func.HttpRequest) -> func.HttpResponse:
     user_id = user["user_id"]
 
     try:
-        conn = get_conn()
-        with conn.cursor() as cur:
+        with connection(readonly=True, user_id=user_id) as conn, conn.cursor() as cur:
             where = []
             params = []
 
@@ -71,42 +105,12 @@ def handle(req: func.HttpRequest) -> func.HttpResponse:
                 params.append(status)
 
             # List newest first; you can later switch to slot time ordering
-            sql = f"""
-                SELECT
-                    b.booking_id,
-                    b.slot_id,
-                    b.mentor_id,
-                    b.student_id,
-                    b.status,
-                    b.note,
-                    b.created_at,
-                    b.confirmed_at,
-                    b.cancelled_at,
-                    b.cancelled_by,
-                    s.start_time,
-                    s.end_time,
-                    m.display_name AS mentor_name,
-                    au_m.email     AS mentor_email,
-                    m.teams_meeting_url,
-                    st.display_name AS student_name,
-                    au_s.email      AS student_email
-                FROM bookings b
-                JOIN mentor_availability_slots s ON s.slot_id = b.slot_id
-                LEFT JOIN mentors m ON m.mentor_id = b.mentor_id
-                LEFT JOIN app_users au_m ON au_m.user_id = b.mentor_id
-                LEFT JOIN students st ON st.student_id = b.student_id
-                LEFT JOIN app_users au_s ON au_s.user_id = b.student_id
-                WHERE {" AND ".join(where)}
-                ORDER BY b.created_at DESC
-                LIMIT %s;
-            """
+            sql = LIST_SQL.format(where=" AND ".join(where))
             params.append(limit)
 
             cur.execute(sql, tuple(params))
             rows = cur.fetchall()
 
-        conn.close()
-
         # Build response objects
         items = []
         for r in rows:
@@ -0,0 +1,321 @@
+import hashlib
+import json
+import logging
+import os
+import secrets
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from urllib.parse import urlsplit
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+import azure.functions as func
+
+from auth import require_user, AuthError
+from admission import run as run_admitted
+from cache import TTLCache
+from db import connection
+from profiles import get_app_user
+
+# Evicted on any booking change for the user (change_feed.py tags bookings with
+# user:<mentor_id> and user:<student_id>), so calendar apps polling every few
+# minutes are answered from memory or with a 304.
+CALENDAR_FEED_CACHE_TTL_SECONDS = int(os.environ.get("CALENDAR_FEED_CACHE_TTL_SECONDS", 3600))
+# Sessions that ended longer ago than this drop out of the feed
+CALENDAR_FEED_PAST_DAYS = int(os.environ.get("CALENDAR_FEED_PAST_DAYS", 30))
+
+_feed_cache = TTLCache("calendar_feed", ttl_seconds=CALENDAR_FEED_CACHE_TTL_SECONDS, max_entries=5000)
+# token hash -> user_id. Token rows don't notify, so another worker may accept a
+# replaced token until this expires.
+_token_cache = TTLCache("calendar_tokens", ttl_seconds=300, max_entries=5000)
+
+# One statement: the user's timezone plus their confirmed sessions. The OR is a
+# BitmapOr over idx_bookings_mentor_confirmed / idx_bookings_student_confirmed; the
+# LEFT JOIN keeps the timezone row when there are no sessions.
+FEED_SQL = """
+    WITH me AS (
+        SELECT COALESCE(
+            (SELECT timezone FROM mentors WHERE mentor_id = %(user_id)s),
+            (SELECT timezone FROM students WHERE student_id = %(user_id)s)
+        ) AS timezone
+    )
+    SELECT
+        me.timezone,
+        x.booking_id,
+        x.mentor_id,
+        x.slot_start_time,
+        x.end_time,
+        x.meeting_url,
+        x.confirmed_at,
+        x.mentor_name,
+        x.student_name
+    FROM me
+    LEFT JOIN (
+        SELECT
+            b.booking_id,
+            b.mentor_id,
+            b.slot_start_time,
+            s.end_time,
+            b.meeting_url_snapshot AS meeting_url,
+            b.confirmed_at,
+            b.mentor_name_snapshot AS mentor_name,
+            b.student_name_snapshot AS student_name
+        FROM bookings b
+        JOIN mentor_availability_slots s ON s.slot_id = b.slot_id AND s.start_time = b.slot_start_time
+        WHERE b.status = 'confirmed'
+          AND (b.mentor_id = %(user_id)s OR b.student_id = %(user_id)s)
+          AND b.slot_start_time >= now() - make_interval(days => %(past_days)s)
+    ) x ON true
+    ORDER BY x.slot_start_time;
+"""
+
+TOKEN_SQL = "SELECT user_id FROM calendar_feed_tokens WHERE token_hash = %s;"
+
+
+def _hash_token(token: str) -> str:
+    return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+
+def _escape(text: str) -> str:
+    # RFC 5545 TEXT values
+    return text.replace("\\", "\\\\").replace(";", "\\;").replace(",", "\\,").replace("\n", "\\n")
+
+
+def _fold(line: str) -> str:
+    # Content lines are at most 75 octets; continuation lines start with a space
+    parts, current, size = [], "", 0
+    for ch in line:
+        n = len(ch.encode("utf-8"))
+        if size + n > 75:
+            parts.append(current)
+            current, size = " ", 1
+        current += ch
+        size += n
+    parts.append(current)
+    return "\r\n".join(parts)
+
+
+def _utc(dt: datetime) -> str:
+    return dt.astimezone(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+
+
+def _zone(name: str | None) -> ZoneInfo:
+    try:
+        return ZoneInfo(name or "UTC")
+    except (ZoneInfoNotFoundError, ValueError):
+        logging.warning("CALENDAR_FEED_BAD_TIMEZONE timezone=%s", name)
+        return ZoneInfo("UTC")
+
+
+def _render(user_id: str, rows: list[tuple]) -> str:
+    tz_name = rows[0][0] if rows else None
+    zone = _zone(tz_name)
+
+    lines = [
+        "BEGIN:VCALENDAR",
+        "VERSION:2.0",
+        "PRODID:-//DiveInSTEAM//Sessions//EN",
+        "CALSCALE:GREGORIAN",
+        "METHOD:PUBLISH",
+        "X-WR-CALNAME:DiveInSTEAM sessions",
+        f"X-WR-TIMEZONE:{zone.key}",
+        "REFRESH-INTERVAL;VALUE=DURATION:PT1H",
+        "X-PUBLISHED-TTL:PT1H",
+    ]
+    for (
+        _tz,
+        booking_id,
+        mentor_id,
+        start_time,
+        end_time,
+        meeting_url,
+        confirmed_at,
+        mentor_name,
+        student_name,
+    ) in rows:
+        if booking_id is None:
+            continue  # no sessions: the single row only carries the timezone
+        other = student_name if str(mentor_id) == user_id else mentor_name
+        # Times are sent in UTC so every client places them correctly; the user's own
+        # timezone is spelled out in the description.
+        local = start_time.astimezone(zone).strftime("%a %d %b %Y %H:%M %Z")
+        description = f"When: {local} ({zone.key})"
+        if meeting_url:
+            description += f"\nTeams link: {meeting_url}"
+
+        lines += [
+            "BEGIN:VEVENT",
+            f"UID:{booking_id}@diveinsteam.org",
+            f"DTSTAMP:{_utc(confirmed_at or start_time)}",
+            f"DTSTART:{_utc(start_time)}",
+            f"DTEND:{_utc(end_time)}",
+            f"SUMMARY:{_escape('Mentoring session with ' + (other or 'DiveInSTEAM'))}",
+            f"DESCRIPTION:{_escape(description)}",
+        ]
+        if meeting_url:
+            lines += ["LOCATION:Microsoft Teams", f"URL:{meeting_url}"]
+        lines += ["STATUS:CONFIRMED", "END:VEVENT"]
+    lines.append("END:VCALENDAR")
+
+    return "".join(_fold(line) + "\r\n" for line in lines)
+
+
+def _build_feed(user_id: str) -> dict:
+    tags = (f"user:{user_id}",)
+    snapshot = _feed_cache.snapshot(tags)
+
+    with connection(readonly=True, user_id=user_id) as conn, conn.cursor() as cur:
+        cur.execute(FEED_SQL, {"user_id": user_id, "past_days": CALENDAR_FEED_PAST_DAYS})
+        rows = cur.fetchall()
+
+    body = _render(user_id, rows)
+    feed = {
+        "body": body,
+        # Content hash: the same on every worker, so a 304 survives rebuilds
+        "etag": '"' + hashlib.sha256(body.encode("utf-8")).hexdigest()[:32] + '"',
+        "last_modified": datetime.now(timezone.utc).replace(microsecond=0),
+    }
+    _feed_cache.set(user_id, feed, tags, snapshot)
+    return feed
+
+
+def _user_for_token(token: str) -> str | None:
+    token_hash = _hash_token(token)
+    user_id = _token_cache.get(token_hash)
+    if user_id is not None:
+        return user_id
+
+    with connection(readonly=True) as conn, conn.cursor() as cur:
+        cur.execute(TOKEN_SQL, (token_hash,))
+        row = cur.fetchone()
+    if not row:
+        return None
+
+    user_id = str(row[0])
+    _token_cache.set(token_hash, user_id, (f"user:{user_id}",))
+    return user_id
+
+
+def _not_modified(req: func.HttpRequest, feed: dict) -> bool:
+    if_none_match = req.headers.get("If-None-Match")
+    if if_none_match:
+        tags = [t.strip() for t in if_none_match.split(",")]
+        return "*" in tags or feed["etag"] in tags or f"W/{feed['etag']}" in tags
+
+    if_modified_since = req.headers.get("If-Modified-Since")
+    if if_modified_since:
+        try:
+            return feed["last_modified"] <= parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+    return False
+
+
+def _handle_feed(req: func.HttpRequest, user_id: str) -> func.HttpResponse:
+    try:
+        feed = _feed_cache.get(user_id)
+        if feed is None:
+            feed = _build_feed(user_id)
+    except Exception as e:
+        logging.exception("Calendar feed failed")
+        return func.HttpResponse(
+            json.dumps({"ok": False, "error": str(e)}),
+            status_code=500,
+            mimetype="application/json",
+        )
+
+    headers = {
+        "ETag": feed["etag"],
+        "Last-Modified": format_datetime(feed["last_modified"], usegmt=True),
+        "Cache-Control": "private, max-age=300",
+    }
+    if _not_modified(req, feed):
+        return func.HttpResponse(status_code=304, headers=headers)
+
+    return func.HttpResponse(
+        feed["body"],
+        status_code=200,
+        mimetype="text/calendar",
+        charset="utf-8",
+        headers=headers,
+    )
+
+
+def feed(req: func.HttpRequest) -> func.HttpResponse:
+    """GET /calendar/feed?token=... (no Supabase header: calendar apps can't send one)."""
+    token = req.params.get("token", "")
+    if not token:
+        return func.HttpResponse(
+            json.dumps({"ok": False, "error": "Required param: token"}),
+            status_code=400,
+            mimetype="application/json",
+        )
+
+    try:
+        user_id = _user_for_token(token)
+    except Exception as e:
+        logging.exception("Calendar token lookup failed")
+        return func.HttpResponse(
+            json.dumps({"ok": False, "error": str(e)}),
+            status_code=500,
+            mimetype="application/json",
+        )
+
+    if user_id is None:
+        return func.HttpResponse(
+            json.dumps({"ok": False, "error": "Calendar feed not found"}),
+            status_code=404,
+            mimetype="application/json",
+        )
+
+    return run_admitted({"user_id": user_id}, "calendar.feed", lambda: _handle_feed(req, user_id))
+
+
+def issue_token(req: func.HttpRequest) -> func.HttpResponse:
+    """POST /calendar/token: new feed URL for the caller. Any previous URL stops working."""
+    # Auth
+    try:
+        user = require_user(req)
+    except AuthError as e:
+        return func.HttpResponse(
+            json.dumps({"ok": False, "error": e.message}),
+            status_code=e.status_code,
+            mimetype="application/json",
+        )
+
+    user_id = user["user_id"]
+    token = secrets.token_urlsafe(32)
+
+    try:
+        if not get_app_user(user_id):
+            return func.HttpResponse(
+                json.dumps({"ok": False, "error": "User not registered in app"}),
+                status_code=403,
+                mimetype="application/json",
+            )
+
+        with connection() as conn, conn.cursor() as cur:
+            cur.execute(
+                """
+                INSERT INTO calendar_feed_tokens (user_id, token_hash)
+                VALUES (%s, %s)
+                ON CONFLICT (user_id)
+                DO UPDATE SET token_hash = EXCLUDED.token_hash, created_at = now();
+                """,
+                (user_id, _hash_token(token)),
+            )
+        _token_cache.invalidate_tag(f"user:{user_id}")
+
+    except Exception as e:
+        logging.exception("Calendar token issue failed")
+        return func.HttpResponse(
+            json.dumps({"ok": False, "error": str(e)}),
+            status_code=500,
+            mimetype="application/json",
+        )
+
+    base = urlsplit(req.url)
+    return func.HttpResponse(
+        json.dumps({"ok": True, "feed_url": f"{base.scheme}://{base.netloc}/api/calendar/feed?token={token}"}),
+        status_code=200,
+        mimetype="application/json",
+    )
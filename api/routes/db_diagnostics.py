@@ -0,0 +1,69 @@
+import json
+import logging
+import azure.functions as func
+
+import diagnostics
+from auth import require_user, AuthError
+from profiles import get_app_user
+from statement_stats import top_statements
+
+
+def _parse_top(req: func.HttpRequest, default: int = 20, max_top: int = 100) -> int:
+    raw = req.params.get("top", "")
+    try:
+        n = int(raw) if raw else default
+    except ValueError:
+        return default
+    return min(max(n, 1), max_top)
+
+
+def handle(req: func.HttpRequest) -> func.HttpResponse:
+    """
+    GET /diagnostics/db?top=20 (admins only)
+
+    This worker's per-route DB / HTTP / Python time and per-statement totals,
+    slow query and slow request samples (parameters redacted), and the
+    database-wide pg_stat_statements ranking when the extension is available.
+    """
+    # Auth
+    try:
+        user = require_user(req)
+    except AuthError as e:
+        return func.HttpResponse(
+            json.dumps({"ok": False, "error": e.message}),
+            status_code=e.status_code,
+            mimetype="application/json",
+        )
+
+    top = _parse_top(req)
+
+    try:
+        app_user = get_app_user(user["user_id"])
+        if not app_user or app_user["app_role"] != "admin" or app_user["status"] != "active":
+            return func.HttpResponse(
+                json.dumps({"ok": False, "error": "Admins only"}),
+                status_code=403,
+                mimetype="application/json",
+            )
+
+        return func.HttpResponse(
+            json.dumps(
+                {
+                    "ok": True,
+                    "worker": diagnostics.report(top),
+                    "pg_stat_statements": top_statements(top),
+                },
+                indent=2,
+                default=str,
+            ),
+            status_code=200,
+            mimetype="application/json",
+        )
+
+    except Exception as e:
+        logging.exception("DB diagnostics failed")
+        return func.HttpResponse(
+            json.dumps({"ok": False, "error": str(e)}),
+            status_code=500,
+            mimetype="application/json",
+        )
@@ -0,0 +1,103 @@
+import json
+import logging
+import azure.functions as func
+
+from auth import require_user, AuthError
+from admission import run as run_admitted
+from db import connection
+
+
+SUMMARY_SQL = """
+    SELECT
+        pending_requests,
+        upcoming_confirmed,
+        free_slots_this_week,
+        cancellations_this_term,
+        week_start,
+        week_end,
+        term_start,
+        refreshed_at,
+        updated_at,
+        now() >= week_end AS stale
+    FROM mentor_dashboard_summary
+    WHERE mentor_id = %s;
+"""
+
+
+def handle(req: func.HttpRequest) -> func.HttpResponse:
+    # Auth
+    try:
+        user = require_user(req)
+    except AuthError as e:
+        return func.HttpResponse(
+            json.dumps({"ok": False, "error": e.message}),
+            status_code=e.status_code,
+            mimetype="application/json",
+        )
+
+    return run_admitted(user, "mentor.dashboard", lambda: _handle(req, user))
+
+
+def _handle(req: func.HttpRequest, user: dict) -> func.HttpResponse:
+    # In our model: mentors.mentor_id == app_users.user_id
+    mentor_id = user["user_id"]
+
+    try:
+        with connection() as conn, conn.cursor() as cur:
+            cur.execute(SUMMARY_SQL, (mentor_id,))
+            row = cur.fetchone()
+
+            # First load for this mentor, or the week rolled over since the last
+            # hourly refresh: rebuild this one row from source before answering.
+            if not row or row[9]:
+                cur.execute("SELECT refresh_mentor_dashboard_summary(%s);", (mentor_id,))
+                cur.execute(SUMMARY_SQL, (mentor_id,))
+                row = cur.fetchone()
+
+        if not row:
+            return func.HttpResponse(
+                json.dumps({"ok": False, "error": "Mentor profile not found"}),
+                status_code=404,
+                mimetype="application/json",
+            )
+
+        (
+            pending_requests,
+            upcoming_confirmed,
+            free_slots_this_week,
+            cancellations_this_term,
+            week_start,
+            week_end,
+            term_start,
+            refreshed_at,
+            updated_at,
+            _stale,
+        ) = row
+
+        return func.HttpResponse(
+            json.dumps(
+                {
+                    "ok": True,
+                    "mentor_id": str(mentor_id),
+                    "pending_requests": pending_requests,
+                    "upcoming_confirmed": upcoming_confirmed,
+                    "free_slots_this_week": free_slots_this_week,
+                    "cancellations_this_term": cancellations_this_term,
+                    "week_start": week_start.isoformat(),
+                    "week_end": week_end.isoformat(),
+                    "term_start": term_start.isoformat(),
+                    "refreshed_at": refreshed_at.isoformat(),
+                    "updated_at": updated_at.isoformat(),
+                }
+            ),
+            status_code=200,
+            mimetype="application/json",
+        )
+
+    except Exception as e:
+        logging.exception("Mentor dashboard lookup failed")
+        return func.HttpResponse(
+            json.dumps({"ok": False, "error": str(e)}),
+            status_code=500,
+            mimetype="application/json",
+        )
@@ -0,0 +1,516 @@
+import csv
+import io
+import json
+import logging
+import os
+import re
+import uuid
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+import azure.functions as func
+import psycopg
+
+from auth import require_user, AuthError
+from admission import run as run_admitted
+from db import connection
+from profiles import get_app_user
+
+ROSTER_IMPORT_MAX_ROWS = int(os.environ.get("ROSTER_IMPORT_MAX_ROWS", 50000))
+# Errors listed in the response; error_count is always the full number
+ROSTER_IMPORT_MAX_ERRORS = int(os.environ.get("ROSTER_IMPORT_MAX_ERRORS", 500))
+
+# Column default of mentors.timezone / students.timezone (migration 002)
+DEFAULT_TIMEZONE = "Australia/Brisbane"
+
+COLUMNS = ("email", "role", "display_name", "user_id", "teams_meeting_url", "timezone", "grade", "mentor_email")
+ROLES = {"mentor": "mentor", "mentee": "mentee", "student": "mentee"}
+
+_EMAIL = re.compile(r"^[^@\s]+@[^@\s]+\.[^@\s]+$")
+_zones = {}
+
+# Roster import, all in one transaction:
+#  1) rows are validated as they're parsed and COPYed into a temp staging table
+#  2) rows that clash with the database are deleted from the stage and reported
+#  3) set-based upserts: app_users, mentors, students, mentor_assignments
+# Existing users are matched on email. Roles are never changed by an import.
+# app_users.user_id is the Supabase auth id, so an import never makes one up: a
+# new user's row must carry it, or the account could never sign in (and would hold
+# the email against the real id).
+
+STAGE_SQL = """
+    CREATE TEMP TABLE roster_stage (
+        line int NOT NULL,
+        user_id uuid,
+        given_id boolean NOT NULL,
+        email text NOT NULL,
+        app_role text NOT NULL,
+        display_name text,
+        teams_meeting_url text,
+        timezone text,
+        grade int,
+        mentor_email text
+    ) ON COMMIT DROP;
+"""
+
+COPY_SQL = """
+    COPY roster_stage (
+        line, user_id, given_id, email, app_role,
+        display_name, teams_meeting_url, timezone, grade, mentor_email
+    ) FROM STDIN
+"""
+
+# A row that names its user_id can't take another user's email
+REJECT_EMAIL_TAKEN_SQL = """
+    DELETE FROM roster_stage s
+    USING app_users u
+    WHERE s.given_id
+      AND u.email = s.email
+      AND u.user_id <> s.user_id
+    RETURNING s.line, 'email already belongs to another user';
+"""
+
+# Rows without a user_id take the id of the existing user with their email
+RESOLVE_SQL = """
+    UPDATE roster_stage s
+    SET user_id = u.user_id
+    FROM app_users u
+    WHERE NOT s.given_id
+      AND u.email = s.email;
+"""
+
+# Each returns (line, error) for the rows it removes from the stage
+REJECT_NO_USER_ID_SQL = """
+    DELETE FROM roster_stage s
+    WHERE s.user_id IS NULL
+    RETURNING s.line, 'user_id (the Supabase user id) is required for a new user';
+"""
+
+REJECT_DUPLICATE_SQL = """
+    DELETE FROM roster_stage s
+    USING (
+        SELECT user_id FROM roster_stage GROUP BY user_id HAVING count(*) > 1
+    ) d
+    WHERE s.user_id = d.user_id
+    RETURNING s.line, 'another row in this roster is the same user';
+"""
+
+REJECT_ROLE_SQL = """
+    DELETE FROM roster_stage s
+    USING app_users u
+    WHERE u.user_id = s.user_id
+      AND u.app_role <> s.app_role
+    RETURNING s.line, 'existing user has role ' || u.app_role;
+"""
+
+REJECT_UNKNOWN_MENTOR_SQL = """
+    DELETE FROM roster_stage s
+    WHERE s.mentor_email IS NOT NULL
+      AND NOT EXISTS (
+          SELECT 1 FROM roster_stage r WHERE r.email = s.mentor_email AND r.app_role = 'mentor'
+      )
+      AND NOT EXISTS (
+          SELECT 1
+          FROM app_users u
+          JOIN mentors m ON m.mentor_id = u.user_id
+          WHERE u.email = s.mentor_email
+      )
+    RETURNING s.line, 'mentor_email is not a mentor in this roster or the database';
+"""
+
+REJECT_SQL = (
+    REJECT_NO_USER_ID_SQL,
+    REJECT_DUPLICATE_SQL,
+    REJECT_ROLE_SQL,
+    REJECT_UNKNOWN_MENTOR_SQL,
+)
+
+# Upserts. Updates skip unchanged rows so a re-import doesn't touch (or re-snapshot)
+# anything.
+USERS_UPDATE_SQL = """
+    UPDATE app_users u
+    SET email = s.email,
+        updated_at = now()
+    FROM roster_stage s
+    WHERE u.user_id = s.user_id
+      AND u.email IS DISTINCT FROM s.email;
+"""
+
+USERS_INSERT_SQL = """
+    INSERT INTO app_users (user_id, email, app_role)
+    SELECT user_id, email, app_role
+    FROM roster_stage
+    ON CONFLICT (user_id) DO NOTHING;
+"""
+
+MENTORS_UPDATE_SQL = """
+    UPDATE mentors m
+    SET display_name = COALESCE(s.display_name, m.display_name),
+        teams_meeting_url = s.teams_meeting_url,
+        timezone = COALESCE(s.timezone, m.timezone),
+        updated_at = now()
+    FROM roster_stage s
+    WHERE s.app_role = 'mentor'
+      AND m.mentor_id = s.user_id
+      AND (m.display_name, m.teams_meeting_url, m.timezone)
+          IS DISTINCT FROM (COALESCE(s.display_name, m.display_name), s.teams_meeting_url, COALESCE(s.timezone, m.timezone));
+"""
+
+MENTORS_INSERT_SQL = """
+    INSERT INTO mentors (mentor_id, display_name, teams_meeting_url, timezone)
+    SELECT user_id, display_name, teams_meeting_url, COALESCE(timezone, %(default_timezone)s)
+    FROM roster_stage
+    WHERE app_role = 'mentor'
+    ON CONFLICT (mentor_id) DO NOTHING;
+"""
+
+STUDENTS_UPDATE_SQL = """
+    UPDATE students st
+    SET display_name = COALESCE(s.display_name, st.display_name),
+        grade = COALESCE(s.grade, st.grade),
+        timezone = COALESCE(s.timezone, st.timezone),
+        updated_at = now()
+    FROM roster_stage s
+    WHERE s.app_role = 'mentee'
+      AND st.student_id = s.user_id
+      AND (st.display_name, st.grade, st.timezone)
+          IS DISTINCT FROM (COALESCE(s.display_name, st.display_name), COALESCE(s.grade, st.grade), COALESCE(s.timezone, st.timezone));
+"""
+
+STUDENTS_INSERT_SQL = """
+    INSERT INTO students (student_id, display_name, grade, timezone)
+    SELECT user_id, display_name, grade, COALESCE(timezone, %(default_timezone)s)
+    FROM roster_stage
+    WHERE app_role = 'mentee'
+    ON CONFLICT (student_id) DO NOTHING;
+"""
+
+# A new mentor ends the student's current pairing (uq_one_active_mentor_per_student)
+ASSIGNMENTS_END_SQL = """
+    UPDATE mentor_assignments a
+    SET status = 'ended',
+        ended_at = now()
+    FROM roster_stage s
+    JOIN app_users mu ON mu.email = s.mentor_email
+    WHERE a.student_id = s.user_id
+      AND a.status = 'active'
+      AND a.mentor_id <> mu.user_id;
+"""
+
+ASSIGNMENTS_START_SQL = """
+    INSERT INTO mentor_assignments (mentor_id, student_id)
+    SELECT mu.user_id, s.user_id
+    FROM roster_stage s
+    JOIN app_users mu ON mu.email = s.mentor_email
+    ON CONFLICT (mentor_id, student_id) DO UPDATE
+    SET status = 'active',
+        started_at = now(),
+        ended_at = NULL
+    WHERE mentor_assignments.status = 'ended';
+"""
+
+# (counter, sql) in order; the counter gets the statement's rowcount
+UPSERT_SQL = (
+    ("users_updated", USERS_UPDATE_SQL),
+    ("users_created", USERS_INSERT_SQL),
+    ("mentors_updated", MENTORS_UPDATE_SQL),
+    ("mentors_created", MENTORS_INSERT_SQL),
+    ("students_updated", STUDENTS_UPDATE_SQL),
+    ("students_created", STUDENTS_INSERT_SQL),
+    ("assignments_ended", ASSIGNMENTS_END_SQL),
+    ("assignments_started", ASSIGNMENTS_START_SQL),
+)
+
+
+class _RosterError(Exception):
+    """The roster as a whole can't be read (400)."""
+
+
+def _text(value) -> str | None:
+    if value is None:
+        return None
+    value = str(value).strip()
+    return value or None
+
+
+def _email(value, field: str) -> str:
+    email = _text(value)
+    if email is None:
+        raise ValueError(f"{field} is required")
+    email = email.lower()
+    if not _EMAIL.match(email):
+        raise ValueError(f"{field} is not an email address")
+    return email
+
+
+def _timezone(value) -> str | None:
+    tz = _text(value)
+    if tz is None:
+        return None
+    if tz not in _zones:
+        try:
+            ZoneInfo(tz)
+            _zones[tz] = True
+        except (ZoneInfoNotFoundError, ValueError):
+            _zones[tz] = False
+    if not _zones[tz]:
+        raise ValueError(f"unknown timezone {tz!r}")
+    return tz
+
+
+def _validate(raw: dict) -> dict:
+    """One roster record -> the values to stage. Raises ValueError with the reason."""
+    unknown = sorted(k for k in raw if k not in COLUMNS)
+    if unknown:
+        raise ValueError("unknown field(s): " + ", ".join(map(str, unknown)))
+
+    role = ROLES.get((_text(raw.get("role")) or "").lower())
+    if role is None:
+        raise ValueError("role must be mentor or mentee")
+
+    row = {
+        "email": _email(raw.get("email"), "email"),
+        "app_role": role,
+        "display_name": _text(raw.get("display_name")),
+        "teams_meeting_url": _text(raw.get("teams_meeting_url")),
+        "timezone": _timezone(raw.get("timezone")),
+        "grade": None,
+        "mentor_email": None,
+    }
+
+    user_id = _text(raw.get("user_id"))
+    if user_id is None:
+        # Resolved by email against existing users after staging
+        row["user_id"], row["given_id"] = None, False
+    else:
+        try:
+            row["user_id"], row["given_id"] = uuid.UUID(user_id), True
+        except ValueError:
+            raise ValueError("user_id is not a UUID")
+
+    if role == "mentor":
+        if row["teams_meeting_url"] is None:
+            raise ValueError("teams_meeting_url is required for mentors")
+        if not row["teams_meeting_url"].startswith("https://"):
+            raise ValueError("teams_meeting_url must be an https:// link")
+        for field in ("grade", "mentor_email"):
+            if _text(raw.get(field)) is not None:
+                raise ValueError(f"{field} is only for mentees")
+    else:
+        if row["teams_meeting_url"] is not None:
+            raise ValueError("teams_meeting_url is only for mentors")
+        grade = _text(raw.get("grade"))
+        if grade is not None:
+            try:
+                row["grade"] = int(grade)
+            except ValueError:
+                raise ValueError("grade must be a whole number")
+        if _text(raw.get("mentor_email")) is not None:
+            row["mentor_email"] = _email(raw.get("mentor_email"), "mentor_email")
+
+    return row
+
+
+def _records(body: bytes, fmt: str):
+    """Yield (line, record dict or error message), reading the body as it goes."""
+    stream = io.TextIOWrapper(io.BytesIO(body), encoding="utf-8-sig", newline="")
+
+    if fmt == "ndjson":
+        for line_no, line in enumerate(stream, start=1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError:
+                yield line_no, "not valid JSON"
+                continue
+            yield line_no, record if isinstance(record, dict) else "not a JSON object"
+        return
+
+    reader = csv.DictReader(stream)
+    header = [h.strip().lower() for h in (reader.fieldnames or [])]
+    missing = [c for c in ("email", "role") if c not in header]
+    if missing:
+        raise _RosterError("CSV header must include: " + ", ".join(missing))
+    unknown = [h for h in header if h not in COLUMNS]
+    if unknown:
+        raise _RosterError("Unknown CSV column(s): " + ", ".join(unknown))
+    reader.fieldnames = header
+
+    for record in reader:
+        if None in record:
+            yield reader.line_num, "more values than columns"
+        else:
+            yield reader.line_num, record
+
+
+def _format(req: func.HttpRequest) -> str | None:
+    fmt = (req.params.get("format") or "").lower()
+    if not fmt:
+        content_type = (req.headers.get("content-type") or "").lower()
+        fmt = "ndjson" if "ndjson" in content_type or "jsonl" in content_type else "csv"
+    return fmt if fmt in ("csv", "ndjson") else None
+
+
+def import_roster(body: bytes, fmt: str, dry_run: bool = False) -> dict:
+    """Validate, stage and upsert a roster in one transaction. Raises _RosterError."""
+    errors = []
+    counts = {}
+    rows = 0
+    seen_emails = {}
+    seen_ids = {}
+
+    with connection() as conn, conn.cursor() as cur:
+        with conn.transaction(force_rollback=dry_run):
+            cur.execute(STAGE_SQL)
+            with cur.copy(COPY_SQL) as copy:
+                for line, record in _records(body, fmt):
+                    rows += 1
+                    if rows > ROSTER_IMPORT_MAX_ROWS:
+                        raise _RosterError(f"Roster has more than {ROSTER_IMPORT_MAX_ROWS} rows")
+                    if isinstance(record, str):
+                        errors.append((line, record))
+                        continue
+                    try:
+                        row = _validate(record)
+                    except ValueError as e:
+                        errors.append((line, str(e)))
+                        continue
+
+                    first = seen_emails.setdefault(row["email"], line)
+                    if first != line:
+                        errors.append((line, f"duplicate email (first on line {first})"))
+                        continue
+                    if row["given_id"]:
+                        first = seen_ids.setdefault(row["user_id"], line)
+                        if first != line:
+                            errors.append((line, f"duplicate user_id (first on line {first})"))
+                            continue
+
+                    copy.write_row(
+                        (
+                            line,
+                            row["user_id"],
+                            row["given_id"],
+                            row["email"],
+                            row["app_role"],
+                            row["display_name"],
+                            row["teams_meeting_url"],
+                            row["timezone"],
+                            row["grade"],
+                            row["mentor_email"],
+                        )
+                    )
+
+            # Temp tables are never auto-analyzed; the joins below need real estimates
+            cur.execute("ANALYZE roster_stage;")
+
+            cur.execute(REJECT_EMAIL_TAKEN_SQL)
+            errors.extend(cur.fetchall())
+            cur.execute(RESOLVE_SQL)
+            for sql in REJECT_SQL:
+                cur.execute(sql)
+                errors.extend(cur.fetchall())
+
+            params = {"default_timezone": DEFAULT_TIMEZONE}
+            for counter, sql in UPSERT_SQL:
+                cur.execute(sql, params)
+                counts[counter] = max(cur.rowcount, 0)
+
+    errors.sort()
+    return {
+        "dry_run": dry_run,
+        "rows": rows,
+        "imported": rows - len(errors),
+        "error_count": len(errors),
+        "errors": [{"line": line, "error": error} for line, error in errors[:ROSTER_IMPORT_MAX_ERRORS]],
+        **counts,
+    }
+
+
+def handle(req: func.HttpRequest) -> func.HttpResponse:
+    """
+    POST /roster/import?format=csv|ndjson&dry_run=1 (admins only)
+
+    One row per person: email, role (mentor | mentee), and optionally
+    display_name, user_id (the Supabase user id), timezone, teams_meeting_url
+    (mentors, required), grade and mentor_email (mentees). Valid rows are
+    imported and the rest reported by line; dry_run=1 reports without saving.
+
+    user_id is required for anyone not in app_users yet: it must be their
+    Supabase auth id, or they could never sign in. A row without one only
+    updates the existing user with that email. A row whose user_id differs
+    from the existing user with its email is rejected.
+    """
+    # Auth
+    try:
+        user = require_user(req)
+    except AuthError as e:
+        return func.HttpResponse(
+            json.dumps({"ok": False, "error": e.message}),
+            status_code=e.status_code,
+            mimetype="application/json",
+        )
+
+    return run_admitted(user, "roster.import", lambda: _handle(req, user))
+
+
+def _handle(req: func.HttpRequest, user: dict) -> func.HttpResponse:
+    fmt = _format(req)
+    if fmt is None:
+        return func.HttpResponse(
+            json.dumps({"ok": False, "error": "format must be csv or ndjson"}),
+            status_code=400,
+            mimetype="application/json",
+        )
+    dry_run = req.params.get("dry_run", "").lower() in ("1", "true", "yes")
+
+    try:
+        app_user = get_app_user(user["user_id"])
+        if not app_user or app_user["app_role"] != "admin" or app_user["status"] != "active":
+            return func.HttpResponse(
+                json.dumps({"ok": False, "error": "Admins only"}),
+                status_code=403,
+                mimetype="application/json",
+            )
+
+        result = import_roster(req.get_body(), fmt, dry_run=dry_run)
+        logging.info(
+            "ROSTER_IMPORT user_id=%s dry_run=%s rows=%s imported=%s errors=%s",
+            user["user_id"],
+            dry_run,
+            result["rows"],
+            result["imported"],
+            result["error_count"],
+        )
+        return func.HttpResponse(
+            json.dumps({"ok": True, **result}),
+            status_code=200,
+            mimetype="application/json",
+        )
+
+    except _RosterError as e:
+        return func.HttpResponse(
+            json.dumps({"ok": False, "error": str(e)}),
+            status_code=400,
+            mimetype="application/json",
+        )
+    except UnicodeDecodeError:
+        return func.HttpResponse(
+            json.dumps({"ok": False, "error": "Roster must be UTF-8"}),
+            status_code=400,
+            mimetype="application/json",
+        )
+    except psycopg.errors.UniqueViolation as e:
+        # e.g. two users swapping emails in one roster
+        return func.HttpResponse(
+            json.dumps({"ok": False, "error": f"Roster conflicts with existing users: {e.diag.message_detail or e}"}),
+            status_code=409,
+            mimetype="application/json",
+        )
+    except Exception as e:
+        logging.exception("Roster import failed")
+        return func.HttpResponse(
+            json.dumps({"ok": False, "error": str(e)}),
+            status_code=500,
+            mimetype="application/json",
+        )
@@ -0,0 +1,125 @@
+import json
+import logging
+import os
+import threading
+import azure.functions as func
+
+import change_feed
+import slot_events
+from auth import require_user, AuthError
+from admission import Shed, run as run_admitted
+from routes.availability import parse_window, slots_body
+
+# Functions HTTP responses are buffered, so this is a bounded long poll that speaks
+# the text/event-stream format: each response carries the events that happened since
+# Last-Event-ID (or a snapshot) and the client reconnects, resuming from the last id.
+SLOT_STREAM_WAIT_SECONDS = float(os.environ.get("SLOT_STREAM_WAIT_SECONDS", 25))
+SLOT_STREAM_RETRY_MS = int(os.environ.get("SLOT_STREAM_RETRY_MS", 500))
+# Slower reconnects while this worker has no live feed or is at its waiter cap
+SLOT_STREAM_BACKOFF_RETRY_MS = int(os.environ.get("SLOT_STREAM_BACKOFF_RETRY_MS", 5000))
+# Each waiting request holds one of the Functions worker's threads (but no DB
+# connection). By default half of them may wait, and never all: the rest serve
+# every other route. The pool size is PYTHON_THREADPOOL_THREAD_COUNT, or
+# ThreadPoolExecutor's default when unset.
+_THREAD_COUNT = int(os.environ.get("PYTHON_THREADPOOL_THREAD_COUNT") or 0) or min(32, (os.cpu_count() or 1) + 4)
+SLOT_STREAM_MAX_WAITERS = min(
+    int(os.environ.get("SLOT_STREAM_MAX_WAITERS", _THREAD_COUNT // 2)),
+    _THREAD_COUNT - 1,
+)
+
+_waiters = threading.BoundedSemaphore(max(1, SLOT_STREAM_MAX_WAITERS))
+
+
+def _response(chunks: list[str], retry_ms: int) -> func.HttpResponse:
+    return func.HttpResponse(
+        f"retry: {retry_ms}\n\n" + "".join(chunks),
+        status_code=200,
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache"},
+    )
+
+
+def _frame(event_id: str, name: str, data: str) -> str:
+    return f"id: {event_id}\nevent: {name}\ndata: {data}\n\n"
+
+
+def _snapshot(mentor_id, from_dt, to_dt, user: dict, retry_ms: int) -> func.HttpResponse:
+    # Taken before the read: events between the two are sent again next time, never lost
+    event_id = slot_events.current_id()
+    try:
+        body = slots_body(mentor_id, from_dt, to_dt, user["user_id"])
+    except Shed:
+        raise
+    except Exception as e:
+        logging.exception("Slot stream snapshot failed")
+        return func.HttpResponse(
+            json.dumps({"ok": False, "error": str(e)}),
+            status_code=500,
+            mimetype="application/json",
+        )
+    return _response([_frame(event_id, "snapshot", body)], retry_ms)
+
+
+def handle(req: func.HttpRequest) -> func.HttpResponse:
+    """
+    GET /slots/stream?mentor_id=&from=&to=
+
+    Send Last-Event-ID (header, or last_event_id param) from the previous
+    response; any worker can resume it. Without one, or when it can't be
+    resumed (see slot_events.py), the response is a single "snapshot" event
+    with the availability body. Otherwise it holds
+    until slot_added / slot_taken / slot_freed / slot_removed / slot_updated
+    events arrive for the window, or SLOT_STREAM_WAIT_SECONDS pass.
+    """
+    # Auth
+    try:
+        user = require_user(req)
+    except AuthError as e:
+        return func.HttpResponse(
+            json.dumps({"ok": False, "error": e.message}),
+            status_code=e.status_code,
+            mimetype="application/json",
+        )
+
+    window = parse_window(req)
+    if isinstance(window, func.HttpResponse):
+        return window
+    mentor_id, from_dt, to_dt = window
+
+    last_id = req.headers.get("Last-Event-ID") or req.params.get("last_event_id")
+
+    # Snapshots are availability reads and share its limits (slots_body takes the
+    # in-flight slot only if it runs the query); waiting does no DB work
+    if not change_feed.state()["connected"]:
+        # No live events here: degrade to polling snapshots
+        return run_admitted(
+            user,
+            "availability",
+            lambda: _snapshot(mentor_id, from_dt, to_dt, user, SLOT_STREAM_BACKOFF_RETRY_MS),
+            hold_slots=False,
+        )
+
+    result = None
+    if last_id:
+        if not _waiters.acquire(blocking=False):
+            logging.info("SLOT_STREAM_BUSY user_id=%s", user["user_id"])
+            return _response([f": busy\nid: {last_id}\n\n"], SLOT_STREAM_BACKOFF_RETRY_MS)
+        try:
+            result = slot_events.wait(mentor_id, last_id, from_dt, to_dt, SLOT_STREAM_WAIT_SECONDS)
+        finally:
+            _waiters.release()
+
+    if result is None:
+        return run_admitted(
+            user,
+            "availability",
+            lambda: _snapshot(mentor_id, from_dt, to_dt, user, SLOT_STREAM_RETRY_MS),
+            hold_slots=False,
+        )
+
+    events, next_id = result
+    chunks = [_frame(event_id, item["type"], json.dumps(item)) for event_id, item in events]
+    if not events or events[-1][0] != next_id:
+        # id-only message: moves the client past events for other mentors/windows
+        chunks.append(f": keep-alive\nid: {next_id}\n\n")
+    return _response(chunks, SLOT_STREAM_RETRY_MS)
@@ -0,0 +1,63 @@
+import threading
+
+# Per-worker request coalescing: concurrent calls with the same key share one
+# execution of the work and all get its result (or its exception).
+
+_groups = []
+_registry_lock = threading.Lock()
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    def __init__(self, name: str):
+        self.name = name
+        self._calls = {}
+        self._lock = threading.Lock()
+        self.executions = 0
+        self.shared = 0
+        with _registry_lock:
+            _groups.append(self)
+
+    def do(self, key, fn):
+        """Run fn() unless a call for key is already running, in which case wait for its result."""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                self.executions += 1
+            else:
+                self.shared += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+            return call.result
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"executions": self.executions, "shared": self.shared, "in_flight": len(self._calls)}
+
+
+def stats() -> dict:
+    with _registry_lock:
+        groups = list(_groups)
+    return {g.name: g.stats() for g in groups}
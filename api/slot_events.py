@@ -0,0 +1,191 @@
+import os
+import threading
+import time
+import uuid
+from collections import deque
+from datetime import datetime
+
+import change_feed
+
+# Live slot events for GET /slots/stream (routes/slot_stream.py). Slot notifications
+# from the change feed are turned into client events and kept in a per-worker ring
+# buffer; stream requests block on it until something changes for their mentor.
+#
+# Event ids are "<generation>.<seq>.<issued_ms>". The generation changes when the worker
+# restarts or its listener reconnects (notifications may have been missed in between).
+# An id of the current generation resumes exactly at seq. Any other id, usually one
+# issued by another worker behind the load balancer, resumes by time instead: every
+# event this worker received since issued_ms, less SLOT_EVENTS_RESUME_MARGIN_SECONDS
+# for clock skew and notification delay, is sent again (clients may see a few events
+# twice). Only when this worker wasn't listening yet at that time, or has dropped events
+# since, is the client sent a fresh snapshot.
+
+SLOT_EVENTS_BUFFER_SIZE = int(os.environ.get("SLOT_EVENTS_BUFFER_SIZE", 5000))
+SLOT_EVENTS_RESUME_MARGIN_SECONDS = float(os.environ.get("SLOT_EVENTS_RESUME_MARGIN_SECONDS", 2))
+
+_WORKER_ID = uuid.uuid4().hex[:8]
+
+_cond = threading.Condition()
+_buffer = deque(maxlen=SLOT_EVENTS_BUFFER_SIZE)  # (seq, received, mentor_id, start, end, event)
+_seq = 0
+_evicted_seq = 0  # highest seq that fell out of the buffer
+_evicted_at = 0.0  # and when it was received (time.time())
+_waiting = 0
+
+
+def _kind(event: dict) -> str | None:
+    op = event.get("op")
+    status = event.get("status")
+    if op == "DELETE":
+        return "slot_removed"
+    if op == "INSERT":
+        return "slot_added" if status == "available" else None
+    if op == "UPDATE":
+        old_status = event.get("old_status")
+        if old_status == status:
+            return "slot_updated"
+        if status == "booked":
+            return "slot_taken"
+        if status == "available":
+            return "slot_freed"
+        return "slot_removed"
+    return None
+
+
+def _parse_time(value) -> datetime | None:
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(str(value).replace("Z", "+00:00"))
+    except ValueError:
+        return None
+
+
+def _on_change(event: dict) -> None:
+    global _seq, _evicted_seq, _evicted_at
+    if event.get("table") != "mentor_availability_slots":
+        return
+    kind = _kind(event)
+    mentor_id = event.get("mentor_id")
+    if kind is None or not mentor_id:
+        return
+
+    item = {
+        "type": kind,
+        "slot_id": event.get("slot_id"),
+        "status": event.get("status"),
+        "start_time": event.get("start_time"),
+        "end_time": event.get("end_time"),
+    }
+    with _cond:
+        if len(_buffer) == _buffer.maxlen:
+            _evicted_seq, _evicted_at = _buffer[0][0], _buffer[0][1]
+        _seq += 1
+        _buffer.append(
+            (_seq, time.time(), mentor_id, _parse_time(item["start_time"]), _parse_time(item["end_time"]), item)
+        )
+        _cond.notify_all()
+
+
+change_feed.subscribe(_on_change)
+
+
+def _generation() -> str:
+    return f"{_WORKER_ID}-{change_feed.state()['reconnects']}"
+
+
+def _event_id(generation: str, seq: int) -> str:
+    return f"{generation}.{seq}.{int(time.time() * 1000)}"
+
+
+def current_id() -> str:
+    """Id of the latest event; take it before reading a snapshot so nothing after it is missed."""
+    with _cond:
+        return _event_id(_generation(), _seq)
+
+
+def _resume_seq(last_id: str, generation: str) -> int | None:
+    # The local seq to send events after, or None if last_id can't be resumed here.
+    # Caller holds _cond.
+    parts = (last_id or "").split(".")
+    if len(parts) != 3:
+        return None
+    try:
+        seq = int(parts[1])
+        issued = int(parts[2]) / 1000.0
+    except ValueError:
+        return None
+
+    if parts[0] == generation:
+        return seq if _evicted_seq <= seq <= _seq else None
+
+    since = issued - SLOT_EVENTS_RESUME_MARGIN_SECONDS
+    listening_since = change_feed.state()["listening_since"]
+    if listening_since is None or since < listening_since or since <= _evicted_at:
+        return None
+    for s, received, *_ in reversed(_buffer):
+        if received < since:
+            return s
+    return _evicted_seq
+
+
+def _in_window(start: datetime | None, end: datetime | None, from_dt: datetime, to_dt: datetime) -> bool:
+    # Same bounds as the availability query; events without times are always sent
+    if start is None or end is None:
+        return True
+    return start >= from_dt and end <= to_dt
+
+
+def wait(mentor_id: str, last_id: str, from_dt: datetime, to_dt: datetime, timeout: float) -> tuple[list, str] | None:
+    """
+    Events for mentor_id's slots in [from_dt, to_dt] after last_id, waiting up to
+    timeout seconds for the first one.
+
+    Returns (events, next_id): events as (event_id, event) pairs, possibly empty
+    on timeout, and next_id to resume from. last_id may come from any worker.
+    Returns None when it can't be resumed on this one; the caller should send
+    a snapshot.
+    """
+    global _waiting
+    deadline = time.monotonic() + timeout
+    with _cond:
+        generation = _generation()
+        seq = _resume_seq(last_id, generation)
+        if seq is None:
+            return None
+
+        _waiting += 1
+        try:
+            while True:
+                # Reconnected while waiting: notifications may have been missed
+                if _generation() != generation or seq < _evicted_seq:
+                    return None
+
+                found = []
+                for s, _, m, start, end, item in reversed(_buffer):
+                    if s <= seq:
+                        break
+                    if m == mentor_id and _in_window(start, end, from_dt, to_dt):
+                        found.append((_event_id(generation, s), item))
+                # Nothing else for this client up to _seq, so it can resume from there
+                next_id = _event_id(generation, _seq)
+                if found:
+                    found.reverse()
+                    return found, next_id
+
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return [], next_id
+                _cond.wait(remaining)
+        finally:
+            _waiting -= 1
+
+
+def stats() -> dict:
+    with _cond:
+        return {
+            "generation": _generation(),
+            "seq": _seq,
+            "buffered": len(_buffer),
+            "waiting": _waiting,
+        }
@@ -0,0 +1,26 @@
+from db import connection
+
+
+def find_drift(limit: int = 100) -> list[dict]:
+    """
+    Slots whose status disagrees with their requested/confirmed bookings.
+
+    mentor_availability_slots.status is maintained by trg_bookings_sync_slot_status
+    (db/migrations/006_maintain_slot_status.sql) and GET /availability trusts it,
+    so this should always be empty.
+    """
+    with connection() as conn, conn.cursor() as cur:
+        cur.execute(
+            "SELECT slot_id, mentor_id, slot_status, active_bookings FROM slot_status_drift(%s);",
+            (limit,),
+        )
+        rows = cur.fetchall()
+    return [
+        {
+            "slot_id": str(r[0]),
+            "mentor_id": str(r[1]),
+            "status": r[2],
+            "active_bookings": r[3],
+        }
+        for r in rows
+    ]
@@ -0,0 +1,61 @@
+import logging
+
+import psycopg
+
+from db import connection
+
+# Cluster-wide view from pg_stat_statements (needs the extension and
+# shared_preload_libraries; on Azure also azure.extensions). Query texts are
+# already normalised by Postgres ($1, $2 ...), so no parameter values leak.
+
+_SQL = """
+    SELECT
+        queryid,
+        calls,
+        {total} AS total_ms,
+        {mean} AS mean_ms,
+        rows,
+        shared_blks_hit,
+        shared_blks_read,
+        left(query, 400) AS query,
+        sum({total}) OVER () AS all_ms
+    FROM pg_stat_statements
+    WHERE dbid = (SELECT oid FROM pg_database WHERE datname = current_database())
+    ORDER BY {total} DESC
+    LIMIT %s;
+"""
+
+
+def top_statements(limit: int = 20) -> dict:
+    """Statements in this database ranked by total execution time, or why they're unavailable."""
+    try:
+        with connection() as conn, conn.cursor() as cur:
+            try:
+                with conn.transaction():
+                    cur.execute(_SQL.format(total="total_exec_time", mean="mean_exec_time"), (limit,))
+            except psycopg.errors.UndefinedColumn:
+                # Postgres 12 and older
+                cur.execute(_SQL.format(total="total_time", mean="mean_time"), (limit,))
+            rows = cur.fetchall()
+    except (psycopg.errors.UndefinedTable, psycopg.errors.ObjectNotInPrerequisiteState) as e:
+        return {"available": False, "error": str(e).strip()}
+    except psycopg.Error as e:
+        logging.warning("PG_STAT_STATEMENTS_FAILED error=%s", e)
+        return {"available": False, "error": str(e).strip()}
+
+    return {
+        "available": True,
+        "statements": [
+            {
+                "queryid": r[0],
+                "calls": r[1],
+                "total_ms": round(r[2], 1),
+                "mean_ms": round(r[3], 2),
+                "share": round(r[2] / r[8], 4) if r[8] else None,
+                "rows": r[4],
+                "cache_hit_ratio": round(r[5] / (r[5] + r[6]), 4) if (r[5] + r[6]) else None,
+                "query": r[7],
+            }
+            for r in rows
+        ],
+    }
@@ -0,0 +1,500 @@
+"""
+Apply db/migrations/ in order without stalling bookings.
+
+Each file is split into statements and run as steps:
+
+  - plain statements run together in one transaction with a short
+    lock_timeout, retried when a lock isn't granted in time, so DDL never
+    queues in front of booking writes for long
+  - CREATE INDEX / DROP INDEX / REINDEX ... CONCURRENTLY (and VACUUM) run on
+    their own outside any transaction. On a partitioned table the index is
+    built partition by partition and attached, since Postgres can't build it
+    CONCURRENTLY in one go. An INVALID index left by an interrupted build is
+    dropped and rebuilt.
+  - a statement after a "-- migrate:batch size=5000 pause=0.2" line is run
+    again and again, one transaction each, until it changes no rows. It must
+    update at most :batch_size rows per run and make progress every run.
+
+BEGIN/COMMIT in a file are ignored: the runner owns the transactions. Applied
+versions are recorded in schema_migrations with the file's SHA-256 and per
+step timings, and a changed file stops the run. Steps that run outside a
+transaction are not rolled back when a later step fails, so write them to be
+re-runnable (IF NOT EXISTS and the like).
+
+    python db/migrate.py status
+    python db/migrate.py baseline --through 012   # already applied by hand
+    python db/migrate.py up [--target 013] [--dry-run]
+
+Uses the same PG* environment variables as loadtest/seed.py.
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import re
+import sys
+import time
+from pathlib import Path
+
+import psycopg
+
+MIGRATIONS = Path(__file__).resolve().parent / "migrations"
+
+LOCK_TIMEOUT = "5s"
+LOCK_RETRIES = 10
+LOCK_RETRY_PAUSE_SECONDS = 2.0
+
+# Any id, as long as every runner uses the same one
+_ADVISORY_LOCK_ID = 4_410_046
+
+_DIRECTIVE = re.compile(r"^\s*--\s*migrate:(\w+)(.*)$", re.MULTILINE)
+_TRANSACTION_CONTROL = re.compile(r"^(BEGIN|COMMIT|END|START\s+TRANSACTION|ROLLBACK)\b", re.IGNORECASE)
+_NON_TRANSACTIONAL = re.compile(
+    r"^(?:(?:CREATE\s+(?:UNIQUE\s+)?INDEX|DROP\s+INDEX|REINDEX)\b[^;]*?\bCONCURRENTLY\b"
+    r"|ALTER\s+TABLE\b[^;]*?\bDETACH\s+PARTITION\b[^;]*?\bCONCURRENTLY\b"
+    r"|VACUUM\b)",
+    re.IGNORECASE | re.DOTALL,
+)
+_CREATE_INDEX_CONCURRENTLY = re.compile(
+    r"^CREATE\s+(?P<unique>UNIQUE\s+)?INDEX\s+CONCURRENTLY\s+(?:IF\s+NOT\s+EXISTS\s+)?"
+    r"(?P<name>[\w.\"]+)\s+ON\s+(?:ONLY\s+)?(?P<table>[\w.\"]+)\s*(?P<rest>(?:USING\b|\().*)$",
+    re.IGNORECASE | re.DOTALL,
+)
+_BATCH_SIZE = re.compile(r"(?<!:):batch_size\b")
+
+SCHEMA_SQL = """
+    CREATE TABLE IF NOT EXISTS schema_migrations (
+        version text PRIMARY KEY,
+        name text NOT NULL,
+        checksum text NOT NULL,
+        applied_at timestamptz NOT NULL DEFAULT now(),
+        duration_ms int,
+        steps jsonb
+    );
+"""
+
+
+def connect():
+    return psycopg.connect(
+        host=os.environ.get("PGHOST", "localhost"),
+        user=os.environ.get("PGUSER", "postgres"),
+        password=os.environ.get("PGPASSWORD", ""),
+        dbname=os.environ.get("PGDATABASE", "postgres"),
+        port=int(os.environ.get("PGPORT", 5432)),
+        sslmode=os.environ.get("PGSSLMODE", "disable"),
+        autocommit=True,
+    )
+
+
+# =========================
+# Parsing
+# =========================
+
+def split_statements(sql: str) -> list[str]:
+    """
+    Split a file on top-level semicolons. Comments stay with the statement
+    that follows them (that's where -- migrate: directives live); quotes,
+    dollar quotes and /* */ comments are skipped over.
+    """
+    statements = []
+    start = i = 0
+    n = len(sql)
+    while i < n:
+        if sql.startswith("--", i) or sql.startswith("/*", i):
+            i = _comment_end(sql, i)
+        elif sql[i] in ("'", '"', "$"):
+            i = _quoted_end(sql, i)
+        elif sql[i] == ";":
+            statements.append(sql[start : i + 1])
+            start = i = i + 1
+        else:
+            i += 1
+    statements.append(sql[start:])
+    return [s.strip() for s in statements if strip_comments(s)]
+
+
+def _comment_end(sql: str, i: int) -> int:
+    if sql.startswith("--", i):
+        end = sql.find("\n", i)
+        return len(sql) if end < 0 else end + 1
+    depth, i = 1, i + 2
+    while i < len(sql) and depth:
+        if sql.startswith("/*", i):
+            depth, i = depth + 1, i + 2
+        elif sql.startswith("*/", i):
+            depth, i = depth - 1, i + 2
+        else:
+            i += 1
+    return i
+
+
+def strip_comments(statement: str) -> str:
+    """Statement text without comments (quotes are left alone)."""
+    out = []
+    i, n = 0, len(statement)
+    while i < n:
+        if statement.startswith("--", i) or statement.startswith("/*", i):
+            i = _comment_end(statement, i)
+            out.append(" ")
+        elif statement[i] in ("'", '"', "$"):
+            # Copy a quoted run verbatim so "--" inside it survives
+            j = _quoted_end(statement, i)
+            out.append(statement[i:j])
+            i = j
+        else:
+            out.append(statement[i])
+            i += 1
+    return "".join(out).strip().rstrip(";").strip()
+
+
+def _quoted_end(sql: str, i: int) -> int:
+    c = sql[i]
+    if c == "$":
+        m = re.match(r"\$(?:[A-Za-z_]\w*)?\$", sql[i:])
+        if not m:
+            return i + 1
+        end = sql.find(m.group(0), i + len(m.group(0)))
+        return len(sql) if end < 0 else end + len(m.group(0))
+    # E'...' strings use backslash escapes
+    escape = c == "'" and i > 0 and sql[i - 1] in "eE" and not (i > 1 and (sql[i - 2].isalnum() or sql[i - 2] == "_"))
+    j = i + 1
+    while j < len(sql):
+        if escape and sql[j] == "\\":
+            j += 2
+            continue
+        if sql[j] == c:
+            if sql.startswith(c * 2, j):
+                j += 2
+                continue
+            return j + 1
+        j += 1
+    return j
+
+
+def _directive(statement: str) -> tuple[str, dict] | None:
+    # Only the comments in front of the statement, never a function body
+    i = 0
+    while i < len(statement):
+        if statement[i].isspace():
+            i += 1
+        elif statement.startswith("--", i) or statement.startswith("/*", i):
+            i = _comment_end(statement, i)
+        else:
+            break
+    m = None
+    for m in _DIRECTIVE.finditer(statement[:i]):
+        pass
+    if m is None:
+        return None
+    options = dict(part.split("=", 1) for part in m.group(2).split() if "=" in part)
+    return m.group(1).lower(), options
+
+
+def plan(sql: str) -> list[dict]:
+    """The steps for one migration file."""
+    steps = []
+    for statement in split_statements(sql):
+        body = strip_comments(statement)
+        directive = _directive(statement)
+        if _TRANSACTION_CONTROL.match(body):
+            continue
+        if directive and directive[0] == "batch":
+            options = directive[1]
+            steps.append(
+                {
+                    "kind": "batch",
+                    "sql": body,
+                    "size": int(options.get("size", 5000)),
+                    "pause": float(options.get("pause", 0.1)),
+                }
+            )
+        elif directive:
+            raise ValueError(f"unknown directive migrate:{directive[0]}")
+        elif _NON_TRANSACTIONAL.match(body):
+            steps.append({"kind": "concurrent", "sql": body})
+        elif steps and steps[-1]["kind"] == "transaction":
+            steps[-1]["statements"].append(body)
+        else:
+            steps.append({"kind": "transaction", "statements": [body]})
+    return steps
+
+
+def _summary(sql: str) -> str:
+    return " ".join(sql.split())[:80]
+
+
+# =========================
+# Running
+# =========================
+
+def _with_lock_retries(label: str, fn):
+    for attempt in range(1, LOCK_RETRIES + 1):
+        try:
+            return fn()
+        except psycopg.errors.LockNotAvailable:
+            if attempt == LOCK_RETRIES:
+                raise
+            print(f"    {label}: lock not granted within {LOCK_TIMEOUT}, retry {attempt}/{LOCK_RETRIES - 1}")
+            time.sleep(LOCK_RETRY_PAUSE_SECONDS)
+
+
+def _run_transaction(conn, statements: list[str]) -> None:
+    def attempt():
+        with conn.transaction():
+            conn.execute(f"SET LOCAL lock_timeout = '{LOCK_TIMEOUT}';")
+            for statement in statements:
+                conn.execute(statement)
+
+    _with_lock_retries("transaction", attempt)
+
+
+def _run_short(conn, statement: str) -> None:
+    # Catalog-only statement outside a transaction: don't wait behind long locks
+    def attempt():
+        with conn.transaction():
+            conn.execute(f"SET LOCAL lock_timeout = '{LOCK_TIMEOUT}';")
+            conn.execute(statement)
+
+    _with_lock_retries(_summary(statement), attempt)
+
+
+def _index_state(conn, name: str):
+    """None if the index doesn't exist, else whether it is valid."""
+    row = conn.execute(
+        """
+        SELECT i.indisvalid
+        FROM pg_index i
+        WHERE i.indexrelid = to_regclass(%s)
+        """,
+        (name,),
+    ).fetchone()
+    return None if row is None else row[0]
+
+
+def _drop_invalid(conn, name: str) -> None:
+    if _index_state(conn, name) is False:
+        print(f"    dropping INVALID index {name} left by an earlier build")
+        conn.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {name};")
+
+
+def _run_concurrent(conn, statement: str) -> None:
+    m = _CREATE_INDEX_CONCURRENTLY.match(statement)
+    if m is None:
+        conn.execute(statement)
+        return
+
+    name, table = m.group("name"), m.group("table")
+    relkind = conn.execute("SELECT relkind FROM pg_class WHERE oid = to_regclass(%s);", (table,)).fetchone()
+    if relkind is None or relkind[0] != "p":
+        _drop_invalid(conn, name)
+        conn.execute(statement)
+        return
+
+    if _index_state(conn, name):
+        return
+
+    # Partitioned table: an invalid index on the parent only, the same index built
+    # CONCURRENTLY on each partition, then attached. The parent becomes valid
+    # once every partition's index is attached.
+    unique = m.group("unique") or ""
+    rest = m.group("rest")
+    _run_short(conn, f"CREATE {unique}INDEX IF NOT EXISTS {name} ON ONLY {table} {rest};")
+
+    partitions = conn.execute(
+        """
+        SELECT c.relname, n.nspname, c.relkind
+        FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        JOIN pg_namespace n ON n.oid = c.relnamespace
+        WHERE i.inhparent = to_regclass(%s)
+        ORDER BY c.relname;
+        """,
+        (table,),
+    ).fetchall()
+
+    parent_name = table.split(".")[-1].strip('"')
+    index_name = name.split(".")[-1].strip('"')
+    for relname, schema, child_kind in partitions:
+        if child_kind == "p":
+            raise ValueError(f"{schema}.{relname} is itself partitioned; build {name} by hand")
+        suffix = relname[len(parent_name) :] if relname.startswith(parent_name) else "_" + relname
+        child_index = f"{index_name}{suffix}"
+        if len(child_index) > 63:
+            raise ValueError(f"index name {child_index} is longer than 63 characters")
+        qualified = f'"{schema}"."{child_index}"'
+
+        started = time.monotonic()
+        _drop_invalid(conn, qualified)
+        conn.execute(f'CREATE {unique}INDEX CONCURRENTLY IF NOT EXISTS "{child_index}" ON "{schema}"."{relname}" {rest};')
+        _run_short(conn, f"ALTER INDEX {name} ATTACH PARTITION {qualified};")
+        print(f"    {child_index} on {relname}: {(time.monotonic() - started) * 1000:.0f} ms")
+
+
+def _run_batches(conn, step: dict) -> tuple[int, int]:
+    sql = _BATCH_SIZE.sub(str(step["size"]), step["sql"])
+    batches = rows = 0
+    while True:
+        def attempt():
+            with conn.transaction():
+                conn.execute(f"SET LOCAL lock_timeout = '{LOCK_TIMEOUT}';")
+                return conn.execute(sql).rowcount
+
+        changed = _with_lock_retries("batch", attempt)
+        batches += 1
+        rows += max(changed, 0)
+        if changed <= 0:
+            return batches, rows
+        if batches % 10 == 0:
+            print(f"    batch {batches}: {rows} rows so far")
+        time.sleep(step["pause"])
+
+
+def run_step(conn, step: dict) -> dict:
+    started = time.monotonic()
+    if step["kind"] == "transaction":
+        _run_transaction(conn, step["statements"])
+        result = {"kind": "transaction", "statements": len(step["statements"]), "sql": _summary(step["statements"][0])}
+    elif step["kind"] == "concurrent":
+        _run_concurrent(conn, step["sql"])
+        result = {"kind": "concurrent", "sql": _summary(step["sql"])}
+    else:
+        batches, rows = _run_batches(conn, step)
+        result = {"kind": "batch", "batches": batches, "rows": rows, "sql": _summary(step["sql"])}
+    result["ms"] = round((time.monotonic() - started) * 1000)
+    return result
+
+
+# =========================
+# Versions
+# =========================
+
+def migrations() -> list[dict]:
+    found = []
+    for path in sorted(MIGRATIONS.glob("*.sql")):
+        data = path.read_bytes()
+        found.append(
+            {
+                "version": path.name.split("_", 1)[0],
+                "name": path.name,
+                "path": path,
+                "checksum": hashlib.sha256(data).hexdigest(),
+            }
+        )
+    return found
+
+
+def applied(conn) -> dict:
+    conn.execute(SCHEMA_SQL)
+    rows = conn.execute("SELECT version, name, checksum, applied_at, duration_ms FROM schema_migrations;").fetchall()
+    return {r[0]: {"name": r[1], "checksum": r[2], "applied_at": r[3], "duration_ms": r[4]} for r in rows}
+
+
+def _record(conn, m: dict, duration_ms, steps) -> None:
+    conn.execute(
+        """
+        INSERT INTO schema_migrations (version, name, checksum, duration_ms, steps)
+        VALUES (%s, %s, %s, %s, %s)
+        ON CONFLICT (version) DO UPDATE
+        SET name = EXCLUDED.name,
+            checksum = EXCLUDED.checksum,
+            applied_at = now(),
+            duration_ms = EXCLUDED.duration_ms,
+            steps = EXCLUDED.steps;
+        """,
+        (m["version"], m["name"], m["checksum"], duration_ms, json.dumps(steps) if steps is not None else None),
+    )
+
+
+def _changed(found: list[dict], done: dict) -> list[str]:
+    return [m["name"] for m in found if m["version"] in done and done[m["version"]]["checksum"] != m["checksum"]]
+
+
+def up(conn, target: str | None = None, dry_run: bool = False) -> int:
+    """Apply pending migrations up to target. Returns how many were applied."""
+    found = migrations()
+    done = applied(conn)
+    changed = _changed(found, done)
+    if changed:
+        raise SystemExit(
+            "Applied migrations changed since they ran: " + ", ".join(changed)
+            + "\nRevert the edit, or re-record them with: python db/migrate.py baseline --through <version>"
+        )
+
+    count = 0
+    for m in found:
+        if m["version"] in done or (target and m["version"] > target):
+            continue
+        steps = plan(m["path"].read_text(encoding="utf-8"))
+        print(f"{m['name']}: {len(steps)} step(s)")
+        if dry_run:
+            for i, step in enumerate(steps, start=1):
+                text = step["statements"][0] if step["kind"] == "transaction" else step["sql"]
+                print(f"  {i}. {step['kind']}: {_summary(text)}")
+            continue
+
+        started = time.monotonic()
+        timings = []
+        for i, step in enumerate(steps, start=1):
+            result = run_step(conn, step)
+            timings.append(result)
+            detail = f" ({result['batches']} batches, {result['rows']} rows)" if step["kind"] == "batch" else ""
+            print(f"  {i}/{len(steps)} {result['kind']}{detail}: {result['ms']} ms  {result['sql']}")
+        duration_ms = round((time.monotonic() - started) * 1000)
+        _record(conn, m, duration_ms, timings)
+        print(f"  applied {m['version']} in {duration_ms} ms")
+        count += 1
+    return count
+
+
+def baseline(conn, through: str) -> int:
+    """Record migrations up to `through` as applied (with current checksums) without running them."""
+    count = 0
+    for m in migrations():
+        if m["version"] <= through:
+            _record(conn, m, None, None)
+            count += 1
+    return count
+
+
+def status(conn) -> None:
+    done = applied(conn)
+    for m in migrations():
+        a = done.get(m["version"])
+        if a is None:
+            state = "pending"
+        elif a["checksum"] != m["checksum"]:
+            state = "CHANGED"
+        else:
+            took = f", {a['duration_ms']} ms" if a["duration_ms"] is not None else ", baseline"
+            state = f"applied {a['applied_at']:%Y-%m-%d %H:%M}{took}"
+        print(f"{m['name']:<55} {state}")
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("status", help="list migrations and whether they're applied")
+    p_up = sub.add_parser("up", help="apply pending migrations")
+    p_up.add_argument("--target", help="stop after this version")
+    p_up.add_argument("--dry-run", action="store_true", help="print the steps without running them")
+    p_base = sub.add_parser("baseline", help="mark migrations as applied without running them")
+    p_base.add_argument("--through", required=True, help="last version to mark, e.g. 012")
+    args = parser.parse_args()
+
+    with connect() as conn:
+        # One runner at a time; released when the connection closes
+        conn.execute("SELECT pg_advisory_lock(%s);", (_ADVISORY_LOCK_ID,))
+        if args.command == "status":
+            status(conn)
+        elif args.command == "baseline":
+            print(f"recorded {baseline(conn, args.through)} migration(s) as applied")
+        else:
+            applied_count = up(conn, target=args.target, dry_run=args.dry_run)
+            if not args.dry_run:
+                print(f"{applied_count} migration(s) applied")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -14,9 +14,11 @@ SET app_role = 'mentor',
     status = 'active'
 WHERE email = 'mentor@example.com';
 
+/*
 VALUES (
   ('e1b17b0e-4d04-4061-8f28-8e240d5a6c7c','ce305122-a541-4c88-93de-7701a7e956f8'),
   ('foniakaunti+mentor@gmail.com','foniakaunti+student@gmail.com'),
   ('mentor','mentee')
 )
-ON CONFLICT (user_id) DO NOTHING;
\ No newline at end of file
+ON CONFLICT (user_id) DO NOTHING;
+*/
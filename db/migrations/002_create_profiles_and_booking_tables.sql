@@ -290,7 +290,6 @@ SET status = 'requested',
     confirmed_at = NULL
 WHERE booking_id = '33333333-3333-3333-3333-333333333333';
 
-**/
 
 select* from students s 
 
@@ -308,5 +307,4 @@ JOIN students s      ON s.student_id = b.student_id
 LEFT JOIN app_users au_m ON au_m.user_id = m.mentor_id
 LEFT JOIN app_users au_s ON au_s.user_id = s.student_id
 WHERE b.booking_id = '33333333-3333-3333-3333-333333333333';
-
-
+**/
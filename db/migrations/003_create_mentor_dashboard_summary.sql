@@ -0,0 +1,132 @@
+-- Migration: Per-mentor dashboard summary
+-- Purpose: Serve mentor dashboard counts from one row instead of scanning bookings/slots per load
+-- Notes:
+--  - Booking create/confirm/cancel apply deltas to this table in the same transaction (api/mentor_summary.py).
+--  - Time-windowed counts (this week / this term / upcoming) drift as time passes, so an hourly
+--    timer calls refresh_mentor_dashboard_summary() to roll the windows and recompute from source.
+--  - Week and term windows are computed in the mentor's own timezone.
+-- Date: 2026-10-19
+
+/* =========================
+   1) Summary table
+   ========================= */
+
+CREATE TABLE IF NOT EXISTS mentor_dashboard_summary (
+  mentor_id uuid PRIMARY KEY REFERENCES mentors(mentor_id) ON DELETE CASCADE,
+  pending_requests int NOT NULL DEFAULT 0,
+  upcoming_confirmed int NOT NULL DEFAULT 0,
+  free_slots_this_week int NOT NULL DEFAULT 0,
+  cancellations_this_term int NOT NULL DEFAULT 0,
+  week_start timestamptz NOT NULL,
+  week_end timestamptz NOT NULL,
+  term_start timestamptz NOT NULL,
+  refreshed_at timestamptz NOT NULL DEFAULT now(),
+  updated_at timestamptz NOT NULL DEFAULT now()
+);
+
+COMMENT ON TABLE mentor_dashboard_summary IS
+'One row per mentor with dashboard counters. Kept current by booking write paths; rebuilt hourly to roll time windows.';
+
+COMMENT ON COLUMN mentor_dashboard_summary.pending_requests IS
+'Bookings in status requested, waiting for the mentor to confirm.';
+
+COMMENT ON COLUMN mentor_dashboard_summary.upcoming_confirmed IS
+'Confirmed bookings whose slot has not started yet.';
+
+COMMENT ON COLUMN mentor_dashboard_summary.free_slots_this_week IS
+'Slots between now and week_end with no requested/confirmed booking (same rule as GET /availability).';
+
+COMMENT ON COLUMN mentor_dashboard_summary.cancellations_this_term IS
+'Bookings cancelled since term_start.';
+
+COMMENT ON COLUMN mentor_dashboard_summary.week_start IS
+'Start of the current week in the mentor timezone at the last refresh.';
+
+COMMENT ON COLUMN mentor_dashboard_summary.week_end IS
+'End of the current week. Once now() passes this the row is stale and is refreshed on read.';
+
+COMMENT ON COLUMN mentor_dashboard_summary.term_start IS
+'Start of the current term (calendar quarter in the mentor timezone).';
+
+COMMENT ON COLUMN mentor_dashboard_summary.refreshed_at IS
+'When the row was last recomputed from source tables.';
+
+COMMENT ON COLUMN mentor_dashboard_summary.updated_at IS
+'When the row was last changed, either by a refresh or by an incremental booking delta.';
+
+
+/* =========================
+   2) Full recompute
+   ========================= */
+
+-- Recomputes one mentor (p_mentor_id) or every mentor (NULL) from bookings + slots.
+CREATE OR REPLACE FUNCTION refresh_mentor_dashboard_summary(p_mentor_id uuid DEFAULT NULL)
+RETURNS int
+LANGUAGE sql
+AS $$
+  WITH windows AS (
+    SELECT
+      m.mentor_id,
+      date_trunc('week', now() AT TIME ZONE m.timezone) AT TIME ZONE m.timezone AS week_start,
+      (date_trunc('week', now() AT TIME ZONE m.timezone) + interval '1 week') AT TIME ZONE m.timezone AS week_end,
+      date_trunc('quarter', now() AT TIME ZONE m.timezone) AT TIME ZONE m.timezone AS term_start
+    FROM mentors m
+    WHERE p_mentor_id IS NULL OR m.mentor_id = p_mentor_id
+  ),
+  upserted AS (
+    INSERT INTO mentor_dashboard_summary (
+      mentor_id,
+      pending_requests,
+      upcoming_confirmed,
+      free_slots_this_week,
+      cancellations_this_term,
+      week_start,
+      week_end,
+      term_start,
+      refreshed_at,
+      updated_at
+    )
+    SELECT
+      w.mentor_id,
+      (SELECT count(*) FROM bookings b
+        WHERE b.mentor_id = w.mentor_id AND b.status = 'requested'),
+      (SELECT count(*) FROM bookings b
+        JOIN mentor_availability_slots s ON s.slot_id = b.slot_id
+        WHERE b.mentor_id = w.mentor_id AND b.status = 'confirmed' AND s.start_time >= now()),
+      (SELECT count(*) FROM mentor_availability_slots s
+        WHERE s.mentor_id = w.mentor_id
+          AND s.start_time >= now()
+          AND s.start_time < w.week_end
+          AND NOT EXISTS (
+            SELECT 1 FROM bookings b
+            WHERE b.slot_id = s.slot_id AND b.status IN ('requested', 'confirmed')
+          )),
+      (SELECT count(*) FROM bookings b
+        WHERE b.mentor_id = w.mentor_id AND b.status = 'cancelled' AND b.cancelled_at >= w.term_start),
+      w.week_start,
+      w.week_end,
+      w.term_start,
+      now(),
+      now()
+    FROM windows w
+    ON CONFLICT (mentor_id) DO UPDATE
+    SET pending_requests = EXCLUDED.pending_requests,
+        upcoming_confirmed = EXCLUDED.upcoming_confirmed,
+        free_slots_this_week = EXCLUDED.free_slots_this_week,
+        cancellations_this_term = EXCLUDED.cancellations_this_term,
+        week_start = EXCLUDED.week_start,
+        week_end = EXCLUDED.week_end,
+        term_start = EXCLUDED.term_start,
+        refreshed_at = EXCLUDED.refreshed_at,
+        updated_at = EXCLUDED.updated_at
+    RETURNING 1
+  )
+  SELECT count(*)::int FROM upserted;
+$$;
+
+COMMENT ON FUNCTION refresh_mentor_dashboard_summary(uuid) IS
+'Recomputes mentor_dashboard_summary from bookings/slots for one mentor, or all mentors when called with NULL.';
+
+
+-- Initial fill
+SELECT refresh_mentor_dashboard_summary(NULL);
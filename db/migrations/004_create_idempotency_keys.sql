@@ -0,0 +1,45 @@
+-- Migration: Idempotency keys for booking POST routes
+-- Purpose: Answer client retries (Idempotency-Key header) from the stored first response
+--          instead of re-running the booking transaction or re-sending email.
+-- Notes:
+--  - Keys are scoped per user and route, so two users can't collide or read each other's responses.
+--  - status_code/response_body stay NULL while the first request is still running.
+--  - Expired rows are purged hourly by the idempotency_purge timer (api/idempotency.py).
+-- Date: 2026-10-19
+
+CREATE TABLE IF NOT EXISTS idempotency_keys (
+  user_id uuid NOT NULL,
+  route text NOT NULL,
+  idempotency_key text NOT NULL,
+  request_hash text NOT NULL,
+  status_code int,
+  response_body text,
+  response_mimetype text,
+  created_at timestamptz NOT NULL DEFAULT now(),
+  expires_at timestamptz NOT NULL,
+  PRIMARY KEY (user_id, route, idempotency_key)
+);
+
+COMMENT ON TABLE idempotency_keys IS
+'First response for each (user, route, Idempotency-Key). Retries are answered from here without re-executing.';
+
+COMMENT ON COLUMN idempotency_keys.route IS
+'Logical route name, e.g. bookings.create, bookings.confirm, bookings.cancel.';
+
+COMMENT ON COLUMN idempotency_keys.request_hash IS
+'SHA-256 of the request body. A retry with the same key but a different body is rejected.';
+
+COMMENT ON COLUMN idempotency_keys.status_code IS
+'HTTP status of the stored response. NULL means the first request is still in flight.';
+
+COMMENT ON COLUMN idempotency_keys.response_body IS
+'Stored response body returned verbatim on replay.';
+
+COMMENT ON COLUMN idempotency_keys.expires_at IS
+'After this the key is forgotten and may be reused.';
+
+CREATE INDEX IF NOT EXISTS idx_idempotency_keys_expires
+ON idempotency_keys(expires_at);
+
+COMMENT ON INDEX idx_idempotency_keys_expires IS
+'Speeds up the hourly purge of expired keys.';
@@ -0,0 +1,139 @@
+-- Migration: Change notifications for cross-instance cache invalidation
+-- Purpose: Every Functions instance keeps per-worker caches (availability, profiles). Triggers
+--          publish row changes on the booking_changes channel so each worker's listener
+--          (api/change_feed.py) can evict affected keys.
+-- Notes:
+--  - NOTIFY is transactional: listeners only hear about committed changes, in commit order.
+--  - Payloads carry ids only (pg_notify payloads are limited to 8000 bytes).
+-- Date: 2026-10-19
+
+/* =========================
+   1) Bookings + slots
+   ========================= */
+
+CREATE OR REPLACE FUNCTION notify_booking_change()
+RETURNS trigger
+LANGUAGE plpgsql
+AS $$
+DECLARE
+  rec bookings%ROWTYPE;
+BEGIN
+  IF TG_OP = 'DELETE' THEN
+    rec := OLD;
+  ELSE
+    rec := NEW;
+  END IF;
+
+  PERFORM pg_notify(
+    'booking_changes',
+    json_build_object(
+      'table', TG_TABLE_NAME,
+      'op', TG_OP,
+      'booking_id', rec.booking_id,
+      'slot_id', rec.slot_id,
+      'mentor_id', rec.mentor_id,
+      'student_id', rec.student_id,
+      'status', rec.status,
+      'old_status', CASE WHEN TG_OP = 'UPDATE' THEN OLD.status END
+    )::text
+  );
+  RETURN NULL;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS trg_bookings_notify ON bookings;
+CREATE TRIGGER trg_bookings_notify
+AFTER INSERT OR UPDATE OR DELETE ON bookings
+FOR EACH ROW EXECUTE FUNCTION notify_booking_change();
+
+COMMENT ON FUNCTION notify_booking_change() IS
+'Publishes booking row changes on channel booking_changes for per-worker cache invalidation.';
+
+
+CREATE OR REPLACE FUNCTION notify_slot_change()
+RETURNS trigger
+LANGUAGE plpgsql
+AS $$
+DECLARE
+  rec mentor_availability_slots%ROWTYPE;
+BEGIN
+  IF TG_OP = 'DELETE' THEN
+    rec := OLD;
+  ELSE
+    rec := NEW;
+  END IF;
+
+  PERFORM pg_notify(
+    'booking_changes',
+    json_build_object(
+      'table', TG_TABLE_NAME,
+      'op', TG_OP,
+      'slot_id', rec.slot_id,
+      'mentor_id', rec.mentor_id,
+      'status', rec.status
+    )::text
+  );
+  RETURN NULL;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS trg_slots_notify ON mentor_availability_slots;
+CREATE TRIGGER trg_slots_notify
+AFTER INSERT OR UPDATE OR DELETE ON mentor_availability_slots
+FOR EACH ROW EXECUTE FUNCTION notify_slot_change();
+
+COMMENT ON FUNCTION notify_slot_change() IS
+'Publishes availability slot changes on channel booking_changes for per-worker cache invalidation.';
+
+
+/* =========================
+   2) Profiles
+   ========================= */
+
+-- app_users, mentors and students all key on the user's uuid (first column)
+CREATE OR REPLACE FUNCTION notify_profile_change()
+RETURNS trigger
+LANGUAGE plpgsql
+AS $$
+DECLARE
+  changed_id uuid;
+BEGIN
+  IF TG_OP = 'DELETE' THEN
+    changed_id := CASE TG_TABLE_NAME
+      WHEN 'app_users' THEN (to_jsonb(OLD) ->> 'user_id')::uuid
+      WHEN 'mentors' THEN (to_jsonb(OLD) ->> 'mentor_id')::uuid
+      ELSE (to_jsonb(OLD) ->> 'student_id')::uuid
+    END;
+  ELSE
+    changed_id := CASE TG_TABLE_NAME
+      WHEN 'app_users' THEN (to_jsonb(NEW) ->> 'user_id')::uuid
+      WHEN 'mentors' THEN (to_jsonb(NEW) ->> 'mentor_id')::uuid
+      ELSE (to_jsonb(NEW) ->> 'student_id')::uuid
+    END;
+  END IF;
+
+  PERFORM pg_notify(
+    'booking_changes',
+    json_build_object('table', TG_TABLE_NAME, 'op', TG_OP, 'user_id', changed_id)::text
+  );
+  RETURN NULL;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS trg_app_users_notify ON app_users;
+CREATE TRIGGER trg_app_users_notify
+AFTER INSERT OR UPDATE OR DELETE ON app_users
+FOR EACH ROW EXECUTE FUNCTION notify_profile_change();
+
+DROP TRIGGER IF EXISTS trg_mentors_notify ON mentors;
+CREATE TRIGGER trg_mentors_notify
+AFTER INSERT OR UPDATE OR DELETE ON mentors
+FOR EACH ROW EXECUTE FUNCTION notify_profile_change();
+
+DROP TRIGGER IF EXISTS trg_students_notify ON students;
+CREATE TRIGGER trg_students_notify
+AFTER INSERT OR UPDATE OR DELETE ON students
+FOR EACH ROW EXECUTE FUNCTION notify_profile_change();
+
+COMMENT ON FUNCTION notify_profile_change() IS
+'Publishes app_users/mentors/students changes on channel booking_changes for per-worker cache invalidation.';
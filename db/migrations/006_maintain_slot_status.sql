@@ -0,0 +1,199 @@
+-- Migration: Keep mentor_availability_slots.status authoritative
+-- Purpose: GET /availability and "book any free slot" read slot status straight off the
+--          partial index idx_slots_mentor_start_available instead of anti-joining bookings.
+-- Notes:
+--  - A trigger on bookings flips the slot to 'booked' when it gets a requested/confirmed
+--    booking and back to 'available' when that booking is cancelled or deleted, in the
+--    same transaction as the booking write.
+--  - 'cancelled' (withdrawn by mentor) is never overwritten by the trigger.
+--  - bookings.slot_id was UNIQUE across all statuses, so a cancelled booking blocked the slot
+--    forever while /availability still listed it as free. Uniqueness now only covers
+--    requested/confirmed bookings, so a freed slot can actually be booked again.
+--  - slot_status_drift() lists slots whose status disagrees with their bookings; the
+--    slot_status_drift_check timer logs it.
+-- Date: 2026-10-19
+
+/* =========================
+   1) One active booking per slot
+   ========================= */
+
+CREATE UNIQUE INDEX IF NOT EXISTS uq_bookings_slot_active
+ON bookings(slot_id)
+WHERE status IN ('requested', 'confirmed');
+
+COMMENT ON INDEX uq_bookings_slot_active IS
+'Prevents double booking: at most one requested/confirmed booking per slot. Cancelled bookings keep their history.';
+
+ALTER TABLE bookings DROP CONSTRAINT IF EXISTS bookings_slot_id_key;
+ALTER TABLE bookings DROP CONSTRAINT IF EXISTS bookings_slot_id_unique;
+
+CREATE INDEX IF NOT EXISTS idx_bookings_slot
+ON bookings(slot_id);
+
+COMMENT ON INDEX idx_bookings_slot IS
+'Slot -> bookings lookups (history, drift check, FK checks on slot delete) now that slot_id is not globally unique.';
+
+COMMENT ON COLUMN bookings.slot_id IS
+'FK to mentor_availability_slots. uq_bookings_slot_active allows one requested/confirmed booking per slot; cancelled bookings stay as history.';
+
+COMMENT ON COLUMN mentor_availability_slots.status IS
+'Slot state: available (bookable), booked (held by a requested or confirmed booking; maintained by trg_bookings_sync_slot_status), cancelled (withdrawn by mentor).';
+
+
+/* =========================
+   2) Sync trigger
+   ========================= */
+
+CREATE OR REPLACE FUNCTION sync_slot_status()
+RETURNS trigger
+LANGUAGE plpgsql
+AS $$
+BEGIN
+  -- Release the slot the old row held
+  IF TG_OP IN ('UPDATE', 'DELETE') AND OLD.status IN ('requested', 'confirmed') THEN
+    UPDATE mentor_availability_slots s
+    SET status = 'available',
+        updated_at = now()
+    WHERE s.slot_id = OLD.slot_id
+      AND s.status = 'booked'
+      AND NOT EXISTS (
+        SELECT 1 FROM bookings b
+        WHERE b.slot_id = OLD.slot_id
+          AND b.status IN ('requested', 'confirmed')
+          AND b.booking_id <> OLD.booking_id
+      );
+  END IF;
+
+  -- Hold the slot the new row points at
+  IF TG_OP IN ('INSERT', 'UPDATE') AND NEW.status IN ('requested', 'confirmed') THEN
+    UPDATE mentor_availability_slots s
+    SET status = 'booked',
+        updated_at = now()
+    WHERE s.slot_id = NEW.slot_id
+      AND s.status = 'available';
+  END IF;
+
+  RETURN NULL;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS trg_bookings_sync_slot_status ON bookings;
+CREATE TRIGGER trg_bookings_sync_slot_status
+AFTER INSERT OR DELETE OR UPDATE OF status, slot_id ON bookings
+FOR EACH ROW EXECUTE FUNCTION sync_slot_status();
+
+COMMENT ON FUNCTION sync_slot_status() IS
+'Keeps mentor_availability_slots.status in step with requested/confirmed bookings.';
+
+
+/* =========================
+   3) Backfill
+   ========================= */
+
+UPDATE mentor_availability_slots s
+SET status = x.wanted,
+    updated_at = now()
+FROM (
+  SELECT
+    s2.slot_id,
+    CASE WHEN EXISTS (
+      SELECT 1 FROM bookings b
+      WHERE b.slot_id = s2.slot_id AND b.status IN ('requested', 'confirmed')
+    ) THEN 'booked' ELSE 'available' END AS wanted
+  FROM mentor_availability_slots s2
+  WHERE s2.status <> 'cancelled'
+) x
+WHERE s.slot_id = x.slot_id
+  AND s.status <> x.wanted;
+
+
+/* =========================
+   4) Drift check
+   ========================= */
+
+CREATE OR REPLACE FUNCTION slot_status_drift(p_limit int DEFAULT 100)
+RETURNS TABLE (slot_id uuid, mentor_id uuid, slot_status text, active_bookings bigint)
+LANGUAGE sql
+STABLE
+AS $$
+  SELECT s.slot_id, s.mentor_id, s.status, count(b.booking_id)
+  FROM mentor_availability_slots s
+  LEFT JOIN bookings b
+    ON b.slot_id = s.slot_id
+   AND b.status IN ('requested', 'confirmed')
+  GROUP BY s.slot_id, s.mentor_id, s.status
+  HAVING (s.status = 'available' AND count(b.booking_id) > 0)
+      OR (s.status = 'booked' AND count(b.booking_id) = 0)
+      OR (s.status = 'cancelled' AND count(b.booking_id) > 0)
+  ORDER BY s.slot_id
+  LIMIT p_limit;
+$$;
+
+COMMENT ON FUNCTION slot_status_drift(int) IS
+'Slots whose status disagrees with their requested/confirmed bookings. Should always be empty.';
+
+
+/* =========================
+   5) Dashboard summary uses slot status
+   ========================= */
+
+CREATE OR REPLACE FUNCTION refresh_mentor_dashboard_summary(p_mentor_id uuid DEFAULT NULL)
+RETURNS int
+LANGUAGE sql
+AS $$
+  WITH windows AS (
+    SELECT
+      m.mentor_id,
+      date_trunc('week', now() AT TIME ZONE m.timezone) AT TIME ZONE m.timezone AS week_start,
+      (date_trunc('week', now() AT TIME ZONE m.timezone) + interval '1 week') AT TIME ZONE m.timezone AS week_end,
+      date_trunc('quarter', now() AT TIME ZONE m.timezone) AT TIME ZONE m.timezone AS term_start
+    FROM mentors m
+    WHERE p_mentor_id IS NULL OR m.mentor_id = p_mentor_id
+  ),
+  upserted AS (
+    INSERT INTO mentor_dashboard_summary (
+      mentor_id,
+      pending_requests,
+      upcoming_confirmed,
+      free_slots_this_week,
+      cancellations_this_term,
+      week_start,
+      week_end,
+      term_start,
+      refreshed_at,
+      updated_at
+    )
+    SELECT
+      w.mentor_id,
+      (SELECT count(*) FROM bookings b
+        WHERE b.mentor_id = w.mentor_id AND b.status = 'requested'),
+      (SELECT count(*) FROM bookings b
+        JOIN mentor_availability_slots s ON s.slot_id = b.slot_id
+        WHERE b.mentor_id = w.mentor_id AND b.status = 'confirmed' AND s.start_time >= now()),
+      (SELECT count(*) FROM mentor_availability_slots s
+        WHERE s.mentor_id = w.mentor_id
+          AND s.status = 'available'
+          AND s.start_time >= now()
+          AND s.start_time < w.week_end),
+      (SELECT count(*) FROM bookings b
+        WHERE b.mentor_id = w.mentor_id AND b.status = 'cancelled' AND b.cancelled_at >= w.term_start),
+      w.week_start,
+      w.week_end,
+      w.term_start,
+      now(),
+      now()
+    FROM windows w
+    ON CONFLICT (mentor_id) DO UPDATE
+    SET pending_requests = EXCLUDED.pending_requests,
+        upcoming_confirmed = EXCLUDED.upcoming_confirmed,
+        free_slots_this_week = EXCLUDED.free_slots_this_week,
+        cancellations_this_term = EXCLUDED.cancellations_this_term,
+        week_start = EXCLUDED.week_start,
+        week_end = EXCLUDED.week_end,
+        term_start = EXCLUDED.term_start,
+        refreshed_at = EXCLUDED.refreshed_at,
+        updated_at = EXCLUDED.updated_at
+    RETURNING 1
+  )
+  SELECT count(*)::int FROM upserted;
+$$;
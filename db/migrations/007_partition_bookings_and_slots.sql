@@ -0,0 +1,519 @@
+-- Migration: Range-partition bookings and mentor_availability_slots by slot start month
+-- Purpose: Both tables only grow, and every index on them keeps sessions that ended long ago.
+--          Monthly partitions keep the hot indexes small: availability and "any slot" bookings
+--          prune to the months in their window, and old months are detached into the archive
+--          schema by maintain_booking_partitions() (daily timer in api/function_app.py).
+-- Notes:
+--  - Partition key is the slot start. bookings gets a denormalised slot_start_time copied
+--    from its slot, so a booking always lives in the same month as its slot.
+--  - Primary keys and unique indexes on a partitioned table must include the partition key:
+--    slots are keyed (slot_id, start_time) and bookings (booking_id, slot_start_time). Both ids
+--    are UUIDs generated by the API, so they stay unique in practice.
+--  - The bookings -> slots FK becomes (slot_id, slot_start_time) -> (slot_id, start_time).
+--  - Existing rows are copied into the new tables inside one transaction; the old tables are
+--    dropped at the end. Run at a quiet time: writes to both tables block until it commits.
+--  - Detaching a partition takes a brief ACCESS EXCLUSIVE lock on the parent, which is why
+--    archival runs from a nightly timer.
+-- Date: 2026-10-19
+
+BEGIN;
+
+CREATE SCHEMA IF NOT EXISTS archive;
+
+COMMENT ON SCHEMA archive IS
+'Detached monthly partitions of bookings and mentor_availability_slots. Not read by the API.';
+
+
+/* =========================
+   1) Move the old tables aside
+   ========================= */
+
+ALTER TABLE bookings RENAME TO bookings_unpartitioned;
+ALTER TABLE mentor_availability_slots RENAME TO mentor_availability_slots_unpartitioned;
+
+
+/* =========================
+   2) Partitioned tables
+   ========================= */
+
+CREATE TABLE mentor_availability_slots (
+  slot_id uuid NOT NULL,
+  mentor_id uuid NOT NULL,
+  start_time timestamptz NOT NULL,
+  end_time timestamptz NOT NULL,
+  status text NOT NULL DEFAULT 'available',
+  created_at timestamptz NOT NULL DEFAULT now(),
+  updated_at timestamptz NOT NULL DEFAULT now(),
+  CONSTRAINT mentor_availability_slots_status_check CHECK (status IN ('available','booked','cancelled')),
+  CONSTRAINT mentor_availability_slots_check CHECK (end_time > start_time)
+) PARTITION BY RANGE (start_time);
+
+CREATE TABLE bookings (
+  booking_id uuid NOT NULL,
+  slot_id uuid NOT NULL,
+  slot_start_time timestamptz NOT NULL,
+  mentor_id uuid NOT NULL,
+  student_id uuid NOT NULL,
+
+  status text NOT NULL DEFAULT 'requested',
+
+  note text,
+
+  requested_at timestamptz NOT NULL DEFAULT now(),
+  confirmed_at timestamptz,
+  cancelled_at timestamptz,
+  cancelled_by text,
+
+  meeting_url_snapshot text,
+
+  created_at timestamptz NOT NULL DEFAULT now(),
+  updated_at timestamptz NOT NULL DEFAULT now(),
+
+  CONSTRAINT bookings_status_check CHECK (status IN ('requested','confirmed','cancelled')),
+  CONSTRAINT bookings_cancelled_by_check CHECK (cancelled_by IN ('student','mentor'))
+) PARTITION BY RANGE (slot_start_time);
+
+
+/* =========================
+   3) Partition maintenance
+   ========================= */
+
+-- Partitions are named <table>_pYYYY_MM and cover one UTC calendar month.
+CREATE OR REPLACE FUNCTION ensure_booking_partitions(p_from timestamptz, p_to timestamptz)
+RETURNS int
+LANGUAGE plpgsql
+AS $$
+DECLARE
+  m timestamp := date_trunc('month', p_from AT TIME ZONE 'UTC');
+  lower_bound timestamptz;
+  upper_bound timestamptz;
+  suffix text;
+  created int := 0;
+BEGIN
+  WHILE (m AT TIME ZONE 'UTC') < p_to LOOP
+    suffix := to_char(m, '"p"YYYY_MM');
+    lower_bound := m AT TIME ZONE 'UTC';
+    upper_bound := (m + interval '1 month') AT TIME ZONE 'UTC';
+
+    IF to_regclass(format('public.%I', 'mentor_availability_slots_' || suffix)) IS NULL THEN
+      EXECUTE format(
+        'CREATE TABLE public.%I PARTITION OF mentor_availability_slots FOR VALUES FROM (%L) TO (%L)',
+        'mentor_availability_slots_' || suffix, lower_bound, upper_bound
+      );
+      created := created + 1;
+    END IF;
+
+    IF to_regclass(format('public.%I', 'bookings_' || suffix)) IS NULL THEN
+      EXECUTE format(
+        'CREATE TABLE public.%I PARTITION OF bookings FOR VALUES FROM (%L) TO (%L)',
+        'bookings_' || suffix, lower_bound, upper_bound
+      );
+      created := created + 1;
+    END IF;
+
+    m := m + interval '1 month';
+  END LOOP;
+
+  RETURN created;
+END;
+$$;
+
+COMMENT ON FUNCTION ensure_booking_partitions(timestamptz, timestamptz) IS
+'Creates missing monthly partitions of mentor_availability_slots and bookings covering [p_from, p_to).';
+
+
+-- Detaches every month that ended before p_before and moves it to the archive schema.
+-- The bookings partition goes first: it references the slots partition of the same month.
+CREATE OR REPLACE FUNCTION archive_booking_partitions(p_before timestamptz)
+RETURNS int
+LANGUAGE plpgsql
+AS $$
+DECLARE
+  part record;
+  fk record;
+  slots_part text;
+  archived int := 0;
+BEGIN
+  FOR part IN
+    SELECT c.relname, substring(c.relname FROM '_(p[0-9]{4}_[0-9]{2})$') AS suffix
+    FROM pg_inherits i
+    JOIN pg_class c ON c.oid = i.inhrelid
+    WHERE i.inhparent = 'public.bookings'::regclass
+      AND c.relname ~ '_p[0-9]{4}_[0-9]{2}$'
+      AND (to_date(substring(c.relname FROM '([0-9]{4}_[0-9]{2})$'), 'YYYY_MM') + interval '1 month')
+          <= (p_before AT TIME ZONE 'UTC')
+    ORDER BY c.relname
+  LOOP
+    EXECUTE format('ALTER TABLE bookings DETACH PARTITION public.%I', part.relname);
+
+    -- Archived rows must not pin live slots, mentors or students
+    FOR fk IN
+      SELECT conname FROM pg_constraint
+      WHERE conrelid = format('public.%I', part.relname)::regclass AND contype = 'f'
+    LOOP
+      EXECUTE format('ALTER TABLE public.%I DROP CONSTRAINT %I', part.relname, fk.conname);
+    END LOOP;
+
+    EXECUTE format('ALTER TABLE public.%I SET SCHEMA archive', part.relname);
+    archived := archived + 1;
+
+    slots_part := 'mentor_availability_slots_' || part.suffix;
+    IF to_regclass(format('public.%I', slots_part)) IS NOT NULL THEN
+      EXECUTE format('ALTER TABLE mentor_availability_slots DETACH PARTITION public.%I', slots_part);
+      FOR fk IN
+        SELECT conname FROM pg_constraint
+        WHERE conrelid = format('public.%I', slots_part)::regclass AND contype = 'f'
+      LOOP
+        EXECUTE format('ALTER TABLE public.%I DROP CONSTRAINT %I', slots_part, fk.conname);
+      END LOOP;
+      EXECUTE format('ALTER TABLE public.%I SET SCHEMA archive', slots_part);
+      archived := archived + 1;
+    END IF;
+  END LOOP;
+
+  RETURN archived;
+END;
+$$;
+
+COMMENT ON FUNCTION archive_booking_partitions(timestamptz) IS
+'Detaches monthly partitions that ended before p_before into the archive schema (bookings first, then slots).';
+
+
+CREATE OR REPLACE FUNCTION maintain_booking_partitions(p_months_ahead int DEFAULT 12, p_keep_months int DEFAULT 6)
+RETURNS TABLE (created int, archived int)
+LANGUAGE sql
+AS $$
+  SELECT
+    ensure_booking_partitions(now(), now() + make_interval(months => p_months_ahead)),
+    archive_booking_partitions(
+      date_trunc('month', now() AT TIME ZONE 'UTC') AT TIME ZONE 'UTC' - make_interval(months => p_keep_months)
+    );
+$$;
+
+COMMENT ON FUNCTION maintain_booking_partitions(int, int) IS
+'Nightly: keeps p_months_ahead months of future partitions and archives months older than p_keep_months.';
+
+
+/* =========================
+   4) Copy existing rows
+   ========================= */
+
+SELECT ensure_booking_partitions(
+  least((SELECT min(start_time) FROM mentor_availability_slots_unpartitioned), now()),
+  greatest(
+    (SELECT max(start_time) FROM mentor_availability_slots_unpartitioned) + interval '1 month',
+    now() + interval '12 months'
+  )
+);
+
+INSERT INTO mentor_availability_slots (
+  slot_id, mentor_id, start_time, end_time, status, created_at, updated_at
+)
+SELECT slot_id, mentor_id, start_time, end_time, status, created_at, updated_at
+FROM mentor_availability_slots_unpartitioned;
+
+INSERT INTO bookings (
+  booking_id, slot_id, slot_start_time, mentor_id, student_id, status, note,
+  requested_at, confirmed_at, cancelled_at, cancelled_by, meeting_url_snapshot,
+  created_at, updated_at
+)
+SELECT
+  b.booking_id, b.slot_id, s.start_time, b.mentor_id, b.student_id, b.status, b.note,
+  b.requested_at, b.confirmed_at, b.cancelled_at, b.cancelled_by, b.meeting_url_snapshot,
+  b.created_at, b.updated_at
+FROM bookings_unpartitioned b
+JOIN mentor_availability_slots_unpartitioned s ON s.slot_id = b.slot_id;
+
+DROP TABLE bookings_unpartitioned;
+DROP TABLE mentor_availability_slots_unpartitioned;
+
+
+/* =========================
+   5) Keys, indexes, triggers
+   ========================= */
+
+-- Created after the copy so the load doesn't maintain them row by row
+
+ALTER TABLE mentor_availability_slots
+ADD CONSTRAINT mentor_availability_slots_pkey PRIMARY KEY (slot_id, start_time);
+
+ALTER TABLE mentor_availability_slots
+ADD CONSTRAINT mentor_availability_slots_mentor_id_fkey
+FOREIGN KEY (mentor_id) REFERENCES mentors(mentor_id) ON DELETE CASCADE;
+
+CREATE INDEX IF NOT EXISTS idx_slots_mentor_start_available
+ON mentor_availability_slots(mentor_id, start_time)
+WHERE status = 'available';
+
+COMMENT ON INDEX idx_slots_mentor_start_available IS
+'Speeds up listing upcoming available slots for a given mentor.';
+
+CREATE INDEX IF NOT EXISTS idx_slots_slot_id
+ON mentor_availability_slots(slot_id);
+
+COMMENT ON INDEX idx_slots_slot_id IS
+'Lookups by slot_id alone (POST /bookings with a slot_id). Probes each attached partition.';
+
+
+ALTER TABLE bookings
+ADD CONSTRAINT bookings_pkey PRIMARY KEY (booking_id, slot_start_time);
+
+ALTER TABLE bookings
+ADD CONSTRAINT bookings_slot_fkey
+FOREIGN KEY (slot_id, slot_start_time)
+REFERENCES mentor_availability_slots(slot_id, start_time) ON DELETE RESTRICT;
+
+ALTER TABLE bookings
+ADD CONSTRAINT bookings_mentor_id_fkey
+FOREIGN KEY (mentor_id) REFERENCES mentors(mentor_id) ON DELETE CASCADE;
+
+ALTER TABLE bookings
+ADD CONSTRAINT bookings_student_id_fkey
+FOREIGN KEY (student_id) REFERENCES students(student_id) ON DELETE CASCADE;
+
+CREATE UNIQUE INDEX IF NOT EXISTS uq_bookings_slot_active
+ON bookings(slot_id, slot_start_time)
+WHERE status IN ('requested', 'confirmed');
+
+COMMENT ON INDEX uq_bookings_slot_active IS
+'Prevents double booking: at most one requested/confirmed booking per slot. Cancelled bookings keep their history.';
+
+CREATE INDEX IF NOT EXISTS idx_bookings_slot
+ON bookings(slot_id);
+
+COMMENT ON INDEX idx_bookings_slot IS
+'Slot -> bookings lookups (history, drift check, FK checks on slot delete) now that slot_id is not globally unique.';
+
+CREATE INDEX IF NOT EXISTS idx_bookings_booking_id
+ON bookings(booking_id);
+
+COMMENT ON INDEX idx_bookings_booking_id IS
+'Lookups by booking_id alone (confirm/cancel). Probes each attached partition.';
+
+CREATE INDEX IF NOT EXISTS idx_bookings_student_recent
+ON bookings(student_id, requested_at DESC);
+
+COMMENT ON INDEX idx_bookings_student_recent IS
+'Speeds up student dashboard view of recent/pending/confirmed bookings.';
+
+CREATE INDEX IF NOT EXISTS idx_bookings_mentor_recent
+ON bookings(mentor_id, requested_at DESC);
+
+COMMENT ON INDEX idx_bookings_mentor_recent IS
+'Speeds up mentor dashboard view of pending requests and upcoming bookings.';
+
+CREATE INDEX IF NOT EXISTS idx_bookings_status
+ON bookings(status);
+
+COMMENT ON INDEX idx_bookings_status IS
+'Speeds up filtering by booking status (requested vs confirmed).';
+
+
+CREATE TRIGGER trg_slots_notify
+AFTER INSERT OR UPDATE OR DELETE ON mentor_availability_slots
+FOR EACH ROW EXECUTE FUNCTION notify_slot_change();
+
+CREATE TRIGGER trg_bookings_notify
+AFTER INSERT OR UPDATE OR DELETE ON bookings
+FOR EACH ROW EXECUTE FUNCTION notify_booking_change();
+
+CREATE TRIGGER trg_bookings_sync_slot_status
+AFTER INSERT OR DELETE OR UPDATE OF status, slot_id ON bookings
+FOR EACH ROW EXECUTE FUNCTION sync_slot_status();
+
+
+/* =========================
+   6) Functions that join bookings to slots
+   ========================= */
+
+-- Same as 006, with the slot start in every slot lookup so only one partition is touched
+CREATE OR REPLACE FUNCTION sync_slot_status()
+RETURNS trigger
+LANGUAGE plpgsql
+AS $$
+BEGIN
+  -- Release the slot the old row held
+  IF TG_OP IN ('UPDATE', 'DELETE') AND OLD.status IN ('requested', 'confirmed') THEN
+    UPDATE mentor_availability_slots s
+    SET status = 'available',
+        updated_at = now()
+    WHERE s.slot_id = OLD.slot_id
+      AND s.start_time = OLD.slot_start_time
+      AND s.status = 'booked'
+      AND NOT EXISTS (
+        SELECT 1 FROM bookings b
+        WHERE b.slot_id = OLD.slot_id
+          AND b.slot_start_time = OLD.slot_start_time
+          AND b.status IN ('requested', 'confirmed')
+          AND b.booking_id <> OLD.booking_id
+      );
+  END IF;
+
+  -- Hold the slot the new row points at
+  IF TG_OP IN ('INSERT', 'UPDATE') AND NEW.status IN ('requested', 'confirmed') THEN
+    UPDATE mentor_availability_slots s
+    SET status = 'booked',
+        updated_at = now()
+    WHERE s.slot_id = NEW.slot_id
+      AND s.start_time = NEW.slot_start_time
+      AND s.status = 'available';
+  END IF;
+
+  RETURN NULL;
+END;
+$$;
+
+CREATE OR REPLACE FUNCTION slot_status_drift(p_limit int DEFAULT 100)
+RETURNS TABLE (slot_id uuid, mentor_id uuid, slot_status text, active_bookings bigint)
+LANGUAGE sql
+STABLE
+AS $$
+  SELECT s.slot_id, s.mentor_id, s.status, count(b.booking_id)
+  FROM mentor_availability_slots s
+  LEFT JOIN bookings b
+    ON b.slot_id = s.slot_id
+   AND b.slot_start_time = s.start_time
+   AND b.status IN ('requested', 'confirmed')
+  GROUP BY s.slot_id, s.mentor_id, s.status
+  HAVING (s.status = 'available' AND count(b.booking_id) > 0)
+      OR (s.status = 'booked' AND count(b.booking_id) = 0)
+      OR (s.status = 'cancelled' AND count(b.booking_id) > 0)
+  ORDER BY s.slot_id
+  LIMIT p_limit;
+$$;
+
+CREATE OR REPLACE FUNCTION refresh_mentor_dashboard_summary(p_mentor_id uuid DEFAULT NULL)
+RETURNS int
+LANGUAGE sql
+AS $$
+  WITH windows AS (
+    SELECT
+      m.mentor_id,
+      date_trunc('week', now() AT TIME ZONE m.timezone) AT TIME ZONE m.timezone AS week_start,
+      (date_trunc('week', now() AT TIME ZONE m.timezone) + interval '1 week') AT TIME ZONE m.timezone AS week_end,
+      date_trunc('quarter', now() AT TIME ZONE m.timezone) AT TIME ZONE m.timezone AS term_start
+    FROM mentors m
+    WHERE p_mentor_id IS NULL OR m.mentor_id = p_mentor_id
+  ),
+  upserted AS (
+    INSERT INTO mentor_dashboard_summary (
+      mentor_id,
+      pending_requests,
+      upcoming_confirmed,
+      free_slots_this_week,
+      cancellations_this_term,
+      week_start,
+      week_end,
+      term_start,
+      refreshed_at,
+      updated_at
+    )
+    SELECT
+      w.mentor_id,
+      (SELECT count(*) FROM bookings b
+        WHERE b.mentor_id = w.mentor_id AND b.status = 'requested'),
+      (SELECT count(*) FROM bookings b
+        WHERE b.mentor_id = w.mentor_id AND b.status = 'confirmed' AND b.slot_start_time >= now()),
+      (SELECT count(*) FROM mentor_availability_slots s
+        WHERE s.mentor_id = w.mentor_id
+          AND s.status = 'available'
+          AND s.start_time >= now()
+          AND s.start_time < w.week_end),
+      (SELECT count(*) FROM bookings b
+        WHERE b.mentor_id = w.mentor_id AND b.status = 'cancelled' AND b.cancelled_at >= w.term_start),
+      w.week_start,
+      w.week_end,
+      w.term_start,
+      now(),
+      now()
+    FROM windows w
+    ON CONFLICT (mentor_id) DO UPDATE
+    SET pending_requests = EXCLUDED.pending_requests,
+        upcoming_confirmed = EXCLUDED.upcoming_confirmed,
+        free_slots_this_week = EXCLUDED.free_slots_this_week,
+        cancellations_this_term = EXCLUDED.cancellations_this_term,
+        week_start = EXCLUDED.week_start,
+        week_end = EXCLUDED.week_end,
+        term_start = EXCLUDED.term_start,
+        refreshed_at = EXCLUDED.refreshed_at,
+        updated_at = EXCLUDED.updated_at
+    RETURNING 1
+  )
+  SELECT count(*)::int FROM upserted;
+$$;
+
+
+/* =========================
+   7) Comments
+   ========================= */
+
+COMMENT ON TABLE mentor_availability_slots IS
+'Mentor-published availability. Students book from these slots (Option A booking model). Partitioned by start_time month.';
+
+COMMENT ON COLUMN mentor_availability_slots.slot_id IS
+'UUID generated by API. DB-side UUID extensions are restricted in Azure. Primary key together with start_time (partition key).';
+
+COMMENT ON COLUMN mentor_availability_slots.mentor_id IS
+'Owner of the availability slot. Drives filtering in UI and permission checks in API.';
+
+COMMENT ON COLUMN mentor_availability_slots.start_time IS
+'Slot start time stored with timezone (timestamptz) to avoid DST/timezone bugs. Partition key.';
+
+COMMENT ON COLUMN mentor_availability_slots.end_time IS
+'Slot end time. Must be greater than start_time.';
+
+COMMENT ON COLUMN mentor_availability_slots.status IS
+'Slot state: available (bookable), booked (held by a requested or confirmed booking; maintained by trg_bookings_sync_slot_status), cancelled (withdrawn by mentor).';
+
+COMMENT ON COLUMN mentor_availability_slots.created_at IS
+'Audit timestamp.';
+
+COMMENT ON COLUMN mentor_availability_slots.updated_at IS
+'Audit timestamp.';
+
+COMMENT ON TABLE bookings IS
+'Booking records created when a student selects a mentor availability slot. Used for upcoming sessions and email notifications. Partitioned by slot_start_time month.';
+
+COMMENT ON COLUMN bookings.booking_id IS
+'UUID generated by API. Primary key together with slot_start_time (partition key).';
+
+COMMENT ON COLUMN bookings.slot_id IS
+'FK (with slot_start_time) to mentor_availability_slots. uq_bookings_slot_active allows one requested/confirmed booking per slot; cancelled bookings stay as history.';
+
+COMMENT ON COLUMN bookings.slot_start_time IS
+'Copy of the slot start_time, set by the API on insert. Partition key; keeps a booking in the same month partition as its slot.';
+
+COMMENT ON COLUMN bookings.mentor_id IS
+'Redundant FK to mentor for fast queries and permission checks (avoids joins in common endpoints). Must match slot mentor_id in API.';
+
+COMMENT ON COLUMN bookings.student_id IS
+'Student who requested the booking. Powers student dashboard upcoming sessions.';
+
+COMMENT ON COLUMN bookings.status IS
+'Booking lifecycle: requested (student submitted), confirmed (mentor approved), cancelled.';
+
+COMMENT ON COLUMN bookings.note IS
+'Optional student note: what they want help with. Included in confirmation email.';
+
+COMMENT ON COLUMN bookings.requested_at IS
+'When the student created the booking request.';
+
+COMMENT ON COLUMN bookings.confirmed_at IS
+'When mentor confirmed. Confirmation triggers email notification.';
+
+COMMENT ON COLUMN bookings.cancelled_at IS
+'When booking was cancelled.';
+
+COMMENT ON COLUMN bookings.cancelled_by IS
+'Who cancelled (student or mentor). Useful for reporting and support.';
+
+COMMENT ON COLUMN bookings.meeting_url_snapshot IS
+'Copy of mentor Teams link captured at confirmation time. Preserves history if mentor later changes their link.';
+
+COMMENT ON COLUMN bookings.created_at IS
+'Audit timestamp.';
+
+COMMENT ON COLUMN bookings.updated_at IS
+'Audit timestamp.';
+
+COMMIT;
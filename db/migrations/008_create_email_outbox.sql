@@ -0,0 +1,42 @@
+-- Migration: Outbox for emails that couldn't be sent through Microsoft Graph
+-- Purpose: While the Graph circuit breaker is open (or a send fails) booking emails are queued
+--          here instead of failing the request or being dropped. The email_outbox_drain timer
+--          (api/graph_mailer.py) sends them once Graph recovers.
+-- Notes:
+--  - A drain claims rows by pushing next_attempt_at forward (a lease), sends outside the
+--    transaction, then sets sent_at. A worker that dies mid-send leaves the row to be retried
+--    when the lease runs out, so delivery is at-least-once.
+--  - Sent rows are purged after 7 days by the same timer.
+-- Date: 2026-10-19
+
+CREATE TABLE IF NOT EXISTS email_outbox (
+  email_id uuid PRIMARY KEY,
+  from_user text NOT NULL,
+  to_emails text[] NOT NULL,
+  subject text NOT NULL,
+  body_text text NOT NULL,
+  attempts int NOT NULL DEFAULT 0,
+  next_attempt_at timestamptz NOT NULL DEFAULT now(),
+  last_error text,
+  created_at timestamptz NOT NULL DEFAULT now(),
+  sent_at timestamptz
+);
+
+COMMENT ON TABLE email_outbox IS
+'Emails deferred while Microsoft Graph was unavailable. Drained by the email_outbox_drain timer.';
+
+COMMENT ON COLUMN email_outbox.attempts IS
+'Failed send attempts from the drain. Rows stop being retried at EMAIL_OUTBOX_MAX_ATTEMPTS.';
+
+COMMENT ON COLUMN email_outbox.next_attempt_at IS
+'Earliest next send. Pushed forward when a drain claims the row and on each failure (backoff).';
+
+COMMENT ON COLUMN email_outbox.sent_at IS
+'When Graph accepted the email. NULL while pending.';
+
+CREATE INDEX IF NOT EXISTS idx_email_outbox_pending
+ON email_outbox(next_attempt_at)
+WHERE sent_at IS NULL;
+
+COMMENT ON INDEX idx_email_outbox_pending IS
+'Finds emails due for a send attempt.';
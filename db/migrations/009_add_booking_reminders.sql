@@ -0,0 +1,25 @@
+-- Migration: Session reminder emails
+-- Purpose: The send_session_reminders timer (api/reminders.py) emails both participants
+--          before a confirmed session. Each batch is one query on idx_bookings_reminder_due.
+-- Notes:
+--  - reminder_sent_at is set when a run claims the booking (FOR UPDATE SKIP LOCKED), so
+--    overlapping runs never pick the same booking. If Graph is down the email goes to
+--    email_outbox rather than being lost.
+--  - The index only holds confirmed bookings still waiting for their reminder, so it stays
+--    small no matter how much history bookings keeps.
+--  - The index is built CONCURRENTLY, partition by partition (db/migrate.py), so bookings
+--    stays writable while it builds.
+-- Date: 2026-10-19
+
+ALTER TABLE bookings
+ADD COLUMN IF NOT EXISTS reminder_sent_at timestamptz;
+
+COMMENT ON COLUMN bookings.reminder_sent_at IS
+'When the pre-session reminder was claimed for sending. NULL until then.';
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_bookings_reminder_due
+ON bookings(slot_start_time)
+WHERE status = 'confirmed' AND reminder_sent_at IS NULL;
+
+COMMENT ON INDEX idx_bookings_reminder_due IS
+'Confirmed bookings still owed a reminder, by slot start. Used by the send_session_reminders timer.';
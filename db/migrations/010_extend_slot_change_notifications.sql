@@ -0,0 +1,42 @@
+-- Migration: Slot times and previous status in slot change notifications
+-- Purpose: The live availability stream (api/slot_events.py, GET /slots/stream) turns slot
+--          notifications into slot_taken / slot_freed events. It needs the previous status to
+--          tell a booking from a cancellation, and the slot times to filter by the client's
+--          window without a query per event.
+-- Notes:
+--  - Replaces notify_slot_change() only; trg_slots_notify (007) keeps pointing at it.
+--  - Still a small fixed-size payload, well under the 8000 byte pg_notify limit.
+-- Date: 2026-10-19
+
+CREATE OR REPLACE FUNCTION notify_slot_change()
+RETURNS trigger
+LANGUAGE plpgsql
+AS $$
+DECLARE
+  rec mentor_availability_slots%ROWTYPE;
+BEGIN
+  IF TG_OP = 'DELETE' THEN
+    rec := OLD;
+  ELSE
+    rec := NEW;
+  END IF;
+
+  PERFORM pg_notify(
+    'booking_changes',
+    json_build_object(
+      'table', TG_TABLE_NAME,
+      'op', TG_OP,
+      'slot_id', rec.slot_id,
+      'mentor_id', rec.mentor_id,
+      'status', rec.status,
+      'old_status', CASE WHEN TG_OP = 'UPDATE' THEN OLD.status END,
+      'start_time', rec.start_time,
+      'end_time', rec.end_time
+    )::text
+  );
+  RETURN NULL;
+END;
+$$;
+
+COMMENT ON FUNCTION notify_slot_change() IS
+'Publishes availability slot changes on channel booking_changes for per-worker cache invalidation and the live slot stream.';
@@ -0,0 +1,39 @@
+-- Migration: iCalendar feeds of confirmed sessions
+-- Purpose: GET /calendar/feed (api/routes/calendar_feed.py) serves each user's confirmed
+--          bookings as an .ics document that calendar apps subscribe to, instead of
+--          polling GET /bookings.
+-- Notes:
+--  - Calendar apps can't send the Supabase token, so the feed URL carries its own secret.
+--    Only its SHA-256 is stored; POST /calendar/token issues a new one and the old URL
+--    stops working.
+--  - The feed is one query: a BitmapOr over the two partial indexes below (the user may
+--    be the mentor or the student), pruned to recent and upcoming slot partitions.
+--  - Both indexes are built CONCURRENTLY, partition by partition (db/migrate.py), so
+--    bookings stays writable while they build.
+-- Date: 2026-10-19
+
+CREATE TABLE IF NOT EXISTS calendar_feed_tokens (
+  user_id uuid PRIMARY KEY REFERENCES app_users(user_id) ON DELETE CASCADE,
+  token_hash text NOT NULL UNIQUE,
+  created_at timestamptz NOT NULL DEFAULT now()
+);
+
+COMMENT ON TABLE calendar_feed_tokens IS
+'Secret for each user''s calendar feed URL. One active token per user.';
+
+COMMENT ON COLUMN calendar_feed_tokens.token_hash IS
+'Hex SHA-256 of the token in the feed URL. The token itself is only shown when issued.';
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_bookings_mentor_confirmed
+ON bookings(mentor_id, slot_start_time)
+WHERE status = 'confirmed';
+
+COMMENT ON INDEX idx_bookings_mentor_confirmed IS
+'Confirmed bookings per mentor by slot start. Used by the calendar feed.';
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_bookings_student_confirmed
+ON bookings(student_id, slot_start_time)
+WHERE status = 'confirmed';
+
+COMMENT ON INDEX idx_bookings_student_confirmed IS
+'Confirmed bookings per student by slot start. Used by the calendar feed.';
@@ -0,0 +1,184 @@
+-- Migration: Participant snapshots on bookings
+-- Purpose: GET /bookings, confirm, cancel, reminders and the calendar feed read names and
+--          emails from the booking row instead of joining mentors, students and app_users
+--          (twice) per booking.
+-- Notes:
+--  - Filled on insert by trg_bookings_fill_snapshots, so POST /bookings doesn't change.
+--    meeting_url_snapshot is now also filled on insert with the mentor's current link;
+--    confirm still overwrites it with the link at confirmation time, as before.
+--  - Profile edits refresh the snapshots of upcoming requested/confirmed bookings only.
+--    Past and cancelled bookings keep the names and emails they had, the same way
+--    meeting_url_snapshot keeps old links. A confirmed booking keeps the Teams link that
+--    was emailed out.
+--  - The refresh touches bookings rows, so trg_bookings_notify evicts cached lists.
+--  - The backfill runs in batches of 5000, one transaction each (db/migrate.py), so
+--    booking writes only ever wait for one batch.
+-- Date: 2026-10-19
+
+ALTER TABLE bookings
+ADD COLUMN IF NOT EXISTS mentor_name_snapshot text,
+ADD COLUMN IF NOT EXISTS mentor_email_snapshot text,
+ADD COLUMN IF NOT EXISTS student_name_snapshot text,
+ADD COLUMN IF NOT EXISTS student_email_snapshot text;
+
+COMMENT ON COLUMN bookings.mentor_name_snapshot IS
+'Mentor display name, captured on insert and kept current while the booking is upcoming and active.';
+
+COMMENT ON COLUMN bookings.mentor_email_snapshot IS
+'Mentor email, captured on insert and kept current while the booking is upcoming and active.';
+
+COMMENT ON COLUMN bookings.student_name_snapshot IS
+'Student display name, captured on insert and kept current while the booking is upcoming and active.';
+
+COMMENT ON COLUMN bookings.student_email_snapshot IS
+'Student email, captured on insert and kept current while the booking is upcoming and active.';
+
+COMMENT ON COLUMN bookings.meeting_url_snapshot IS
+'Mentor Teams link: current link while requested, then the link at confirmation time. Preserves history if mentor later changes their link.';
+
+
+/* =========================
+   1) Fill on insert
+   ========================= */
+
+CREATE OR REPLACE FUNCTION fill_booking_snapshots()
+RETURNS trigger
+LANGUAGE plpgsql
+AS $$
+BEGIN
+  -- Values given by the caller win; each lookup is a primary key probe
+  NEW.mentor_name_snapshot := COALESCE(
+    NEW.mentor_name_snapshot,
+    (SELECT display_name FROM mentors WHERE mentor_id = NEW.mentor_id)
+  );
+  NEW.meeting_url_snapshot := COALESCE(
+    NEW.meeting_url_snapshot,
+    (SELECT teams_meeting_url FROM mentors WHERE mentor_id = NEW.mentor_id)
+  );
+  NEW.mentor_email_snapshot := COALESCE(
+    NEW.mentor_email_snapshot,
+    (SELECT email FROM app_users WHERE user_id = NEW.mentor_id)
+  );
+  NEW.student_name_snapshot := COALESCE(
+    NEW.student_name_snapshot,
+    (SELECT display_name FROM students WHERE student_id = NEW.student_id)
+  );
+  NEW.student_email_snapshot := COALESCE(
+    NEW.student_email_snapshot,
+    (SELECT email FROM app_users WHERE user_id = NEW.student_id)
+  );
+  RETURN NEW;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS trg_bookings_fill_snapshots ON bookings;
+CREATE TRIGGER trg_bookings_fill_snapshots
+BEFORE INSERT ON bookings
+FOR EACH ROW EXECUTE FUNCTION fill_booking_snapshots();
+
+COMMENT ON FUNCTION fill_booking_snapshots() IS
+'Captures participant names, emails and the mentor Teams link on new bookings.';
+
+
+/* =========================
+   2) Refresh on profile changes
+   ========================= */
+
+CREATE OR REPLACE FUNCTION refresh_booking_snapshots()
+RETURNS trigger
+LANGUAGE plpgsql
+AS $$
+BEGIN
+  -- Upcoming active bookings only (idx_bookings_*_recent, recent partitions)
+  IF TG_TABLE_NAME = 'mentors' THEN
+    UPDATE bookings
+    SET mentor_name_snapshot = NEW.display_name,
+        meeting_url_snapshot = CASE WHEN status = 'requested' THEN NEW.teams_meeting_url ELSE meeting_url_snapshot END
+    WHERE mentor_id = NEW.mentor_id
+      AND status IN ('requested', 'confirmed')
+      AND slot_start_time >= now();
+  ELSIF TG_TABLE_NAME = 'students' THEN
+    UPDATE bookings
+    SET student_name_snapshot = NEW.display_name
+    WHERE student_id = NEW.student_id
+      AND status IN ('requested', 'confirmed')
+      AND slot_start_time >= now();
+  ELSE
+    UPDATE bookings
+    SET mentor_email_snapshot = NEW.email
+    WHERE mentor_id = NEW.user_id
+      AND status IN ('requested', 'confirmed')
+      AND slot_start_time >= now();
+
+    UPDATE bookings
+    SET student_email_snapshot = NEW.email
+    WHERE student_id = NEW.user_id
+      AND status IN ('requested', 'confirmed')
+      AND slot_start_time >= now();
+  END IF;
+  RETURN NULL;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS trg_mentors_refresh_booking_snapshots ON mentors;
+CREATE TRIGGER trg_mentors_refresh_booking_snapshots
+AFTER UPDATE OF display_name, teams_meeting_url ON mentors
+FOR EACH ROW
+WHEN (OLD.display_name IS DISTINCT FROM NEW.display_name
+      OR OLD.teams_meeting_url IS DISTINCT FROM NEW.teams_meeting_url)
+EXECUTE FUNCTION refresh_booking_snapshots();
+
+DROP TRIGGER IF EXISTS trg_students_refresh_booking_snapshots ON students;
+CREATE TRIGGER trg_students_refresh_booking_snapshots
+AFTER UPDATE OF display_name ON students
+FOR EACH ROW
+WHEN (OLD.display_name IS DISTINCT FROM NEW.display_name)
+EXECUTE FUNCTION refresh_booking_snapshots();
+
+DROP TRIGGER IF EXISTS trg_app_users_refresh_booking_snapshots ON app_users;
+CREATE TRIGGER trg_app_users_refresh_booking_snapshots
+AFTER UPDATE OF email ON app_users
+FOR EACH ROW
+WHEN (OLD.email IS DISTINCT FROM NEW.email)
+EXECUTE FUNCTION refresh_booking_snapshots();
+
+COMMENT ON FUNCTION refresh_booking_snapshots() IS
+'Copies profile name/email/Teams link changes onto upcoming requested/confirmed bookings.';
+
+
+/* =========================
+   3) Backfill
+   ========================= */
+
+-- History before this migration isn't known: existing bookings get current profiles.
+-- Only rows with something to copy are picked, so every batch makes progress.
+-- migrate:batch size=5000 pause=0.1
+UPDATE bookings b
+SET mentor_name_snapshot = todo.mentor_name,
+    mentor_email_snapshot = todo.mentor_email,
+    student_name_snapshot = todo.student_name,
+    student_email_snapshot = todo.student_email,
+    meeting_url_snapshot = COALESCE(b.meeting_url_snapshot, todo.teams_meeting_url)
+FROM (
+  SELECT
+    b2.booking_id,
+    b2.slot_start_time,
+    m.display_name AS mentor_name,
+    au_m.email AS mentor_email,
+    st.display_name AS student_name,
+    au_s.email AS student_email,
+    m.teams_meeting_url
+  FROM bookings b2
+  LEFT JOIN mentors m ON m.mentor_id = b2.mentor_id
+  LEFT JOIN app_users au_m ON au_m.user_id = b2.mentor_id
+  LEFT JOIN students st ON st.student_id = b2.student_id
+  LEFT JOIN app_users au_s ON au_s.user_id = b2.student_id
+  WHERE b2.mentor_name_snapshot IS NULL
+    AND b2.mentor_email_snapshot IS NULL
+    AND b2.student_name_snapshot IS NULL
+    AND b2.student_email_snapshot IS NULL
+    AND COALESCE(m.display_name, au_m.email, st.display_name, au_s.email) IS NOT NULL
+  LIMIT :batch_size
+) todo
+WHERE b.booking_id = todo.booking_id
+  AND b.slot_start_time = todo.slot_start_time;
@@ -0,0 +1,117 @@
+-- Migration: DEFAULT partitions for bookings and mentor_availability_slots
+-- Purpose: A slot starting past the last monthly partition failed to insert with
+--          "no partition of relation found for row", and so did its bookings. Those rows now
+--          land in a DEFAULT partition until the month's own partition exists.
+-- Notes:
+--  - ensure_booking_partitions() (run nightly by maintain_booking_partitions()) moves any
+--    default rows of a month into that month's partition as it creates it. Postgres refuses
+--    to create a partition while the default holds rows in its range, so the rows go out
+--    first and back in once the partition exists.
+--  - The move runs with user triggers disabled on both tables: the rows aren't changing,
+--    so slot status, the dashboard summary and the change feed must not react to them.
+--    This takes SHARE ROW EXCLUSIVE on both tables, and only when the default has rows
+--    for a new month.
+--  - archive_booking_partitions() only matches _pYYYY_MM names, so the defaults are never
+--    archived.
+-- Date: 2026-10-19
+
+CREATE TABLE IF NOT EXISTS mentor_availability_slots_default
+PARTITION OF mentor_availability_slots DEFAULT;
+
+CREATE TABLE IF NOT EXISTS bookings_default
+PARTITION OF bookings DEFAULT;
+
+COMMENT ON TABLE mentor_availability_slots_default IS
+'Slots whose month has no partition yet. Moved out by ensure_booking_partitions().';
+
+COMMENT ON TABLE bookings_default IS
+'Bookings of slots whose month has no partition yet. Moved out by ensure_booking_partitions().';
+
+
+CREATE OR REPLACE FUNCTION ensure_booking_partitions(p_from timestamptz, p_to timestamptz)
+RETURNS int
+LANGUAGE plpgsql
+AS $$
+DECLARE
+  m timestamp := date_trunc('month', p_from AT TIME ZONE 'UTC');
+  lower_bound timestamptz;
+  upper_bound timestamptz;
+  suffix text;
+  created int := 0;
+  parked boolean;
+BEGIN
+  WHILE (m AT TIME ZONE 'UTC') < p_to LOOP
+    suffix := to_char(m, '"p"YYYY_MM');
+    lower_bound := m AT TIME ZONE 'UTC';
+    upper_bound := (m + interval '1 month') AT TIME ZONE 'UTC';
+
+    IF to_regclass(format('public.%I', 'mentor_availability_slots_' || suffix)) IS NULL
+       OR to_regclass(format('public.%I', 'bookings_' || suffix)) IS NULL THEN
+
+      -- Take the month's rows out of the defaults; bookings first, they reference the slots
+      parked := EXISTS (
+        SELECT 1 FROM mentor_availability_slots_default
+        WHERE start_time >= lower_bound AND start_time < upper_bound
+      ) OR EXISTS (
+        SELECT 1 FROM bookings_default
+        WHERE slot_start_time >= lower_bound AND slot_start_time < upper_bound
+      );
+
+      IF parked THEN
+        ALTER TABLE bookings DISABLE TRIGGER USER;
+        ALTER TABLE mentor_availability_slots DISABLE TRIGGER USER;
+
+        CREATE TEMP TABLE parked_bookings (LIKE bookings) ON COMMIT DROP;
+        CREATE TEMP TABLE parked_slots (LIKE mentor_availability_slots) ON COMMIT DROP;
+
+        WITH moved AS (
+          DELETE FROM bookings_default
+          WHERE slot_start_time >= lower_bound AND slot_start_time < upper_bound
+          RETURNING *
+        )
+        INSERT INTO parked_bookings SELECT * FROM moved;
+
+        WITH moved AS (
+          DELETE FROM mentor_availability_slots_default
+          WHERE start_time >= lower_bound AND start_time < upper_bound
+          RETURNING *
+        )
+        INSERT INTO parked_slots SELECT * FROM moved;
+      END IF;
+
+      IF to_regclass(format('public.%I', 'mentor_availability_slots_' || suffix)) IS NULL THEN
+        EXECUTE format(
+          'CREATE TABLE public.%I PARTITION OF mentor_availability_slots FOR VALUES FROM (%L) TO (%L)',
+          'mentor_availability_slots_' || suffix, lower_bound, upper_bound
+        );
+        created := created + 1;
+      END IF;
+
+      IF to_regclass(format('public.%I', 'bookings_' || suffix)) IS NULL THEN
+        EXECUTE format(
+          'CREATE TABLE public.%I PARTITION OF bookings FOR VALUES FROM (%L) TO (%L)',
+          'bookings_' || suffix, lower_bound, upper_bound
+        );
+        created := created + 1;
+      END IF;
+
+      IF parked THEN
+        INSERT INTO mentor_availability_slots SELECT * FROM parked_slots;
+        INSERT INTO bookings SELECT * FROM parked_bookings;
+        DROP TABLE parked_bookings;
+        DROP TABLE parked_slots;
+
+        ALTER TABLE mentor_availability_slots ENABLE TRIGGER USER;
+        ALTER TABLE bookings ENABLE TRIGGER USER;
+      END IF;
+    END IF;
+
+    m := m + interval '1 month';
+  END LOOP;
+
+  RETURN created;
+END;
+$$;
+
+COMMENT ON FUNCTION ensure_booking_partitions(timestamptz, timestamptz) IS
+'Creates missing monthly partitions of mentor_availability_slots and bookings covering [p_from, p_to), moving the month''s rows out of the DEFAULT partitions.';
@@ -0,0 +1,124 @@
+-- Migration: Keep mentor_dashboard_summary.free_slots_this_week current on slot writes
+-- Purpose: Only booking transitions adjusted the summary (api/mentor_summary.py), so a mentor
+--          publishing or withdrawing a slot saw a wrong free-slot count until the hourly
+--          refresh, and that refresh could overwrite a booking delta that committed while it
+--          was computing.
+-- Notes:
+--  - trg_slots_sync_summary adjusts free_slots_this_week whenever a slot enters or leaves
+--    'available' inside [now, week_end). Booking holds and releases reach it through
+--    trg_bookings_sync_slot_status, so apply_transition() no longer touches the column;
+--    deploy with that API change (the hourly refresh corrects anything in between).
+--  - Only 'available' slots count, the same rule as GET /availability: withdrawn
+--    ('cancelled') and held ('booked') slots are not free.
+--  - refresh_mentor_dashboard_summary() now locks each mentor's row before counting. A
+--    booking write that got there first commits before the counts are taken, so they see
+--    it; one that comes later waits and applies its delta on top of the refreshed row.
+--    The hourly timer refreshes mentors in batches, one transaction each, so booking writes
+--    only ever wait for one batch.
+-- Date: 2026-10-19
+
+CREATE OR REPLACE FUNCTION sync_summary_free_slots()
+RETURNS trigger
+LANGUAGE plpgsql
+AS $$
+BEGIN
+  IF TG_OP = 'UPDATE'
+     AND OLD.status = NEW.status
+     AND OLD.start_time = NEW.start_time
+     AND OLD.mentor_id = NEW.mentor_id THEN
+    RETURN NULL;
+  END IF;
+
+  IF TG_OP IN ('UPDATE', 'DELETE') AND OLD.status = 'available' AND OLD.start_time >= now() THEN
+    UPDATE mentor_dashboard_summary d
+    SET free_slots_this_week = d.free_slots_this_week - 1,
+        updated_at = now()
+    WHERE d.mentor_id = OLD.mentor_id
+      AND OLD.start_time < d.week_end;
+  END IF;
+
+  IF TG_OP IN ('INSERT', 'UPDATE') AND NEW.status = 'available' AND NEW.start_time >= now() THEN
+    UPDATE mentor_dashboard_summary d
+    SET free_slots_this_week = d.free_slots_this_week + 1,
+        updated_at = now()
+    WHERE d.mentor_id = NEW.mentor_id
+      AND NEW.start_time < d.week_end;
+  END IF;
+
+  RETURN NULL;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS trg_slots_sync_summary ON mentor_availability_slots;
+CREATE TRIGGER trg_slots_sync_summary
+AFTER INSERT OR DELETE OR UPDATE OF status, start_time, mentor_id ON mentor_availability_slots
+FOR EACH ROW EXECUTE FUNCTION sync_summary_free_slots();
+
+
+CREATE OR REPLACE FUNCTION refresh_mentor_dashboard_summary(p_mentor_id uuid DEFAULT NULL)
+RETURNS int
+LANGUAGE plpgsql
+AS $$
+DECLARE
+  m record;
+  v_week_start timestamptz;
+  v_week_end timestamptz;
+  v_term_start timestamptz;
+  refreshed int := 0;
+BEGIN
+  FOR m IN
+    SELECT mentor_id, timezone
+    FROM mentors
+    WHERE p_mentor_id IS NULL OR mentor_id = p_mentor_id
+    ORDER BY mentor_id
+  LOOP
+    v_week_start := date_trunc('week', now() AT TIME ZONE m.timezone) AT TIME ZONE m.timezone;
+    v_week_end := (date_trunc('week', now() AT TIME ZONE m.timezone) + interval '1 week') AT TIME ZONE m.timezone;
+    v_term_start := date_trunc('quarter', now() AT TIME ZONE m.timezone) AT TIME ZONE m.timezone;
+
+    -- Lock the row (creating it first if needed) before counting, so no delta is lost
+    INSERT INTO mentor_dashboard_summary (mentor_id, week_start, week_end, term_start)
+    VALUES (m.mentor_id, v_week_start, v_week_end, v_term_start)
+    ON CONFLICT (mentor_id) DO NOTHING;
+
+    PERFORM 1 FROM mentor_dashboard_summary WHERE mentor_id = m.mentor_id FOR UPDATE;
+
+    -- A new statement, so its snapshot includes whatever committed while we waited
+    UPDATE mentor_dashboard_summary d
+    SET pending_requests = (
+          SELECT count(*) FROM bookings b
+          WHERE b.mentor_id = m.mentor_id AND b.status = 'requested'),
+        upcoming_confirmed = (
+          SELECT count(*) FROM bookings b
+          WHERE b.mentor_id = m.mentor_id AND b.status = 'confirmed' AND b.slot_start_time >= now()),
+        free_slots_this_week = (
+          SELECT count(*) FROM mentor_availability_slots s
+          WHERE s.mentor_id = m.mentor_id
+            AND s.status = 'available'
+            AND s.start_time >= now()
+            AND s.start_time < v_week_end),
+        cancellations_this_term = (
+          SELECT count(*) FROM bookings b
+          WHERE b.mentor_id = m.mentor_id AND b.status = 'cancelled' AND b.cancelled_at >= v_term_start),
+        week_start = v_week_start,
+        week_end = v_week_end,
+        term_start = v_term_start,
+        refreshed_at = now(),
+        updated_at = now()
+    WHERE d.mentor_id = m.mentor_id;
+
+    refreshed := refreshed + 1;
+  END LOOP;
+
+  RETURN refreshed;
+END;
+$$;
+
+COMMENT ON FUNCTION refresh_mentor_dashboard_summary(uuid) IS
+'Recomputes one mentor (or all when NULL) from bookings and slots, locking each summary row first so concurrent booking deltas are not lost.';
+
+COMMENT ON COLUMN mentor_dashboard_summary.free_slots_this_week IS
+'Available slots between now and week_end (same rule as GET /availability). Kept current by trg_slots_sync_summary.';
+
+-- Counters were kept by the old rules until now
+SELECT refresh_mentor_dashboard_summary(NULL);
@@ -0,0 +1,79 @@
+-- Migration: Parent table names in booking and slot change notifications
+-- Purpose: Since 007 the row triggers on bookings and mentor_availability_slots fire on the
+--          partition, so TG_TABLE_NAME is e.g. mentor_availability_slots_p2026_10. The live
+--          slot stream (api/slot_events.py) only takes events whose table is
+--          mentor_availability_slots, so it dropped every one of them.
+-- Notes:
+--  - Both functions now publish the parent table name. A fixed name rather than
+--    pg_partition_root(TG_RELID): each function only ever runs for its own table, and this
+--    costs no catalog lookup per row.
+--  - Replaces notify_booking_change() (005) and notify_slot_change() (010) only; the
+--    triggers from 007 keep pointing at them. Payloads are otherwise unchanged.
+-- Date: 2026-10-19
+
+CREATE OR REPLACE FUNCTION notify_booking_change()
+RETURNS trigger
+LANGUAGE plpgsql
+AS $$
+DECLARE
+  rec bookings%ROWTYPE;
+BEGIN
+  IF TG_OP = 'DELETE' THEN
+    rec := OLD;
+  ELSE
+    rec := NEW;
+  END IF;
+
+  PERFORM pg_notify(
+    'booking_changes',
+    json_build_object(
+      'table', 'bookings',
+      'op', TG_OP,
+      'booking_id', rec.booking_id,
+      'slot_id', rec.slot_id,
+      'mentor_id', rec.mentor_id,
+      'student_id', rec.student_id,
+      'status', rec.status,
+      'old_status', CASE WHEN TG_OP = 'UPDATE' THEN OLD.status END
+    )::text
+  );
+  RETURN NULL;
+END;
+$$;
+
+COMMENT ON FUNCTION notify_booking_change() IS
+'Publishes booking row changes on channel booking_changes for per-worker cache invalidation. Reports table bookings whichever partition the row is in.';
+
+
+CREATE OR REPLACE FUNCTION notify_slot_change()
+RETURNS trigger
+LANGUAGE plpgsql
+AS $$
+DECLARE
+  rec mentor_availability_slots%ROWTYPE;
+BEGIN
+  IF TG_OP = 'DELETE' THEN
+    rec := OLD;
+  ELSE
+    rec := NEW;
+  END IF;
+
+  PERFORM pg_notify(
+    'booking_changes',
+    json_build_object(
+      'table', 'mentor_availability_slots',
+      'op', TG_OP,
+      'slot_id', rec.slot_id,
+      'mentor_id', rec.mentor_id,
+      'status', rec.status,
+      'old_status', CASE WHEN TG_OP = 'UPDATE' THEN OLD.status END,
+      'start_time', rec.start_time,
+      'end_time', rec.end_time
+    )::text
+  );
+  RETURN NULL;
+END;
+$$;
+
+COMMENT ON FUNCTION notify_slot_change() IS
+'Publishes availability slot changes on channel booking_changes for per-worker cache invalidation and the live slot stream. Reports table mentor_availability_slots whichever partition the row is in.';
@@ -0,0 +1,803 @@
+"""
+Check the plans of the API's SQL against a large generated dataset.
+
+Creates a scratch database, applies db/migrations/ with db/migrate.py, fills it with
+generated mentors, students, slots and bookings, ANALYZEs, then runs
+EXPLAIN (FORMAT JSON) on every query in CHECKS and asserts that
+
+  - the expected indexes are used
+  - no big table (bookings, slots, profiles, ...) is read with a Seq Scan
+  - the planner's row estimate and total cost stay within budget
+
+The SQL is read from the *_SQL constants in api/ with ast, so the checks
+always see what the handlers run and need neither the Functions runtime nor
+api/ settings.
+
+    python db/plancheck/run.py --mentors 300 --students 3000 --report plans.json
+
+Uses the same PG* environment variables as loadtest/seed.py. The user needs
+CREATEDB, and superuser to switch triggers off while loading. Exits non-zero
+if any check fails.
+"""
+
+import argparse
+import ast
+import json
+import os
+import re
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+import psycopg
+
+ROOT = Path(__file__).resolve().parents[2]
+
+sys.path.insert(0, str(ROOT / "db"))
+import migrate  # noqa: E402
+
+# Seq Scans on these fail a check unless it lists the table in allow_seq_scan
+BIG_TABLES = (
+    "app_users",
+    "mentors",
+    "students",
+    "mentor_availability_slots",
+    "bookings",
+    "mentor_dashboard_summary",
+    "mentor_assignments",
+    "calendar_feed_tokens",
+    "idempotency_keys",
+    "email_outbox",
+)
+
+# Monthly and DEFAULT partitions (013) are reported as their parent table
+_PARTITION_SUFFIX = re.compile(r"_(p\d{4}_\d{2}|default)$")
+
+
+def connect(dbname: str | None = None, autocommit: bool = False):
+    return psycopg.connect(
+        host=os.environ.get("PGHOST", "localhost"),
+        user=os.environ.get("PGUSER", "postgres"),
+        password=os.environ.get("PGPASSWORD", ""),
+        dbname=dbname or os.environ.get("PGDATABASE", "postgres"),
+        port=int(os.environ.get("PGPORT", 5432)),
+        sslmode=os.environ.get("PGSSLMODE", "disable"),
+        autocommit=autocommit,
+    )
+
+
+def load_sql(relpath: str, name: str) -> str:
+    """Value of the module-level string constant `name` in api/<relpath>."""
+    tree = ast.parse((ROOT / "api" / relpath).read_text(encoding="utf-8"))
+    for node in tree.body:
+        if isinstance(node, ast.Assign) and any(isinstance(t, ast.Name) and t.id == name for t in node.targets):
+            return ast.literal_eval(node.value)
+    raise KeyError(f"{name} not found in api/{relpath}")
+
+
+# =========================
+# Schema + data
+# =========================
+
+def apply_migrations(conn) -> None:
+    # The same runner as production, so CONCURRENTLY and batched steps work here too
+    migrate.up(conn)
+
+
+def seed(conn, mentors: int, students: int, months_back: int, months_ahead: int, slot_every_hours: int,
+         booked_fraction: float) -> None:
+    started = time.monotonic()
+    params = {
+        "mentors": mentors,
+        "students": students,
+        "months_back": months_back,
+        "months_ahead": months_ahead,
+        "slot_every_hours": slot_every_hours,
+        "booked_fraction": booked_fraction,
+    }
+    with conn.transaction():
+        conn.execute(
+            """
+            SELECT ensure_booking_partitions(
+                now() - make_interval(months => %(months_back)s + 1),
+                now() + make_interval(months => %(months_ahead)s + 1)
+            );
+            """,
+            params,
+        )
+
+        # Triggers off (including FK checks and change notifications); slot status and
+        # the dashboard summary are derived in bulk below instead.
+        conn.execute("SET LOCAL session_replication_role = replica;")
+
+        conn.execute(
+            """
+            INSERT INTO app_users (user_id, email, app_role)
+            SELECT gen_random_uuid(), 'mentor' || i || '@plancheck.invalid', 'mentor'
+            FROM generate_series(1, %(mentors)s) i;
+            """,
+            params,
+        )
+        conn.execute(
+            """
+            INSERT INTO app_users (user_id, email, app_role)
+            SELECT gen_random_uuid(), 'student' || i || '@plancheck.invalid', 'mentee'
+            FROM generate_series(1, %(students)s) i;
+            """,
+            params,
+        )
+        conn.execute(
+            """
+            INSERT INTO mentors (mentor_id, display_name, teams_meeting_url)
+            SELECT user_id, 'Plancheck ' || email, 'https://teams.invalid/meet/' || user_id
+            FROM app_users
+            WHERE app_role = 'mentor' AND email LIKE '%@plancheck.invalid';
+
+            INSERT INTO students (student_id, display_name, grade)
+            SELECT user_id, 'Plancheck ' || email, 10
+            FROM app_users
+            WHERE app_role = 'mentee' AND email LIKE '%@plancheck.invalid';
+            """
+        )
+        conn.execute(
+            """
+            INSERT INTO mentor_availability_slots (slot_id, mentor_id, start_time, end_time, status)
+            SELECT gen_random_uuid(), m.mentor_id, t, t + interval '1 hour', 'available'
+            FROM mentors m
+            CROSS JOIN generate_series(
+                date_trunc('hour', now()) - make_interval(months => %(months_back)s),
+                date_trunc('hour', now()) + make_interval(months => %(months_ahead)s),
+                make_interval(hours => %(slot_every_hours)s)
+            ) t;
+            """,
+            params,
+        )
+        # 60% confirmed, 20% requested, 20% cancelled
+        conn.execute(
+            """
+            WITH st AS (
+                SELECT student_id, row_number() OVER (ORDER BY student_id) AS n
+                FROM students
+            ), picked AS (
+                SELECT
+                    s.slot_id,
+                    s.mentor_id,
+                    s.start_time,
+                    random() AS r,
+                    1 + floor(random() * (SELECT count(*) FROM students))::int AS n
+                FROM mentor_availability_slots s
+                WHERE random() < %(booked_fraction)s
+            )
+            INSERT INTO bookings (
+                booking_id, slot_id, slot_start_time, mentor_id, student_id, status,
+                requested_at, confirmed_at, cancelled_at, cancelled_by,
+                meeting_url_snapshot, reminder_sent_at, created_at, updated_at
+            )
+            SELECT
+                gen_random_uuid(),
+                p.slot_id,
+                p.start_time,
+                p.mentor_id,
+                st.student_id,
+                CASE WHEN p.r < 0.6 THEN 'confirmed' WHEN p.r < 0.8 THEN 'requested' ELSE 'cancelled' END,
+                p.start_time - interval '3 days',
+                CASE WHEN p.r < 0.6 THEN p.start_time - interval '2 days' END,
+                CASE WHEN p.r >= 0.8 THEN p.start_time - interval '1 day' END,
+                CASE WHEN p.r >= 0.8 THEN 'student' END,
+                CASE WHEN p.r < 0.6 THEN 'https://teams.invalid/meet/' || p.mentor_id END,
+                CASE WHEN p.r < 0.6 AND p.start_time < now() THEN p.start_time - interval '1 day' END,
+                p.start_time - interval '3 days',
+                p.start_time - interval '3 days'
+            FROM picked p
+            JOIN st USING (n);
+            """,
+            params,
+        )
+        # Each student paired with the mentor of their latest booking; an idempotency
+        # key per booking request; and an outbox entry per confirmation, 1% unsent
+        conn.execute(
+            """
+            INSERT INTO mentor_assignments (mentor_id, student_id)
+            SELECT DISTINCT ON (student_id) mentor_id, student_id
+            FROM bookings
+            ORDER BY student_id, requested_at DESC;
+
+            INSERT INTO idempotency_keys (
+                user_id, route, idempotency_key, request_hash,
+                status_code, response_body, response_mimetype, created_at, expires_at
+            )
+            SELECT
+                student_id, 'bookings.create', booking_id::text, md5(booking_id::text),
+                201, '{}', 'application/json', requested_at, requested_at + interval '1 day'
+            FROM bookings;
+
+            INSERT INTO email_outbox (
+                email_id, from_user, to_emails, subject, body_text, next_attempt_at, created_at, sent_at
+            )
+            SELECT
+                gen_random_uuid(),
+                'info@plancheck.invalid',
+                ARRAY[student_id::text || '@plancheck.invalid'],
+                'Booking confirmed',
+                'Plancheck',
+                confirmed_at,
+                confirmed_at,
+                CASE WHEN random() < 0.99 THEN confirmed_at + interval '1 minute' END
+            FROM bookings
+            WHERE status = 'confirmed';
+            """
+        )
+        conn.execute(
+            """
+            UPDATE mentor_availability_slots s
+            SET status = 'booked'
+            FROM bookings b
+            WHERE b.slot_id = s.slot_id
+              AND b.slot_start_time = s.start_time
+              AND b.status IN ('requested', 'confirmed');
+
+            UPDATE mentor_availability_slots
+            SET status = 'cancelled'
+            WHERE status = 'available' AND random() < 0.03;
+            """
+        )
+        conn.execute("SET LOCAL session_replication_role = origin;")
+        conn.execute("SELECT refresh_mentor_dashboard_summary(NULL);")
+
+    conn.execute("ANALYZE;")
+    counts = conn.execute(
+        "SELECT (SELECT count(*) FROM mentor_availability_slots), (SELECT count(*) FROM bookings);"
+    ).fetchone()
+    print(f"seeded {counts[0]} slots, {counts[1]} bookings ({time.monotonic() - started:.1f}s)")
+
+
+def fixture(conn) -> dict:
+    """Ids the checks plan against: the busiest mentor and student, an open booking, a free slot."""
+    mentor_id = conn.execute(
+        "SELECT mentor_id FROM bookings GROUP BY mentor_id ORDER BY count(*) DESC LIMIT 1;"
+    ).fetchone()[0]
+    student_id = conn.execute(
+        "SELECT student_id FROM bookings GROUP BY student_id ORDER BY count(*) DESC LIMIT 1;"
+    ).fetchone()[0]
+    booking_id, booking_start = conn.execute(
+        """
+        SELECT booking_id, slot_start_time
+        FROM bookings
+        WHERE status = 'requested' AND slot_start_time > now()
+        LIMIT 1;
+        """
+    ).fetchone()
+    slot_id, slot_start = conn.execute(
+        """
+        SELECT slot_id, start_time
+        FROM mentor_availability_slots
+        WHERE mentor_id = %s AND status = 'available' AND start_time > now()
+        LIMIT 1;
+        """,
+        (mentor_id,),
+    ).fetchone()
+    conn.execute(
+        """
+        INSERT INTO calendar_feed_tokens (user_id, token_hash)
+        VALUES (%s, 'plancheck')
+        ON CONFLICT (user_id) DO UPDATE SET token_hash = EXCLUDED.token_hash;
+        """,
+        (student_id,),
+    )
+    conn.commit()
+
+    now = datetime.now(timezone.utc).replace(minute=0, second=0, microsecond=0)
+    return {
+        "mentor_id": mentor_id,
+        "student_id": student_id,
+        "booking_id": booking_id,
+        "booking_start": booking_start,
+        "slot_id": slot_id,
+        "slot_start": slot_start,
+        "from": now,
+        "to": now + timedelta(days=7),
+    }
+
+
+# =========================
+# Checks
+# =========================
+
+def stage_roster(cur, fix: dict) -> None:
+    # A roster re-sending 200 existing students under the busiest mentor, half with
+    # their user_id; the handler's own staging table, analyzed as after the COPY
+    cur.execute(load_sql("routes/roster_import.py", "STAGE_SQL"))
+    cur.execute(
+        """
+        INSERT INTO roster_stage (line, user_id, given_id, email, app_role, display_name, grade, mentor_email)
+        SELECT
+            row_number() OVER (),
+            u.user_id,
+            row_number() OVER () %% 2 = 0,
+            u.email,
+            u.app_role,
+            st.display_name,
+            st.grade,
+            (SELECT email FROM app_users WHERE user_id = %s)
+        FROM students st
+        JOIN app_users u ON u.user_id = st.student_id
+        LIMIT 200;
+        """,
+        (fix["mentor_id"],),
+    )
+    cur.execute("ANALYZE roster_stage;")
+
+
+# sql: (module under api/, constant), format: str.format() args for templated SQL,
+# setup: (cursor, fixture) -> None, run first in the same transaction,
+# params: fixture -> query params, indexes: parent index names that must appear
+# (a tuple: any one of them), allow_seq_scan: BIG_TABLES this query may scan,
+# max_rows / max_cost: budgets for the top plan node (set with headroom at the
+# default scale; tighten from --report).
+CHECKS = [
+    {
+        "name": "availability",
+        "sql": ("routes/availability.py", "SLOTS_SQL"),
+        "params": lambda f: (f["mentor_id"], f["from"], f["to"], f["to"]),
+        "indexes": ["idx_slots_mentor_start_available"],
+        "max_rows": 500,
+        "max_cost": 1000,
+    },
+    {
+        "name": "bookings.create slot lock",
+        "sql": ("routes/bookings.py", "SLOT_LOCK_SQL"),
+        "params": lambda f: (f["slot_id"],),
+        "indexes": ["idx_slots_slot_id"],
+        "max_rows": 50,
+        "max_cost": 2000,
+    },
+    {
+        "name": "bookings.create any free slot",
+        "sql": ("routes/bookings.py", "FREE_SLOT_SQL"),
+        "params": lambda f: (f["mentor_id"], f["from"], f["to"], f["to"]),
+        "indexes": ["idx_slots_mentor_start_available"],
+        "max_rows": 1,
+        "max_cost": 1000,
+    },
+    {
+        "name": "bookings.create insert",
+        "sql": ("routes/bookings.py", "INSERT_SQL"),
+        "params": lambda f: (
+            "00000000-0000-4000-8000-000000000000", f["slot_id"], f["slot_start"], f["mentor_id"], f["student_id"], None
+        ),
+        "indexes": [],
+        "max_rows": 1,
+        "max_cost": 20,
+    },
+    {
+        "name": "mentor_summary.transition",
+        "sql": ("mentor_summary.py", "TRANSITION_SQL"),
+        "params": lambda f: {
+            "pending": 1,
+            "confirmed": 0,
+            "cancelled": 0,
+            "mentor_id": f["mentor_id"],
+            "start": f["slot_start"],
+        },
+        "indexes": ["mentor_dashboard_summary_pkey"],
+        "max_rows": 1,
+        "max_cost": 20,
+    },
+    {
+        "name": "idempotency.forget",
+        "sql": ("idempotency.py", "FORGET_SQL"),
+        "params": lambda f: (f["student_id"], "bookings.create", str(f["booking_id"]), 60),
+        "indexes": ["idempotency_keys_pkey"],
+        "max_rows": 1,
+        "max_cost": 20,
+    },
+    {
+        "name": "idempotency.claim",
+        "sql": ("idempotency.py", "CLAIM_SQL"),
+        "params": lambda f: (f["student_id"], "bookings.create", str(f["booking_id"]), "plancheck", 86400),
+        "indexes": [],
+        "max_rows": 1,
+        "max_cost": 20,
+    },
+    {
+        "name": "idempotency.existing",
+        "sql": ("idempotency.py", "EXISTING_SQL"),
+        "params": lambda f: (f["student_id"], "bookings.create", str(f["booking_id"])),
+        "indexes": ["idempotency_keys_pkey"],
+        "max_rows": 1,
+        "max_cost": 20,
+    },
+    {
+        "name": "idempotency.store",
+        "sql": ("idempotency.py", "STORE_SQL"),
+        "params": lambda f: (201, "{}", "application/json", f["student_id"], "bookings.create", str(f["booking_id"])),
+        "indexes": ["idempotency_keys_pkey"],
+        "max_rows": 1,
+        "max_cost": 20,
+    },
+    {
+        "name": "idempotency.release",
+        "sql": ("idempotency.py", "RELEASE_SQL"),
+        "params": lambda f: (f["student_id"], "bookings.create", str(f["booking_id"])),
+        "indexes": ["idempotency_keys_pkey"],
+        "max_rows": 1,
+        "max_cost": 20,
+    },
+    {
+        "name": "bookings.confirm lock",
+        "sql": ("routes/booking_confirm.py", "BOOKING_LOCK_SQL"),
+        "params": lambda f: (f["booking_id"],),
+        "indexes": ["idx_bookings_booking_id"],
+        "max_rows": 50,
+        "max_cost": 2000,
+    },
+    {
+        "name": "bookings.confirm update",
+        "sql": ("routes/booking_confirm.py", "CONFIRM_SQL"),
+        "params": lambda f: ("https://teams.invalid/meet", f["booking_id"], f["booking_start"]),
+        "indexes": [("bookings_pkey", "idx_bookings_booking_id")],
+        "max_rows": 1,
+        "max_cost": 100,
+    },
+    {
+        "name": "bookings.cancel lock",
+        "sql": ("routes/booking_cancel.py", "BOOKING_LOCK_SQL"),
+        "params": lambda f: (f["booking_id"],),
+        "indexes": ["idx_bookings_booking_id"],
+        "max_rows": 50,
+        "max_cost": 2000,
+    },
+    {
+        "name": "bookings.cancel update",
+        "sql": ("routes/booking_cancel.py", "CANCEL_SQL"),
+        "params": lambda f: ("student", f["booking_id"], f["booking_start"]),
+        "indexes": [("bookings_pkey", "idx_bookings_booking_id")],
+        "max_rows": 1,
+        "max_cost": 100,
+    },
+    {
+        "name": "bookings.list mentor",
+        "sql": ("routes/bookings_list.py", "LIST_SQL"),
+        "format": {"where": "b.mentor_id = %s"},
+        "params": lambda f: (f["mentor_id"], 50),
+        "indexes": ["idx_bookings_mentor_recent"],
+        "max_rows": 50,
+        "max_cost": 50000,
+    },
+    {
+        "name": "bookings.list student",
+        "sql": ("routes/bookings_list.py", "LIST_SQL"),
+        "format": {"where": "b.student_id = %s"},
+        "params": lambda f: (f["student_id"], 50),
+        "indexes": ["idx_bookings_student_recent"],
+        "max_rows": 50,
+        "max_cost": 50000,
+    },
+    {
+        "name": "bookings.list mentor by status",
+        "sql": ("routes/bookings_list.py", "LIST_SQL"),
+        "format": {"where": "b.mentor_id = %s AND b.status = %s"},
+        "params": lambda f: (f["mentor_id"], "requested", 50),
+        "indexes": ["idx_bookings_mentor_recent"],
+        "max_rows": 50,
+        "max_cost": 50000,
+    },
+    {
+        "name": "mentor.dashboard",
+        "sql": ("routes/mentor_dashboard.py", "SUMMARY_SQL"),
+        "params": lambda f: (f["mentor_id"],),
+        "indexes": ["mentor_dashboard_summary_pkey"],
+        "max_rows": 1,
+        "max_cost": 20,
+    },
+    {
+        "name": "calendar.feed",
+        "sql": ("routes/calendar_feed.py", "FEED_SQL"),
+        "params": lambda f: {"user_id": f["student_id"], "past_days": 30},
+        "indexes": ["idx_bookings_mentor_confirmed", "idx_bookings_student_confirmed"],
+        "max_rows": 2000,
+        "max_cost": 50000,
+    },
+    {
+        "name": "calendar.token",
+        "sql": ("routes/calendar_feed.py", "TOKEN_SQL"),
+        "params": lambda f: ("plancheck",),
+        "indexes": ["calendar_feed_tokens_token_hash_key"],
+        "max_rows": 1,
+        "max_cost": 20,
+    },
+    {
+        "name": "profiles.app_user",
+        "sql": ("profiles.py", "APP_USER_SQL"),
+        "params": lambda f: (f["student_id"],),
+        "indexes": ["app_users_pkey"],
+        "max_rows": 1,
+        "max_cost": 20,
+    },
+    {
+        "name": "reminders.claim",
+        "sql": ("reminders.py", "CLAIM_SQL"),
+        "params": lambda f: {"lead_hours": 24, "batch_size": 50},
+        "indexes": ["idx_bookings_reminder_due"],
+        "max_rows": 50,
+        "max_cost": 50000,
+    },
+    {
+        "name": "email_outbox.claim",
+        "sql": ("graph_mailer.py", "OUTBOX_CLAIM_SQL"),
+        "params": lambda f: (300, 12, 20),
+        "indexes": ["idx_email_outbox_pending", "email_outbox_pkey"],
+        "max_rows": 20,
+        "max_cost": 1000,
+    },
+    # Roster imports are set-based: hashing a profile table can beat one lookup per
+    # staged row, so those scans are allowed and the budgets catch the rest
+    {
+        "name": "roster.import reject email taken",
+        "sql": ("routes/roster_import.py", "REJECT_EMAIL_TAKEN_SQL"),
+        "setup": stage_roster,
+        "params": lambda f: None,
+        "allow_seq_scan": ("app_users",),
+        "max_rows": 200,
+        "max_cost": 2000,
+    },
+    {
+        "name": "roster.import resolve",
+        "sql": ("routes/roster_import.py", "RESOLVE_SQL"),
+        "setup": stage_roster,
+        "params": lambda f: None,
+        "allow_seq_scan": ("app_users",),
+        "max_rows": 200,
+        "max_cost": 2000,
+    },
+    {
+        "name": "roster.import reject no user_id",
+        "sql": ("routes/roster_import.py", "REJECT_NO_USER_ID_SQL"),
+        "setup": stage_roster,
+        "params": lambda f: None,
+        "max_rows": 200,
+        "max_cost": 500,
+    },
+    {
+        "name": "roster.import reject duplicate",
+        "sql": ("routes/roster_import.py", "REJECT_DUPLICATE_SQL"),
+        "setup": stage_roster,
+        "params": lambda f: None,
+        "max_rows": 200,
+        "max_cost": 500,
+    },
+    {
+        "name": "roster.import reject role",
+        "sql": ("routes/roster_import.py", "REJECT_ROLE_SQL"),
+        "setup": stage_roster,
+        "params": lambda f: None,
+        "allow_seq_scan": ("app_users",),
+        "max_rows": 200,
+        "max_cost": 2000,
+    },
+    {
+        "name": "roster.import reject unknown mentor",
+        "sql": ("routes/roster_import.py", "REJECT_UNKNOWN_MENTOR_SQL"),
+        "setup": stage_roster,
+        "params": lambda f: None,
+        "allow_seq_scan": ("app_users", "mentors"),
+        "max_rows": 200,
+        "max_cost": 3000,
+    },
+    {
+        "name": "roster.import users update",
+        "sql": ("routes/roster_import.py", "USERS_UPDATE_SQL"),
+        "setup": stage_roster,
+        "params": lambda f: None,
+        "allow_seq_scan": ("app_users",),
+        "max_rows": 200,
+        "max_cost": 2000,
+    },
+    {
+        "name": "roster.import users insert",
+        "sql": ("routes/roster_import.py", "USERS_INSERT_SQL"),
+        "setup": stage_roster,
+        "params": lambda f: None,
+        "max_rows": 200,
+        "max_cost": 500,
+    },
+    {
+        "name": "roster.import mentors update",
+        "sql": ("routes/roster_import.py", "MENTORS_UPDATE_SQL"),
+        "setup": stage_roster,
+        "params": lambda f: None,
+        "allow_seq_scan": ("mentors",),
+        "max_rows": 200,
+        "max_cost": 2000,
+    },
+    {
+        "name": "roster.import mentors insert",
+        "sql": ("routes/roster_import.py", "MENTORS_INSERT_SQL"),
+        "setup": stage_roster,
+        "params": lambda f: {"default_timezone": "Australia/Brisbane"},
+        "max_rows": 200,
+        "max_cost": 500,
+    },
+    {
+        "name": "roster.import students update",
+        "sql": ("routes/roster_import.py", "STUDENTS_UPDATE_SQL"),
+        "setup": stage_roster,
+        "params": lambda f: None,
+        "allow_seq_scan": ("students",),
+        "max_rows": 200,
+        "max_cost": 2000,
+    },
+    {
+        "name": "roster.import students insert",
+        "sql": ("routes/roster_import.py", "STUDENTS_INSERT_SQL"),
+        "setup": stage_roster,
+        "params": lambda f: {"default_timezone": "Australia/Brisbane"},
+        "max_rows": 200,
+        "max_cost": 500,
+    },
+    {
+        "name": "roster.import assignments end",
+        "sql": ("routes/roster_import.py", "ASSIGNMENTS_END_SQL"),
+        "setup": stage_roster,
+        "params": lambda f: None,
+        "indexes": [("uq_one_active_mentor_per_student", "idx_mentor_assignments_student_active")],
+        "allow_seq_scan": ("app_users",),
+        "max_rows": 200,
+        "max_cost": 3000,
+    },
+    {
+        "name": "roster.import assignments start",
+        "sql": ("routes/roster_import.py", "ASSIGNMENTS_START_SQL"),
+        "setup": stage_roster,
+        "params": lambda f: None,
+        "allow_seq_scan": ("app_users",),
+        "max_rows": 200,
+        "max_cost": 3000,
+    },
+]
+
+
+def index_parents(conn) -> dict:
+    # Partition indexes get generated names; report them under the index they were created from
+    rows = conn.execute(
+        """
+        SELECT c.relname, p.relname
+        FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        JOIN pg_class p ON p.oid = i.inhparent
+        WHERE c.relkind = 'i';
+        """
+    ).fetchall()
+    parents = dict(rows)
+    resolved = {}
+    for child in parents:
+        name = child
+        while name in parents:
+            name = parents[name]
+        resolved[child] = name
+    return resolved
+
+
+def walk(node: dict):
+    yield node
+    for child in node.get("Plans", ()):
+        yield from walk(child)
+
+
+def check(conn, spec: dict, fix: dict, parents: dict) -> dict:
+    sql = load_sql(*spec["sql"])
+    if spec.get("format"):
+        sql = sql.format(**spec["format"])
+
+    # Client-side binding: the plan is for these literal values, as the
+    # handlers' custom plans would be
+    with psycopg.ClientCursor(conn) as cur:
+        if spec.get("setup"):
+            spec["setup"](cur, fix)
+        cur.execute("EXPLAIN (FORMAT JSON) " + sql.strip().rstrip(";"), spec["params"](fix))
+        plan = cur.fetchone()[0][0]["Plan"]
+    conn.rollback()
+
+    indexes = set()
+    seq_scans = set()
+    for node in walk(plan):
+        if node.get("Index Name"):
+            indexes.add(parents.get(node["Index Name"], node["Index Name"]))
+        if node.get("Node Type") == "Seq Scan":
+            seq_scans.add(_PARTITION_SUFFIX.sub("", node.get("Relation Name", "")))
+
+    failures = []
+    for expected in spec.get("indexes", ()):
+        # A tuple means any one of these will do
+        options = (expected,) if isinstance(expected, str) else expected
+        if not indexes.intersection(options):
+            failures.append(f"index {' or '.join(options)} not used")
+    for table in sorted(seq_scans):
+        if table in BIG_TABLES and table not in spec.get("allow_seq_scan", ()):
+            failures.append(f"seq scan on {table}")
+    if plan["Plan Rows"] > spec["max_rows"]:
+        failures.append(f"rows {plan['Plan Rows']} > {spec['max_rows']}")
+    if plan["Total Cost"] > spec["max_cost"]:
+        failures.append(f"cost {plan['Total Cost']} > {spec['max_cost']}")
+
+    return {
+        "name": spec["name"],
+        "sql": "api/{}:{}".format(*spec["sql"]),
+        "ok": not failures,
+        "failures": failures,
+        "rows": plan["Plan Rows"],
+        "cost": plan["Total Cost"],
+        "indexes": sorted(indexes),
+        "seq_scans": sorted(seq_scans),
+        "plan": plan,
+    }
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--mentors", type=int, default=300)
+    parser.add_argument("--students", type=int, default=3000)
+    parser.add_argument("--months-back", type=int, default=6)
+    parser.add_argument("--months-ahead", type=int, default=6)
+    parser.add_argument("--slot-every-hours", type=int, default=8)
+    parser.add_argument("--booked-fraction", type=float, default=0.4)
+    parser.add_argument("--dbname", default="plancheck", help="scratch database, dropped and recreated")
+    parser.add_argument("--reuse", action="store_true", help="skip create/migrate/seed and plan against --dbname as is")
+    parser.add_argument("--keep", action="store_true", help="leave the scratch database behind")
+    parser.add_argument("--report", help="write results (with full plans) as JSON here")
+    parser.add_argument("--only", help="comma-separated check names")
+    args = parser.parse_args()
+
+    if not args.reuse:
+        with connect(autocommit=True) as admin:
+            admin.execute(f'DROP DATABASE IF EXISTS "{args.dbname}";')
+            admin.execute(f'CREATE DATABASE "{args.dbname}";')
+
+    results = []
+    try:
+        with connect(args.dbname) as conn:
+            if not args.reuse:
+                conn.autocommit = True
+                apply_migrations(conn)
+                conn.autocommit = False
+                seed(
+                    conn,
+                    args.mentors,
+                    args.students,
+                    args.months_back,
+                    args.months_ahead,
+                    args.slot_every_hours,
+                    args.booked_fraction,
+                )
+            fix = fixture(conn)
+            parents = index_parents(conn)
+
+            only = set(args.only.split(",")) if args.only else None
+            for spec in CHECKS:
+                if only and spec["name"] not in only:
+                    continue
+                result = check(conn, spec, fix, parents)
+                results.append(result)
+                status = "PASS" if result["ok"] else "FAIL"
+                print(
+                    f"{status} {result['name']}: rows={result['rows']} cost={result['cost']} "
+                    f"indexes={','.join(result['indexes']) or '-'}"
+                )
+                for failure in result["failures"]:
+                    print(f"     {failure}")
+    finally:
+        if not args.reuse and not args.keep:
+            with connect(autocommit=True) as admin:
+                admin.execute(f'DROP DATABASE IF EXISTS "{args.dbname}";')
+
+    if args.report:
+        Path(args.report).write_text(json.dumps(results, indent=2, default=str), encoding="utf-8")
+
+    failed = [r["name"] for r in results if not r["ok"]]
+    print(f"{len(results) - len(failed)}/{len(results)} plan checks passed")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
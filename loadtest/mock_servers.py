@@ -0,0 +1,210 @@
+"""
+Local stand-ins for Supabase Auth and Microsoft Graph.
+
+Point the Functions host at these (see loadtest/README.md) so load runs never
+touch the real services. Latency and failures can be injected per service:
+
+    python loadtest/mock_servers.py --auth-latency-ms 50 --graph-latency-ms 300 --graph-error-rate 0.05
+
+Supabase: GET /auth/v1/user accepts tokens of the form "loadtest-<uuid>" and
+returns that uuid as the user id. Any other token gets 401.
+
+Graph: POST /<tenant>/oauth2/v2.0/token returns a fake access token and
+POST /v1.0/users/<from>/sendMail returns 202. GET /stats on either server
+returns request counters and the current behaviour as JSON.
+
+Failure injection can be changed while a run is going, e.g. to watch the API's
+circuit breakers open and close (GET /api/db-ping, "circuits"):
+
+    curl -X POST localhost:54322/_control -d '{"error_rate": 1}'
+    curl -X POST localhost:54321/_control -d '{"latency_ms": 8000}'
+    curl -X POST localhost:54321/_control -d '{"latency_ms": 20, "error_rate": 0}'
+"""
+
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+TOKEN_PREFIX = "loadtest-"
+
+
+class Behaviour:
+    def __init__(self, latency_ms: float, jitter_ms: float, error_rate: float):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.lock = threading.Lock()
+        self.counts = {}
+
+    def count(self, name: str) -> None:
+        with self.lock:
+            self.counts[name] = self.counts.get(name, 0) + 1
+
+    def delay(self) -> None:
+        ms = self.latency_ms + random.uniform(0, self.jitter_ms)
+        if ms > 0:
+            time.sleep(ms / 1000.0)
+
+    def should_fail(self) -> bool:
+        return random.random() < self.error_rate
+
+    def update(self, changes: dict) -> dict:
+        with self.lock:
+            for name in ("latency_ms", "jitter_ms", "error_rate"):
+                if name in changes:
+                    setattr(self, name, float(changes[name]))
+        return self.settings()
+
+    def settings(self) -> dict:
+        return {"latency_ms": self.latency_ms, "jitter_ms": self.jitter_ms, "error_rate": self.error_rate}
+
+
+class _Handler(BaseHTTPRequestHandler):
+    behaviour: Behaviour = None
+
+    def log_message(self, format, *args):
+        # Keep the console readable under load
+        pass
+
+    def _send_json(self, status: int, payload) -> None:
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _read_body(self) -> bytes:
+        length = int(self.headers.get("Content-Length") or 0)
+        return self.rfile.read(length) if length else b""
+
+    def _stats(self) -> bool:
+        if self.path == "/stats":
+            with self.behaviour.lock:
+                counts = dict(self.behaviour.counts)
+            self._send_json(200, {**counts, "behaviour": self.behaviour.settings()})
+            return True
+        return False
+
+    def _control(self) -> bool:
+        if self.path != "/_control":
+            return False
+        try:
+            changes = json.loads(self._read_body() or b"{}")
+            self._send_json(200, self.behaviour.update(changes))
+        except (ValueError, TypeError, AttributeError):
+            self._send_json(400, {"error": "expected JSON with latency_ms, jitter_ms and/or error_rate"})
+        return True
+
+    def do_POST(self):
+        if not self._control():
+            self._send_json(404, {"error": "not found"})
+
+
+class SupabaseHandler(_Handler):
+    def do_GET(self):
+        if self._stats():
+            return
+        if self.path != "/auth/v1/user":
+            self._send_json(404, {"error": "not found"})
+            return
+
+        self.behaviour.delay()
+        if self.behaviour.should_fail():
+            self.behaviour.count("user_failed")
+            self._send_json(503, {"error": "injected failure"})
+            return
+
+        token = (self.headers.get("Authorization") or "").removeprefix("Bearer ").strip()
+        if not token.startswith(TOKEN_PREFIX):
+            self.behaviour.count("user_rejected")
+            self._send_json(401, {"error": "invalid token"})
+            return
+
+        user_id = token[len(TOKEN_PREFIX):]
+        self.behaviour.count("user_ok")
+        self._send_json(
+            200,
+            {"id": user_id, "email": f"{user_id}@loadtest.invalid", "role": "authenticated"},
+        )
+
+
+class GraphHandler(_Handler):
+    def do_GET(self):
+        if not self._stats():
+            self._send_json(404, {"error": "not found"})
+
+    def do_POST(self):
+        if self._control():
+            return
+        self._read_body()
+        self.behaviour.delay()
+
+        if self.path.endswith("/oauth2/v2.0/token"):
+            if self.behaviour.should_fail():
+                self.behaviour.count("token_failed")
+                self._send_json(503, {"error": "injected failure"})
+                return
+            self.behaviour.count("token_ok")
+            self._send_json(200, {"access_token": "loadtest-graph-token", "expires_in": 3599})
+            return
+
+        if self.path.startswith("/v1.0/users/") and self.path.endswith("/sendMail"):
+            if self.behaviour.should_fail():
+                self.behaviour.count("sendmail_failed")
+                self._send_json(503, {"error": "injected failure"})
+                return
+            self.behaviour.count("sendmail_ok")
+            self.send_response(202)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+
+        self._send_json(404, {"error": "not found"})
+
+
+def serve(handler_cls, behaviour: Behaviour, port: int) -> ThreadingHTTPServer:
+    handler = type(handler_cls.__name__, (handler_cls,), {"behaviour": behaviour})
+    server = ThreadingHTTPServer(("127.0.0.1", port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Mock Supabase Auth + Microsoft Graph for load tests")
+    parser.add_argument("--auth-port", type=int, default=54321)
+    parser.add_argument("--graph-port", type=int, default=54322)
+    parser.add_argument("--auth-latency-ms", type=float, default=20)
+    parser.add_argument("--auth-jitter-ms", type=float, default=10)
+    parser.add_argument("--auth-error-rate", type=float, default=0.0)
+    parser.add_argument("--graph-latency-ms", type=float, default=150)
+    parser.add_argument("--graph-jitter-ms", type=float, default=100)
+    parser.add_argument("--graph-error-rate", type=float, default=0.0)
+    args = parser.parse_args()
+
+    serve(
+        SupabaseHandler,
+        Behaviour(args.auth_latency_ms, args.auth_jitter_ms, args.auth_error_rate),
+        args.auth_port,
+    )
+    serve(
+        GraphHandler,
+        Behaviour(args.graph_latency_ms, args.graph_jitter_ms, args.graph_error_rate),
+        args.graph_port,
+    )
+    print(f"Mock Supabase on http://127.0.0.1:{args.auth_port}")
+    print(f"Mock Graph on    http://127.0.0.1:{args.graph_port}")
+
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,374 @@
+"""
+Replay a booking traffic mix against a running Functions host.
+
+Start the mocks and the host first (see loadtest/README.md), seed data with
+loadtest/seed.py, then:
+
+    python loadtest/run.py --stages 5:30,10:30,20:30,40:30 \
+        --mix availability=50,list=25,create=15,confirm=5,cancel=5 --hot-fraction 0.5
+
+Each stage runs the given number of concurrent clients for the given number
+of seconds, which gives one point per stage on the throughput/latency curve.
+Results are written as CSV (per stage/op summary and per-second timeline) and
+the run ends with a double-booking check against the database.
+"""
+
+import argparse
+import csv
+import json
+import os
+import random
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+import uuid
+from collections import defaultdict
+
+from seed import connect
+
+DEFAULT_MIX = "availability=50,list=25,create=15,confirm=5,cancel=5"
+
+
+def parse_mix(raw: str) -> list[tuple[str, float]]:
+    mix = []
+    for part in raw.split(","):
+        name, weight = part.split("=")
+        mix.append((name.strip(), float(weight)))
+    return mix
+
+
+def parse_stages(raw: str) -> list[tuple[int, float]]:
+    stages = []
+    for part in raw.split(","):
+        clients, seconds = part.split(":")
+        stages.append((int(clients), float(seconds)))
+    return stages
+
+
+def percentile(values: list[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+class Traffic:
+    def __init__(self, base_url: str, fixture: dict, hot_fraction: float, idempotency: bool, timeout: float):
+        self.base_url = base_url.rstrip("/")
+        self.fixture = fixture
+        self.hot_fraction = hot_fraction
+        self.idempotency = idempotency
+        self.timeout = timeout
+        self.lock = threading.Lock()
+        self.requested = []  # booking ids waiting for confirm
+        self.active = []  # booking ids that can be cancelled
+        self.created_per_slot = defaultdict(list)
+
+    def _token(self, user_id: str) -> str:
+        return f"{self.fixture['token_prefix']}{user_id}"
+
+    def _call(self, method: str, path: str, user_id: str, body: dict | None = None):
+        data = json.dumps(body).encode("utf-8") if body is not None else None
+        headers = {"X-Supabase-Token": self._token(user_id)}
+        if data is not None:
+            headers["Content-Type"] = "application/json"
+            if self.idempotency:
+                headers["Idempotency-Key"] = str(uuid.uuid4())
+        req = urllib.request.Request(f"{self.base_url}{path}", data=data, method=method, headers=headers)
+        try:
+            with urllib.request.urlopen(req, timeout=self.timeout) as resp:
+                return resp.status, json.loads(resp.read() or b"{}")
+        except urllib.error.HTTPError as e:
+            try:
+                return e.code, json.loads(e.read() or b"{}")
+            except ValueError:
+                return e.code, {}
+
+    def availability(self):
+        mentor = random.choice(self.fixture["mentors"])
+        window = self.fixture["window"]
+        query = urllib.parse.urlencode({"mentor_id": mentor, "from": window["from"], "to": window["to"]})
+        return self._call("GET", f"/availability?{query}", random.choice(self.fixture["students"]))
+
+    def list(self):
+        if random.random() < 0.5:
+            return self._call("GET", "/bookings?role=mentor", random.choice(self.fixture["mentors"]))
+        return self._call("GET", "/bookings?role=student", random.choice(self.fixture["students"]))
+
+    def create(self):
+        if random.random() < self.hot_fraction and self.fixture["hot_slots"]:
+            slot_id = random.choice(self.fixture["hot_slots"])
+        else:
+            mentor = random.choice(self.fixture["mentors"])
+            slot_id = random.choice(self.fixture["slots"][mentor])
+        student = random.choice(self.fixture["students"])
+        status, body = self._call("POST", "/bookings", student, {"slot_id": slot_id, "student_id": student})
+        if status == 201:
+            with self.lock:
+                self.requested.append(body["booking_id"])
+                self.active.append(body["booking_id"])
+                self.created_per_slot[slot_id].append(body["booking_id"])
+        return status, body
+
+    def create_any(self):
+        # "Book any free slot" mode against the hot mentor's whole window
+        student = random.choice(self.fixture["students"])
+        window = self.fixture["window"]
+        status, body = self._call(
+            "POST",
+            "/bookings",
+            student,
+            {"mentor_id": self.fixture["hot_mentor"], "from": window["from"], "to": window["to"], "student_id": student},
+        )
+        if status == 201:
+            with self.lock:
+                self.requested.append(body["booking_id"])
+                self.active.append(body["booking_id"])
+                self.created_per_slot[body["slot_id"]].append(body["booking_id"])
+        return status, body
+
+    def confirm(self):
+        with self.lock:
+            booking_id = self.requested.pop(random.randrange(len(self.requested))) if self.requested else None
+        if not booking_id:
+            return None
+        return self._call("POST", "/bookings/confirm", random.choice(self.fixture["mentors"]), {"booking_id": booking_id})
+
+    def cancel(self):
+        with self.lock:
+            if not self.active:
+                return None
+            booking_id = self.active.pop(random.randrange(len(self.active)))
+            if booking_id in self.requested:
+                self.requested.remove(booking_id)
+        return self._call(
+            "POST",
+            "/bookings/cancel",
+            random.choice(self.fixture["students"]),
+            {"booking_id": booking_id, "cancelled_by": random.choice(("student", "mentor"))},
+        )
+
+
+def run_stage(traffic: Traffic, mix, clients: int, seconds: float, records: list, stage_index: int) -> None:
+    names = [m[0] for m in mix]
+    weights = [m[1] for m in mix]
+    deadline = time.monotonic() + seconds
+    records_lock = threading.Lock()
+
+    def worker():
+        while time.monotonic() < deadline:
+            op = random.choices(names, weights)[0]
+            started = time.monotonic()
+            try:
+                result = getattr(traffic, op)()
+                if result is None:
+                    continue  # nothing to confirm/cancel yet
+                status = result[0]
+            except Exception:
+                status = 0  # connection error / client timeout
+            elapsed_ms = (time.monotonic() - started) * 1000.0
+            with records_lock:
+                records.append((stage_index, clients, op, status, elapsed_ms, time.time()))
+
+    threads = [threading.Thread(target=worker, daemon=True) for _ in range(clients)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+
+def classify(op: str, status: int) -> str:
+    if status == 0 or status >= 500:
+        return "error"
+    if status == 429:
+        return "shed"
+    if op in ("create", "create_any") and status == 409:
+        return "conflict"  # expected when a hot slot is already taken
+    if status >= 400:
+        return "client_error"
+    return "ok"
+
+
+def summarise(records: list, seconds_by_stage: dict) -> list[dict]:
+    grouped = defaultdict(list)
+    for stage, clients, op, status, ms, _ts in records:
+        grouped[(stage, clients, op)].append((status, ms))
+
+    rows = []
+    for (stage, clients, op), results in sorted(grouped.items()):
+        latencies = [ms for _status, ms in results]
+        outcomes = defaultdict(int)
+        for status, _ms in results:
+            outcomes[classify(op, status)] += 1
+        rows.append(
+            {
+                "stage": stage,
+                "clients": clients,
+                "op": op,
+                "requests": len(results),
+                "rps": round(len(results) / seconds_by_stage[stage], 2),
+                "p50_ms": round(percentile(latencies, 50), 1),
+                "p95_ms": round(percentile(latencies, 95), 1),
+                "p99_ms": round(percentile(latencies, 99), 1),
+                "max_ms": round(max(latencies), 1),
+                "ok": outcomes["ok"],
+                "conflict": outcomes["conflict"],
+                "shed": outcomes["shed"],
+                "client_error": outcomes["client_error"],
+                "error": outcomes["error"],
+                "error_rate": round(outcomes["error"] / len(results), 4),
+            }
+        )
+    return rows
+
+
+def timeline(records: list) -> list[dict]:
+    buckets = defaultdict(lambda: {"requests": 0, "errors": 0, "latencies": []})
+    if not records:
+        return []
+    t0 = min(r[5] for r in records)
+    for _stage, clients, op, status, ms, ts in records:
+        b = buckets[(int(ts - t0), clients)]
+        b["requests"] += 1
+        b["errors"] += int(classify(op, status) == "error")
+        b["latencies"].append(ms)
+    return [
+        {
+            "second": second,
+            "clients": clients,
+            "requests": b["requests"],
+            "errors": b["errors"],
+            "p50_ms": round(percentile(b["latencies"], 50), 1),
+            "p95_ms": round(percentile(b["latencies"], 95), 1),
+        }
+        for (second, clients), b in sorted(buckets.items())
+    ]
+
+
+def check_double_bookings(traffic: Traffic) -> dict:
+    """
+    A slot may only ever have one requested/confirmed booking. Checks both the
+    database and the client view (two 201s for the same slot where both
+    bookings are still active), and that every slot's status still matches
+    its bookings.
+    """
+    conn = connect()
+    with conn.cursor() as cur:
+        cur.execute(
+            """
+            SELECT slot_id, count(*)
+            FROM bookings
+            WHERE status IN ('requested', 'confirmed')
+            GROUP BY slot_id
+            HAVING count(*) > 1;
+            """
+        )
+        db_duplicates = [(str(r[0]), r[1]) for r in cur.fetchall()]
+
+        cur.execute(
+            """
+            SELECT count(*)
+            FROM bookings b
+            JOIN mentor_availability_slots s ON s.slot_id = b.slot_id
+            WHERE b.mentor_id <> s.mentor_id;
+            """
+        )
+        mentor_mismatches = cur.fetchone()[0]
+
+        cur.execute("SELECT slot_id FROM slot_status_drift(100);")
+        status_drift = [str(r[0]) for r in cur.fetchall()]
+
+        client_duplicates = []
+        contested = {slot: ids for slot, ids in traffic.created_per_slot.items() if len(ids) > 1}
+        for slot_id, booking_ids in contested.items():
+            cur.execute(
+                """
+                SELECT count(*)
+                FROM bookings
+                WHERE booking_id = ANY(%s::uuid[]) AND status IN ('requested', 'confirmed');
+                """,
+                (booking_ids,),
+            )
+            if cur.fetchone()[0] > 1:
+                client_duplicates.append(slot_id)
+    conn.close()
+
+    return {
+        "db_duplicate_slots": db_duplicates,
+        "client_duplicate_slots": client_duplicates,
+        "mentor_mismatches": mentor_mismatches,
+        "slot_status_drift": status_drift,
+        "hot_slot_successful_creates": {
+            slot: len(traffic.created_per_slot.get(slot, [])) for slot in traffic.fixture["hot_slots"]
+        },
+        "passed": not db_duplicates and not client_duplicates and mentor_mismatches == 0 and not status_drift,
+    }
+
+
+def write_csv(path: str, rows: list[dict]) -> None:
+    if not rows:
+        return
+    with open(path, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=list(rows[0].keys()))
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+def main() -> None:
+    here = os.path.dirname(__file__)
+    parser = argparse.ArgumentParser(description="Booking traffic load generator")
+    parser.add_argument("--base-url", default="http://localhost:7071/api")
+    parser.add_argument("--fixture", default=os.path.join(here, "fixture.json"))
+    parser.add_argument("--stages", default="5:30,10:30,20:30", help="clients:seconds,...")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="op=weight,... (availability,list,create,create_any,confirm,cancel)")
+    parser.add_argument("--hot-fraction", type=float, default=0.5, help="Share of creates aimed at hot slots")
+    parser.add_argument("--idempotency", action="store_true", help="Send an Idempotency-Key on POSTs")
+    parser.add_argument("--timeout", type=float, default=30.0)
+    parser.add_argument("--out", default=os.path.join(here, "results"))
+    parser.add_argument("--skip-db-check", action="store_true")
+    args = parser.parse_args()
+
+    with open(args.fixture) as f:
+        fixture = json.load(f)
+
+    mix = parse_mix(args.mix)
+    stages = parse_stages(args.stages)
+    traffic = Traffic(args.base_url, fixture, args.hot_fraction, args.idempotency, args.timeout)
+
+    records = []
+    seconds_by_stage = {}
+    for index, (clients, seconds) in enumerate(stages):
+        print(f"stage {index}: {clients} clients for {seconds:.0f}s")
+        started = time.monotonic()
+        run_stage(traffic, mix, clients, seconds, records, index)
+        seconds_by_stage[index] = time.monotonic() - started
+
+    os.makedirs(args.out, exist_ok=True)
+    summary = summarise(records, seconds_by_stage)
+    write_csv(os.path.join(args.out, "summary.csv"), summary)
+    write_csv(os.path.join(args.out, "timeline.csv"), timeline(records))
+
+    for row in summary:
+        print(
+            f"stage={row['stage']} clients={row['clients']:>3} {row['op']:<12} "
+            f"rps={row['rps']:>7} p50={row['p50_ms']:>7}ms p95={row['p95_ms']:>7}ms "
+            f"p99={row['p99_ms']:>7}ms errors={row['error_rate']:.2%} conflicts={row['conflict']}"
+        )
+
+    report = {"summary": summary}
+    if not args.skip_db_check:
+        report["double_booking_check"] = check_double_bookings(traffic)
+        print("double-booking check:", "PASSED" if report["double_booking_check"]["passed"] else "FAILED")
+
+    with open(os.path.join(args.out, "report.json"), "w") as f:
+        json.dump(report, f, indent=2)
+
+    if not args.skip_db_check and not report["double_booking_check"]["passed"]:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+"""
+Seed a local Postgres with load-test mentors, students and slots.
+
+Uses the same PG* environment variables as api/db.py. Writes a fixture file
+that loadtest/run.py reads to know which ids and tokens to use. All seeded
+users have emails ending in @loadtest.invalid so --reset can remove them.
+
+    python loadtest/seed.py --mentors 20 --students 500 --slots-per-mentor 40 --hot-slots 3
+"""
+
+import argparse
+import json
+import os
+import uuid
+from datetime import datetime, timedelta, timezone
+
+import psycopg
+
+from mock_servers import TOKEN_PREFIX
+
+EMAIL_DOMAIN = "loadtest.invalid"
+
+
+def connect():
+    return psycopg.connect(
+        host=os.environ.get("PGHOST", "localhost"),
+        user=os.environ.get("PGUSER", "postgres"),
+        password=os.environ.get("PGPASSWORD", ""),
+        dbname=os.environ.get("PGDATABASE", "postgres"),
+        port=int(os.environ.get("PGPORT", 5432)),
+        sslmode=os.environ.get("PGSSLMODE", "disable"),
+    )
+
+
+def reset(conn) -> None:
+    with conn.cursor() as cur:
+        cur.execute(
+            """
+            DELETE FROM bookings
+            WHERE mentor_id IN (SELECT user_id FROM app_users WHERE email LIKE %s);
+            """,
+            (f"%@{EMAIL_DOMAIN}",),
+        )
+        cur.execute(
+            """
+            DELETE FROM mentor_availability_slots
+            WHERE mentor_id IN (SELECT user_id FROM app_users WHERE email LIKE %s);
+            """,
+            (f"%@{EMAIL_DOMAIN}",),
+        )
+        cur.execute("DELETE FROM app_users WHERE email LIKE %s;", (f"%@{EMAIL_DOMAIN}",))
+    conn.commit()
+
+
+def seed(conn, mentors: int, students: int, slots_per_mentor: int, hot_slots: int) -> dict:
+    start = (datetime.now(timezone.utc) + timedelta(days=1)).replace(minute=0, second=0, microsecond=0)
+    mentor_ids = [uuid.uuid4() for _ in range(mentors)]
+    student_ids = [uuid.uuid4() for _ in range(students)]
+    slots = {}
+
+    with conn.cursor() as cur:
+        with cur.copy("COPY app_users (user_id, email, app_role) FROM STDIN") as copy:
+            for m in mentor_ids:
+                copy.write_row((m, f"{m}@{EMAIL_DOMAIN}", "mentor"))
+            for s in student_ids:
+                copy.write_row((s, f"{s}@{EMAIL_DOMAIN}", "mentee"))
+
+        with cur.copy("COPY mentors (mentor_id, display_name, teams_meeting_url) FROM STDIN") as copy:
+            for i, m in enumerate(mentor_ids):
+                copy.write_row((m, f"Load Mentor {i}", f"https://teams.invalid/meet/{m}"))
+
+        with cur.copy("COPY students (student_id, display_name, grade) FROM STDIN") as copy:
+            for i, s in enumerate(student_ids):
+                copy.write_row((s, f"Load Student {i}", 10))
+
+        with cur.copy(
+            "COPY mentor_availability_slots (slot_id, mentor_id, start_time, end_time) FROM STDIN"
+        ) as copy:
+            for m in mentor_ids:
+                slots[str(m)] = []
+                for n in range(slots_per_mentor):
+                    slot_id = uuid.uuid4()
+                    slot_start = start + timedelta(minutes=30 * n)
+                    copy.write_row((slot_id, m, slot_start, slot_start + timedelta(minutes=30)))
+                    slots[str(m)].append(str(slot_id))
+
+    conn.commit()
+
+    hot_mentor = str(mentor_ids[0])
+    return {
+        "token_prefix": TOKEN_PREFIX,
+        "window": {
+            "from": start.isoformat(),
+            "to": (start + timedelta(minutes=30 * slots_per_mentor)).isoformat(),
+        },
+        "mentors": [str(m) for m in mentor_ids],
+        "students": [str(s) for s in student_ids],
+        "slots": slots,
+        "hot_mentor": hot_mentor,
+        "hot_slots": slots[hot_mentor][:hot_slots],
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Seed load-test data into a local Postgres")
+    parser.add_argument("--mentors", type=int, default=20)
+    parser.add_argument("--students", type=int, default=500)
+    parser.add_argument("--slots-per-mentor", type=int, default=40)
+    parser.add_argument("--hot-slots", type=int, default=3)
+    parser.add_argument("--fixture", default=os.path.join(os.path.dirname(__file__), "fixture.json"))
+    parser.add_argument("--reset", action="store_true", help="Delete previous load-test data first")
+    args = parser.parse_args()
+
+    conn = connect()
+    if args.reset:
+        reset(conn)
+    fixture = seed(conn, args.mentors, args.students, args.slots_per_mentor, args.hot_slots)
+    conn.close()
+
+    with open(args.fixture, "w") as f:
+        json.dump(fixture, f, indent=2)
+    print(f"Seeded {args.mentors} mentors, {args.students} students -> {args.fixture}")
+
+
+if __name__ == "__main__":
+    main()